@@ -0,0 +1,53 @@
+"""Generates synthetic cohorts, similar to those that cohort-extractor generates.
+
+A cohort has a `patient_id` column and `width` variables, which cycle through the
+binary, categorical, date, int, and float types. Cohorts are generated and written in
+chunks, so that cohorts that are larger than memory can be written.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+TYPES = ["binary", "categorical", "date", "int", "float"]
+
+CHUNKSIZE = 100_000
+
+
+def get_variable_types(width):
+    """Gets the `variable_types` configuration for a cohort with `width` variables."""
+    return {f"{TYPES[i % len(TYPES)]}_{i}": TYPES[i % len(TYPES)] for i in range(width)}
+
+
+def generate_chunk(variable_types, start, n_rows, rng):
+    """Generates `n_rows` rows of a cohort, starting at patient `start`."""
+    columns = {"patient_id": np.arange(start, start + n_rows)}
+    for name, v_type in variable_types.items():
+        if v_type == "binary":
+            values = rng.integers(0, 2, n_rows)
+        elif v_type == "categorical":
+            values = rng.choice(np.array(["A", "B", "C", "D", "E"]), n_rows)
+        elif v_type == "date":
+            days = rng.integers(0, 3 * 365, n_rows)
+            values = (np.datetime64("2019-01-01") + days).astype(str)
+        elif v_type == "int":
+            values = rng.integers(18, 100, n_rows)
+        else:
+            values = rng.normal(28, 5, n_rows).round(1)
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+def write_cohort(path, n_rows, width, seed=1):
+    """Writes a cohort with `n_rows` rows and `width` variables to a CSV file at
+    `path`, and returns its `variable_types` configuration."""
+    rng = np.random.default_rng(seed)
+    variable_types = get_variable_types(width)
+    for start in range(0, n_rows, CHUNKSIZE):
+        chunk = generate_chunk(
+            variable_types, start, min(CHUNKSIZE, n_rows - start), rng
+        )
+        chunk.to_csv(
+            path, mode="w" if start == 0 else "a", header=start == 0, index=False
+        )
+    return variable_types
@@ -0,0 +1,74 @@
+"""Compares two sets of results from `benchmarks.pipeline`.
+
+For each combination of rows and width that is in both sets, prints the ratio of the
+new time to the old time for each stage, and of the new peak memory to the old peak
+memory. Exits with a non-zero status if any ratio is greater than the threshold.
+
+Run with:
+
+    python -m benchmarks.compare old.json new.json --threshold 1.1
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def compare(old, new, threshold):
+    """Returns a list of (rows, width, measure, old, new, ratio, is_regression)."""
+    old_results = {(r["rows"], r["width"]): r for r in old["results"]}
+    comparisons = []
+    for new_result in new["results"]:
+        key = (new_result["rows"], new_result["width"])
+        if key not in old_results:
+            continue
+        old_result = old_results[key]
+        measures = [(f"{stage}_seconds", stage) for stage in new_result["seconds"]]
+        for measure, stage in measures:
+            old_value = old_result["seconds"].get(stage)
+            new_value = new_result["seconds"][stage]
+            comparisons.append(_compare(key, measure, old_value, new_value, threshold))
+        comparisons.append(
+            _compare(
+                key,
+                "peak_rss_bytes",
+                old_result["peak_rss_bytes"],
+                new_result["peak_rss_bytes"],
+                threshold,
+            )
+        )
+    return comparisons
+
+
+def _compare(key, measure, old_value, new_value, threshold):
+    ratio = new_value / old_value if old_value else None
+    is_regression = ratio is not None and ratio > threshold
+    return (*key, measure, old_value, new_value, ratio, is_regression)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.1)
+    args = parser.parse_args()
+
+    old = json.loads(args.old.read_text())
+    new = json.loads(args.new.read_text())
+    print(f"old: {old['commit']}\nnew: {new['commit']}")
+
+    comparisons = compare(old, new, args.threshold)
+    for rows, width, measure, _, _, ratio, is_regression in comparisons:
+        ratio_str = "n/a" if ratio is None else f"{ratio:.2f}x"
+        flag = " REGRESSION" if is_regression else ""
+        print(
+            f"{rows:>10} rows, {width:>5} variables, {measure:>20}: {ratio_str}{flag}"
+        )
+
+    if any(comparison[-1] for comparison in comparisons):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
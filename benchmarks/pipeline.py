@@ -0,0 +1,123 @@
+"""Benchmarks each stage of the report pipeline across cohort sizes and widths.
+
+For each combination of rows and width, a synthetic cohort is written to a CSV file
+(see `benchmarks.cohorts`) and a report is made for it with `make_report`, in a fresh
+process (see `benchmarks.processes`). The time taken by each stage of the report (load,
+coerce, summarize, group, redact, plot, encode, render, and so on), as recorded by
+`make_report`'s profiler, is recorded, along with the peak resident memory of the
+process. The results are written as JSON, with the current commit, so that they can be
+compared between commits with `benchmarks.compare`.
+
+Run with:
+
+    python -m benchmarks.pipeline --rows 10000 100000 --widths 10 100 \\
+        --output pipeline.json
+
+The largest cohorts (for example, 50,000,000 rows and 1,000 variables) need hundreds of
+gigabytes of disk, and should be run on a dedicated machine.
+"""
+
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+from pathlib import Path
+
+from benchmarks.cohorts import write_cohort
+from benchmarks.processes import run_in_process
+
+
+def run_pipeline(path, variable_types, output_dir):
+    """Makes a report with `make_report`, and returns the wall time taken by each of
+    its stages, as recorded by its profiler."""
+    from cohortreport.report import make_report
+
+    make_report(path, output_dir, variable_types, profile=True)
+    profile = json.loads((Path(output_dir) / f"profile_{path.stem}.json").read_text())
+    return {name: stage["wall_seconds"] for name, stage in profile["stages"].items()}
+
+
+def run(n_rows, width):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "input.csv"
+        variable_types = write_cohort(path, n_rows, width)
+
+        # Generating the cohort shouldn't count towards the peak memory of the pipeline,
+        # so the pipeline runs in its own process
+        output_dir = str(Path(tmp_dir) / "output")
+        seconds, peak_rss = run_in_process(
+            _run_pipeline, path, variable_types, output_dir
+        )
+
+    return {
+        "rows": n_rows,
+        "width": width,
+        "seconds": seconds,
+        "total_seconds": sum(seconds.values()),
+        "peak_rss_bytes": peak_rss,
+    }
+
+
+def _run_pipeline(path, variable_types, output_dir):
+    seconds = run_pipeline(path, variable_types, output_dir)
+    # On Linux, ru_maxrss is in kilobytes
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Numbers of rows (for example, 10000 up to 50000000)",
+    )
+    parser.add_argument(
+        "--widths",
+        type=int,
+        nargs="+",
+        default=[10, 100],
+        help="Numbers of variables (for example, 10 up to 1000)",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for n_rows in args.rows:
+        for width in args.widths:
+            result = run(n_rows, width)
+            results.append(result)
+            print(
+                f"{n_rows:>10} rows, {width:>5} variables: "
+                f"{result['total_seconds']:.2f}s, "
+                f"{result['peak_rss_bytes'] / 1024 / 1024:.0f}MB peak RSS"
+            )
+
+    if args.output is not None:
+        import numpy
+        import pandas
+
+        output = {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "pandas": pandas.__version__,
+            "numpy": numpy.__version__,
+            "results": results,
+        }
+        args.output.write_text(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Runs a benchmark in a fresh process, so that its memory isn't shared with the
+process that started it."""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def run_in_process(fn, *args):
+    """Calls `fn(*args)` in a new, spawned process, and returns its result.
+
+    An error in the process is raised here, as is `BrokenProcessPool` if the process
+    dies; for example, if it is OOM-killed. Either way, the benchmark fails, rather than
+    waiting for a result that will never come.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(fn, *args).result()
@@ -0,0 +1,122 @@
+"""Benchmarks rendering a chart for each variable in a wide report.
+
+Compares drawing through `matplotlib.pyplot`, which creates a figure for each chart and
+never closes it, with `ChartRenderer`, which reuses one figure. For each, records the
+time taken to plot and save each chart, and the resident memory after every 50 charts.
+
+Run with:
+
+    python -m benchmarks.rendering --variables 500 --output rendering.json
+"""
+
+import argparse
+import json
+import resource
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.processes import run_in_process
+
+
+def current_rss():
+    """Returns the current resident memory of this process, in bytes."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize()
+
+
+def make_frequency_tables(n_variables, seed=1):
+    """Makes a frequency table for each variable; alternately a histogram and a bar
+    chart."""
+    rng = np.random.default_rng(seed)
+    tables = []
+    for i in range(n_variables):
+        if i % 2:
+            edges = np.linspace(0, 100, 31)
+            index = pd.IntervalIndex.from_arrays(edges[:-1], edges[1:])
+            tables.append(pd.Series(rng.integers(10, 1000, 30), index, name=f"v{i}"))
+        else:
+            index = [f"group {j}" for j in range(8)]
+            tables.append(pd.Series(rng.integers(10, 1000, 8), index, name=f"v{i}"))
+    return tables
+
+
+def plot_with_pyplot(series):
+    """Plots as cohort-report did before ChartRenderer."""
+    import matplotlib.pyplot as plt
+
+    from cohortreport.processing import _series_with_interval_index_to_histogram
+
+    if isinstance(series.index, pd.IntervalIndex):
+        hist, bin_edges = _series_with_interval_index_to_histogram(series)
+        fig, ax = plt.subplots()
+        ax.hist(x=bin_edges[:-1], bins=bin_edges, weights=hist)
+        ax.set_title(series.name)
+        return fig
+    return series.plot.barh(title=series.name).figure
+
+
+def run(mode, n_variables):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from cohortreport.processing import ChartRenderer, save
+
+    warnings.simplefilter("ignore")  # More than 20 figures have been opened
+    tables = make_frequency_tables(n_variables)
+    renderer = ChartRenderer() if mode == "renderer" else None
+    latencies = []
+    rss = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, table in enumerate(tables):
+            start = time.perf_counter()
+            if renderer is not None:
+                fig = renderer.plot(table)
+            else:
+                fig = plot_with_pyplot(table)
+            save(fig, Path(tmp_dir) / f"{table.name}.png")
+            latencies.append(time.perf_counter() - start)
+            if i % 50 == 0 or i == n_variables - 1:
+                rss.append({"charts": i + 1, "rss_bytes": current_rss()})
+    if renderer is not None:
+        renderer.close()
+
+    return {
+        "mode": mode,
+        "variables": n_variables,
+        "mean_latency_seconds": float(np.mean(latencies)),
+        "median_latency_seconds": float(np.median(latencies)),
+        "total_seconds": float(np.sum(latencies)),
+        "rss": rss,
+        "rss_growth_bytes": rss[-1]["rss_bytes"] - rss[0]["rss_bytes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variables", type=int, default=500)
+    parser.add_argument("--output", type=Path, help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for mode in ["pyplot", "renderer"]:
+        # Each mode runs in its own process, so that memory isn't shared between them
+        results.append(run_in_process(run, mode, args.variables))
+
+    for result in results:
+        print(
+            f"{result['mode']:>8}: "
+            f"{result['mean_latency_seconds'] * 1000:.1f}ms per chart, "
+            f"{result['rss_growth_bytes'] / 1024 / 1024:.1f}MB memory growth"
+        )
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import argparse
 import json
+import os
 import pathlib
 import sys
 
 from cohortreport import __version__
-from cohortreport.report import make_report
+from cohortreport.runner import print_summary, run_reports
 from cohortreport.utils import load_config
 
 
@@ -25,14 +26,19 @@ def parse_args(args):
 def main():
     args = parse_args(sys.argv[1:])
 
+    # Charts are only ever saved to files, so pin matplotlib to its non-interactive
+    # backend rather than letting it search for an interactive one. Worker processes
+    # inherit this.
+    os.environ["MPLBACKEND"] = "Agg"
+
     processed_config = load_config(args.config if args.config is not None else {})
 
-    for input_file in args.input_files:
-        make_report(
-            path=pathlib.Path(input_file),
-            output_dir=processed_config["output_path"],
-            variable_types=processed_config["variable_types"],
-        )
+    paths = [pathlib.Path(input_file) for input_file in args.input_files]
+    results = run_reports(paths, processed_config)
+    print_summary(results)
+
+    if not all(result.succeeded for result in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,373 @@
+"""Accumulators compute the statistics that `summarize` and `group` compute, but they
+consume a column one chunk at a time.
+
+An accumulator holds a table of the number of units for each distinct value in the
+column, plus the number of missing units. Its memory is set by the column's cardinality,
+rather than by the number of units. Consequently, reading a cohort in bounded chunks and
+feeding each chunk to a set of accumulators bounds peak memory by the size of a chunk,
+plus the size of the tables.
+
+The table of a discrete column is bounded by its categories, and that of a date column
+by the number of days that it spans. The table of a continuous column is bounded by
+`MAX_VALUES` distinct values, which is about 16 MB; an accumulator raises
+`TooManyValuesError` if a continuous column has more. Its exact quartiles and histogram
+need every distinct value, so such columns should be accumulated approximately.
+
+An approximate accumulator bounds the memory of a continuous column, too. Once the
+column has more than `MAX_EXACT_VALUES` distinct values, its table is replaced by a
+`ContinuousSketch`, and its quartiles, number of distinct values, and frequency table
+are approximate.
+"""
+
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas import Series
+from pandas.api.types import is_categorical_dtype
+
+from cohortreport.errors import TooManyValuesError
+from cohortreport.processing import (
+    coerce_columns,
+    fold_categories,
+    get_bin_edges,
+    group_dates,
+    infer_category_labels,
+    is_date,
+    is_discrete,
+    summarize_dates,
+    weighted_quantiles,
+)
+from cohortreport.sketches import ContinuousSketch
+
+
+# The number of distinct values of a continuous column above which an approximate
+# accumulator replaces its table with a sketch.
+MAX_EXACT_VALUES = 10_000
+
+# The number of distinct values of a continuous column above which an exact accumulator
+# raises TooManyValuesError.
+MAX_VALUES = 1_000_000
+
+
+class ColumnAccumulator:
+    """Accumulates the values of a column, one chunk at a time.
+
+    Whether the column is discrete or continuous is decided when the statistics are
+    computed, rather than when the chunks are consumed. This is because a numeric
+    column that contains only 0s and 1s is treated as discrete, as it is by
+    `change_binary_to_categorical`, and this is only known once every chunk has been
+    consumed.
+
+    A date column is neither discrete nor continuous: its table has a row for each
+    distinct date, and its statistics are computed by `summarize_dates` and
+    `group_dates`.
+
+    The categories of a categorical column are kept as they were parsed, and are only
+    converted to numbers, if they are all numbers, when the statistics are computed.
+    This is because whether they are all numbers is only known once every chunk has
+    been consumed, too.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._counts = pd.Series(dtype="int64")
+        self._missing = 0
+        self._is_discrete = None
+        self._is_categorical = False
+        self._is_date = False
+
+    def update(self, series: Series) -> None:
+        """Adds the values in `series` to the accumulator."""
+        if self._is_discrete is None:
+            self._is_discrete = is_discrete(series)
+            self._is_categorical = is_categorical_dtype(series)
+            self._is_date = is_date(series)
+        counts = series.value_counts(dropna=True, sort=False)
+        if self._is_categorical:
+            # Categorical value counts include categories with no units
+            counts = counts[counts > 0]
+            counts.index = counts.index.astype(series.cat.categories.dtype)
+        self._counts = _add_counts(self._counts, counts)
+        self._missing += int(series.isna().sum())
+        self._bound_counts()
+
+    def merge(self, other: "ColumnAccumulator") -> None:
+        """Adds the values in another accumulator for the same column."""
+        if self._is_discrete is None:
+            self._is_discrete = other._is_discrete
+            self._is_categorical = other._is_categorical
+            self._is_date = other._is_date
+        self._counts = _add_counts(self._counts, other._counts)
+        self._missing += other._missing
+        self._bound_counts()
+
+    def _has_too_many_values(self, max_values):
+        return (
+            not self._is_discrete
+            and not self._is_date
+            and len(self._counts) > max_values
+        )
+
+    def _bound_counts(self):
+        if self._has_too_many_values(MAX_VALUES):
+            raise TooManyValuesError(
+                f"{self.name} has more than {MAX_VALUES} distinct values, "
+                "which is too many to summarize exactly; summarize it approximately"
+            )
+
+    def memory_usage(self) -> int:
+        """Returns the number of bytes held by the accumulator's table."""
+        return int(self._counts.memory_usage(index=True, deep=True))
+
+    def is_discrete(self) -> bool:
+        if self._is_discrete:
+            return True
+        if self._is_date:
+            return False
+        # Mirrors change_binary_to_categorical
+        values = self._counts.index
+        is_binary = self._missing == 0 and values.isin([0, 1]).all()
+        return bool(is_binary)
+
+    def _categorical_counts(self, dropna):
+        """Returns the counts in the order that `Series.value_counts` would return
+        them, had the column been converted to a categorical."""
+        counts = self._counts
+        if self._is_categorical:
+            labels = infer_category_labels(counts.index, self._missing > 0)
+            counts = counts.set_axis(labels)
+            if not labels.is_unique:
+                # Labels that are the same once converted, such as "1" and "01"
+                counts = counts.groupby(level=0).sum()
+        counts = counts.sort_index()
+        categories = counts.index
+        values = list(categories)
+        data = list(counts.values)
+        if not dropna and self._missing:
+            values.append(np.nan)
+            data.append(self._missing)
+        index = pd.CategoricalIndex(values, categories=categories)
+        return pd.Series(data, index=index, dtype="int64", name=self.name).sort_values(
+            ascending=False
+        )
+
+    def _discrete_counts(self, dropna):
+        if self._is_categorical or not self._is_discrete:
+            return self._categorical_counts(dropna)
+        counts = self._counts
+        if not dropna and self._missing:
+            counts = pd.concat([counts, pd.Series([self._missing], index=[np.nan])])
+        return counts.astype("int64").rename(self.name).sort_values(ascending=False)
+
+    def _sorted_values(self):
+        counts = self._counts.sort_index()
+        return counts.index.to_numpy(dtype=float), counts.to_numpy(dtype="int64")
+
+    def _sorted_dates(self):
+        counts = self._counts.sort_index()
+        values = counts.index.to_numpy(dtype="datetime64[ns]").view("int64")
+        return values, counts.to_numpy(dtype="int64")
+
+    def summarize(self) -> Series:
+        """Computes the statistics that `summarize` would compute for the column."""
+        if self._is_date:
+            return summarize_dates(*self._sorted_dates(), name=self.name)
+        if self.is_discrete():
+            return self._summarize_discrete()
+        return self._summarize_continuous()
+
+    def _summarize_discrete(self):
+        counts = self._discrete_counts(dropna=True)
+        count = int(counts.sum())
+        unique = int((counts != 0).sum())
+        # As with Series.describe, the statistics are objects if there aren't any values
+        if unique > 0:
+            top, freq = counts.index[0], counts.iloc[0]
+            dtype = None
+        else:
+            top, freq = np.nan, np.nan
+            dtype = "object"
+        return pd.Series(
+            [count, unique, top, freq],
+            index=["count", "unique", "top", "freq"],
+            dtype=dtype,
+            name=self.name,
+        )
+
+    def _summarize_continuous(self):
+        values, counts = self._sorted_values()
+        n = counts.sum()
+        if n == 0:
+            stats = [0] + [np.nan] * 7
+        else:
+            mean = (values * counts).sum() / n
+            std = np.sqrt((counts * (values - mean) ** 2).sum() / (n - 1))
+            quartiles = weighted_quantiles(values, counts, [0.25, 0.5, 0.75])
+            stats = [n, mean, std, values[0], *quartiles, values[-1]]
+        return pd.Series(
+            stats,
+            index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"],
+            dtype="float64",
+            name=self.name,
+        )
+
+    def group(
+        self, bins: Union[str, int] = "auto", max_categories: Optional[int] = None
+    ) -> Series:
+        """Computes the frequency table that `group` would compute for the column."""
+        if self._is_date:
+            return group_dates(*self._sorted_dates(), name=self.name)
+        if self.is_discrete():
+            return fold_categories(self._discrete_counts(dropna=False), max_categories)
+        return self._group_continuous(bins)
+
+    def _group_continuous(self, bins):
+        values, counts = self._sorted_values()
+        bin_edges = _get_bin_edges(values, counts, bins)
+        hist, _ = np.histogram(values, bins=bin_edges, weights=counts)
+        idx = pd.IntervalIndex.from_arrays(left=bin_edges[:-1], right=bin_edges[1:])
+        return pd.Series(hist.astype("int64"), index=idx, name=self.name)
+
+
+class ApproximateColumnAccumulator(ColumnAccumulator):
+    """Accumulates the values of a column, one chunk at a time, in bounded memory.
+
+    While a continuous column has at most `max_exact_values` distinct values, the
+    accumulator is exact, as `ColumnAccumulator` is. Once it has more, the table of the
+    number of units for each distinct value is replaced by a `ContinuousSketch`. The
+    statistics that are then approximate are labelled "(approx.)" by `summarize`; the
+    frequency table that `group` computes is approximate, too. Discrete columns are
+    always exact, because their tables are bounded by their categories, as are date
+    columns, because their tables are bounded by the number of days that they span.
+    """
+
+    def __init__(self, name, max_exact_values=MAX_EXACT_VALUES):
+        super().__init__(name)
+        self.max_exact_values = max_exact_values
+        self._sketch = None
+
+    def update(self, series: Series) -> None:
+        if self._sketch is None:
+            super().update(series)
+            return
+        self._sketch.update(series.dropna().to_numpy(dtype=float))
+        self._missing += int(series.isna().sum())
+
+    def merge(self, other: ColumnAccumulator) -> None:
+        other_sketch = getattr(other, "_sketch", None)
+        if self._sketch is None and other_sketch is None:
+            super().merge(other)
+            return
+        if self._sketch is None:
+            self._replace_counts_with_sketch()
+        if other_sketch is None:
+            values, counts = other._sorted_values()
+            self._sketch.update_counts(values, counts)
+        else:
+            self._sketch.merge(other_sketch)
+        self._missing += other._missing
+
+    def _bound_counts(self):
+        if self._has_too_many_values(self.max_exact_values):
+            self._replace_counts_with_sketch()
+
+    def _replace_counts_with_sketch(self):
+        values, counts = self._sorted_values()
+        self._sketch = ContinuousSketch()
+        self._sketch.update_counts(values, counts)
+        self._counts = pd.Series(dtype="int64")
+
+    def memory_usage(self) -> int:
+        if self._sketch is None:
+            return super().memory_usage()
+        return self._sketch.nbytes
+
+    def is_discrete(self) -> bool:
+        if self._sketch is not None:
+            return False
+        return super().is_discrete()
+
+    def _summarize_continuous(self):
+        if self._sketch is None:
+            return super()._summarize_continuous()
+        sketch = self._sketch
+        quartiles = sketch.quantile_sketch.quantiles([0.25, 0.5, 0.75])
+        return pd.Series(
+            [
+                sketch.n,
+                sketch.mean,
+                sketch.std,
+                sketch.min,
+                *quartiles,
+                sketch.max,
+                sketch.distinct_count_sketch.count(),
+            ],
+            index=[
+                "count",
+                "mean",
+                "std",
+                "min",
+                "25% (approx.)",
+                "50% (approx.)",
+                "75% (approx.)",
+                "max",
+                "distinct values (approx.)",
+            ],
+            dtype="float64",
+            name=self.name,
+        )
+
+    def _group_continuous(self, bins):
+        if self._sketch is None:
+            return super()._group_continuous(bins)
+        sketch = self._sketch
+        q25, q75 = sketch.quantile_sketch.quantiles([0.25, 0.75])
+        bin_edges = get_bin_edges(sketch.n, sketch.min, sketch.max, q25, q75, bins)
+        hist = sketch.quantile_sketch.histogram(bin_edges)
+        idx = pd.IntervalIndex.from_arrays(left=bin_edges[:-1], right=bin_edges[1:])
+        return pd.Series(hist, index=idx, name=self.name)
+
+
+def _add_counts(left, right):
+    if left.empty:
+        return right.astype("int64")
+    return left.add(right, fill_value=0).astype("int64")
+
+
+def _get_bin_edges(values, counts, bins):
+    """Computes the bin edges that `get_bin_edges` would compute for the units
+    represented by `values` and `counts`."""
+    n = counts.sum()
+    if n == 0:
+        return get_bin_edges(0, np.nan, np.nan, np.nan, np.nan, bins)
+    q75, q25 = weighted_quantiles(values, counts, [0.75, 0.25])
+    return get_bin_edges(n, values[0], values[-1], q25, q75, bins)
+
+
+def accumulate(
+    chunks: Iterable[pd.DataFrame],
+    variable_types: Optional[Dict[str, str]] = None,
+    approximate: bool = False,
+    accumulators: Optional[Dict[str, ColumnAccumulator]] = None,
+) -> Dict[str, ColumnAccumulator]:
+    """Feeds each chunk of a cohort to a set of accumulators, one per column.
+
+    If `variable_types` is given, then each chunk is coerced with `coerce_columns`
+    before it is consumed. If `approximate` is `True`, then the accumulators are
+    `ApproximateColumnAccumulator`s. If `accumulators` is given, then the chunks are
+    fed to them, and to new accumulators for new columns; for example, to add rows to
+    the accumulators of a previous report.
+    """
+    accumulator_class = (
+        ApproximateColumnAccumulator if approximate else ColumnAccumulator
+    )
+    accumulators = {} if accumulators is None else accumulators
+    for chunk in chunks:
+        if variable_types is not None:
+            chunk = coerce_columns(chunk, variable_types)
+        for name, series in chunk.items():
+            if name not in accumulators:
+                accumulators[name] = accumulator_class(name)
+            accumulators[name].update(series)
+    return accumulators
@@ -0,0 +1,61 @@
+"""A persistent, on-disk cache of the report for each variable.
+
+Each entry is keyed by a content hash, so an entry is only reused if the data it was
+computed from, and everything else that affects it, is unchanged. The version of
+cohort-report is part of every key (see `make_key`), so upgrading cohort-report
+invalidates every entry.
+"""
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pandas as pd
+from pandas import Series
+
+from cohortreport.storage import dump_pickle, evict_least_recently_used
+
+
+class ResultCache:
+    """A directory of cached results, which is kept below `max_size` bytes by evicting
+    the least recently used entries.
+
+    Writes are atomic, so the cache can be shared by several worker processes.
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / f"{key}.pickle"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Gets the entry for `key`, or `None` if there isn't one."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # Record that the entry was used, for least recently used eviction
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Puts an entry for `key`, replacing any existing entry."""
+        dump_pickle(self._path(key), value)
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache is no larger than
+        `max_size` bytes."""
+        evict_least_recently_used(self.directory.glob("*.pickle"), self.max_size)
+
+
+def hash_series(series: Series, index: bool = True) -> str:
+    """Hashes the values, and optionally the index, of `series`."""
+    hashes = pd.util.hash_pandas_object(series, index=index)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
@@ -4,3 +4,7 @@ class ImportActionError(Exception):
 
 class ConfigAndFileMismatchError(Exception):
     pass
+
+
+class TooManyValuesError(Exception):
+    pass
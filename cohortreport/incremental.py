@@ -0,0 +1,108 @@
+"""Saves the accumulators of a report, so that the next report for the same input file
+only reads the rows that have been appended to it since.
+
+The state of an input file is its accumulators, the number of bytes of the file that
+they consumed, and a hash of those bytes. The state is only reused if those bytes are
+unchanged; that is, if rows have only been appended. Because the accumulators hold
+unredacted totals, the frequency tables are computed, and redacted, from the merged
+totals, as they would be had the whole file been read.
+
+The exact quartiles and histogram of a continuous column need every distinct value, so
+an exact accumulator's state holds a table of them, which is bounded by
+`accumulators.MAX_VALUES`. Once it has more distinct values than
+`accumulators.MAX_EXACT_VALUES`, an approximate accumulator's state is a sketch of
+constant size: the count, mean, sum of squared differences from the mean, minimum, and
+maximum, and a quantile sketch from which the histogram is computed.
+"""
+
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from cohortreport.accumulators import ColumnAccumulator
+from cohortreport.storage import dump_pickle, make_path_key
+
+
+# The number of bytes that are hashed at a time.
+BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class CohortState:
+    """The accumulators of an input file, and the bytes of the file that they consumed.
+
+    `key` identifies everything, other than the rows, on which the accumulators depend;
+    for example, the variable types (see `make_key`).
+    """
+
+    key: str
+    offset: int
+    digest: str
+    accumulators: Dict[str, ColumnAccumulator]
+
+
+def hash_file(path: Path, offset: int, size: int) -> Tuple[Optional[str], str]:
+    """Hashes the first `offset` bytes, and the first `size` bytes, of the file at
+    `path`, in one pass.
+
+    The hash of the first `offset` bytes is `None` if `offset` is greater than `size`.
+    """
+    h = hashlib.sha256()
+    prefix_digest = None
+    with open(path, "rb") as f:
+        if offset <= size:
+            _update_hash(h, f, offset)
+            prefix_digest = h.hexdigest()
+            _update_hash(h, f, size - offset)
+        else:
+            _update_hash(h, f, size)
+    return prefix_digest, h.hexdigest()
+
+
+def _update_hash(h, f, n_bytes):
+    while n_bytes > 0:
+        block = f.read(min(BLOCK_SIZE, n_bytes))
+        if not block:
+            break
+        h.update(block)
+        n_bytes -= len(block)
+
+
+def ends_with_newline(path: Path) -> bool:
+    """Checks whether the file at `path` ends with a newline; that is, whether its last
+    row is complete."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _state_path(state_dir, path):
+    return Path(state_dir) / f"{make_path_key(path)}.pickle"
+
+
+def load_state(state_dir: str, path: Path, key: str) -> Optional[CohortState]:
+    """Loads the state of the input file at `path`, or returns `None` if there isn't a
+    state with the given key."""
+    try:
+        with open(_state_path(state_dir, path), "rb") as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+    if not isinstance(state, CohortState) or state.key != key:
+        return None
+    return state
+
+
+def save_state(state_dir: str, path: Path, state: CohortState) -> None:
+    """Saves the state of the input file at `path`, replacing any existing state.
+
+    Writes are atomic, so a report that fails doesn't leave a partial state.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    dump_pickle(_state_path(state_dir, path), state)
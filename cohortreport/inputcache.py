@@ -0,0 +1,112 @@
+"""A persistent, on-disk cache of parsed csv input files.
+
+Parsing a large csv file, especially a compressed one, can take longer than the rest of
+the report. The first report for a csv file parses it with its variable types, and
+writes the typed columns to an Arrow IPC file (see `convert_csv_to_arrow`). Later
+reports with the same variable types memory-map that file rather than parse the csv
+file.
+
+Each entry is keyed by a hash of the csv file's bytes, by the variable types, and by
+the version of cohort-report. The hash is recorded with the csv file's size and
+modification time, so the csv file is only hashed again when either has changed. If its
+bytes have changed, then its previous entries are stale, and are removed.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from cohortreport.incremental import hash_file
+from cohortreport.processing import convert_csv_to_arrow
+from cohortreport.storage import (
+    evict_least_recently_used,
+    make_key,
+    make_path_key,
+    replace_atomically,
+)
+
+
+class InputCache:
+    """A directory of converted csv files, which is kept below `max_size` bytes by
+    evicting the least recently used entries.
+
+    Writes are atomic, so the cache can be shared by several worker processes.
+    """
+
+    def __init__(self, directory: Path, max_size: int):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _entry_prefix(self, digest):
+        # Every entry of a csv file's bytes starts with the same prefix, whatever its
+        # variable types, so that stale entries can be found
+        return make_key(digest)
+
+    def _entry_path(self, digest, variable_types):
+        types_key = make_key(json.dumps(variable_types, sort_keys=True))
+        # The suffixes tell load_study_cohort how to load the entry
+        return self.directory / f"{self._entry_prefix(digest)}-{types_key}.csv.arrow"
+
+    def _record_path(self, path):
+        return self.directory / f"{make_path_key(path)}.json"
+
+    def get(self, path: Path, variable_types: Dict) -> Path:
+        """Returns the path to the entry for the csv file at `path` and the given
+        variable types, converting the csv file if there isn't an entry, or if its
+        entry is stale."""
+        digest = self._get_digest(path)
+        entry_path = self._entry_path(digest, variable_types)
+        if entry_path.exists():
+            # Record that the entry was used, for least recently used eviction
+            os.utime(entry_path)
+            return entry_path
+
+        with replace_atomically(entry_path) as tmp_path:
+            convert_csv_to_arrow(path, tmp_path, variable_types)
+        return entry_path
+
+    def _get_digest(self, path):
+        """Returns the hash of the csv file at `path`, hashing it only if its size or
+        modification time has changed since it was last hashed."""
+        stat = path.stat()
+        record = self._load_record(path)
+        if (
+            record is not None
+            and record["size"] == stat.st_size
+            and record["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return record["digest"]
+
+        _, digest = hash_file(path, 0, stat.st_size)
+        if record is not None and record["digest"] != digest:
+            # The csv file has changed, so its previous entries won't be used again
+            prefix = self._entry_prefix(record["digest"])
+            for entry_path in self.directory.glob(f"{prefix}-*.csv.arrow"):
+                entry_path.unlink(missing_ok=True)
+        record = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest}
+        with replace_atomically(self._record_path(path)) as tmp_path:
+            tmp_path.write_text(json.dumps(record), encoding="utf-8")
+        return digest
+
+    def _load_record(self, path) -> Optional[dict]:
+        try:
+            with open(self._record_path(path), encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(record, dict) or set(record) != {
+            "size",
+            "mtime_ns",
+            "digest",
+        }:
+            return None
+        return record
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        """Removes the least recently used entries, other than `keep`, until the cache
+        is no larger than `max_size` bytes."""
+        evict_least_recently_used(
+            self.directory.glob("*.csv.arrow"), self.max_size, keep
+        )
@@ -0,0 +1,103 @@
+"""Accumulates a cohort that is larger than memory, within a memory budget.
+
+The cohort is read in row partitions. Each partition's chunks are fed to a set of
+accumulators, one per column, until their tables hold more than the memory budget. The
+accumulators are then spilled to a scratch directory, one file per column, and the next
+partition is fed to new accumulators. Finally, each column's spilled accumulators are
+merged, one column at a time, so that only one column's merged table is held in memory.
+
+Because accumulators hold unredacted totals, the merged accumulators give the same
+statistics, and the same redacted frequency tables, as accumulators that consumed every
+chunk.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import pandas as pd
+
+from cohortreport.accumulators import ColumnAccumulator, accumulate
+
+
+def accumulate_out_of_core(
+    chunks: Iterable[pd.DataFrame],
+    memory_budget: int,
+    spill_dir: Optional[str] = None,
+    approximate: bool = False,
+) -> Iterator[Tuple[str, ColumnAccumulator]]:
+    """Feeds each chunk of a cohort to a set of accumulators, spilling them to disk
+    when they hold more than `memory_budget` bytes, and yields the name of each column
+    with its merged accumulator.
+
+    Columns are yielded in the order in which they appear in the cohort. The spilled
+    accumulators are written to a new directory in `spill_dir`, or in the system's
+    temporary directory if `spill_dir` isn't given, which is removed once every column
+    has been yielded, or the generator is closed.
+    """
+    if spill_dir is not None:
+        os.makedirs(spill_dir, exist_ok=True)
+    scratch_dir = Path(tempfile.mkdtemp(prefix="cohortreport-", dir=spill_dir))
+    try:
+        names, n_partitions = _spill_partitions(
+            chunks, memory_budget, scratch_dir, approximate
+        )
+        for i, name in enumerate(names):
+            accumulator = None
+            for partition in range(n_partitions):
+                spilled = _load_spilled(scratch_dir, partition, i)
+                if spilled is None:
+                    continue  # The column wasn't in this partition's chunks
+                if accumulator is None:
+                    accumulator = spilled
+                else:
+                    accumulator.merge(spilled)
+            yield name, accumulator
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def _spill_partitions(chunks, memory_budget, scratch_dir, approximate):
+    """Spills the accumulators of each row partition, and returns the names of the
+    columns and the number of partitions."""
+    names = {}  # Dicts are ordered; the values are unused
+    accumulators = {}
+    n_partitions = 0
+    for chunk in chunks:
+        accumulate([chunk], approximate=approximate, accumulators=accumulators)
+        names.update(dict.fromkeys(accumulators))
+        if _memory_usage(accumulators) > memory_budget:
+            _spill(scratch_dir, n_partitions, list(names), accumulators)
+            accumulators = {}
+            n_partitions += 1
+    if accumulators or n_partitions == 0:
+        _spill(scratch_dir, n_partitions, list(names), accumulators)
+        n_partitions += 1
+    return list(names), n_partitions
+
+
+def _memory_usage(accumulators: Dict[str, ColumnAccumulator]) -> int:
+    return sum(accumulator.memory_usage() for accumulator in accumulators.values())
+
+
+def _spill(scratch_dir, partition, names, accumulators):
+    partition_dir = scratch_dir / str(partition)
+    partition_dir.mkdir()
+    for i, name in enumerate(names):
+        if name not in accumulators:
+            continue
+        with open(partition_dir / f"{i}.pickle", "wb") as f:
+            pickle.dump(accumulators[name], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load_spilled(scratch_dir, partition, i):
+    path = scratch_dir / str(partition) / f"{i}.pickle"
+    if not path.exists():
+        return None
+    with open(path, "rb") as f:
+        accumulator = pickle.load(f)
+    path.unlink()
+    return accumulator
@@ -1,67 +1,786 @@
+import gzip
+import io
+import struct
+import warnings
 from pathlib import Path
-from typing import Dict, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from matplotlib.figure import Figure
+from matplotlib import rc_context
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure, SubplotParams
 from pandas import Series
 from pandas.api.types import (
     is_bool_dtype,
     is_categorical_dtype,
     is_datetime64_any_dtype,
+    is_extension_array_dtype,
+    is_integer_dtype,
     is_interval_dtype,
     is_numeric_dtype,
+    is_object_dtype,
 )
 
 from cohortreport.errors import ImportActionError
+from cohortreport.utils import estimate_memory
 
 
-# Maps from external, user-facing types to internal, Pandas types.
+# Maps from external, user-facing types to internal, Pandas types. Integer columns are
+# downcast to the smallest integer type that can hold their values, after they have
+# been coerced to "int64".
 TYPE_MAPPING = {
-    "binary": "int64",
+    "binary": "int8",
     "categorical": "category",
-    "date": "category",
+    "date": "datetime64[ns]",
     "float": "float64",
     "int": "int64",
 }
 
+# The strings that the csv parser infers to be booleans.
+CSV_TRUE_VALUES = ["True", "TRUE", "true"]
+CSV_FALSE_VALUES = ["False", "FALSE", "false"]
 
-def load_study_cohort(path: Path) -> pd.DataFrame:
+# The label of the group into which fold_categories folds the smaller groups.
+OTHER_CATEGORY = "Other"
+
+# The default thresholds of redact and redact_tables.
+REDACTION_THRESHOLDS = {"less_than": 10, "greater_than_pct": 0.9}
+
+NANOSECONDS_PER_DAY = 24 * 60 * 60 * 10**9
+
+# Date columns are grouped into calendar periods. The frequency of the periods is the
+# first frequency whose maximum range, in days, is at least the range of the column,
+# so that there are at most about 100 periods.
+DATE_FREQUENCIES = [(92, "D"), (2 * 365, "W"), (10 * 365, "M"), (None, "Y")]
+
+# The number of bytes of a loaded string, over and above its characters: a pointer, and
+# the header of a Python string.
+STRING_OVERHEAD = 8 + 49
+
+# The number of rows of a dta file that are parsed at a time, when only some of its
+# columns are loaded.
+STATA_CHUNKSIZE = 100_000
+
+# The number of bytes of a dta file that are read, at first, to read its header. More
+# are read if its header is longer.
+STATA_HEADER_SIZE = 64 * 1024
+
+
+def load_study_cohort(
+    path: Path,
+    variable_types: Optional[Dict] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
     """
     Loads the study cohort (from study_definition.py being run),
     and returns a dataframe. This function allows different
-    file types to be loaded (csv, csv.gz, dta, feather).
+    file types to be loaded (csv, csv.gz, dta, dta.gz, feather, parquet, arrow).
+
+    If `variable_types` is given, then only the given columns are loaded, and they are
+    coerced to the given types as they are loaded (see `coerce_columns`). For csv
+    files, the types are applied by the parser, so each column is materialised once.
+
+    Parquet and Arrow IPC (arrow) files are memory-mapped, and dictionary-encoded
+    columns are loaded as categoricals without being decoded. Csv files that have been
+    converted by `convert_csv_to_arrow` (csv.arrow) are memory-mapped, too, and are
+    loaded as the csv files would have been, with the variable types with which they
+    were converted.
+
+    If `columns` is given, then only those columns are loaded, and those of them that
+    are in `variable_types` are coerced. Feather, parquet, and arrow files are
+    columnar, so the other columns aren't read from disk. Csv files are read in full,
+    but the other columns aren't materialised. Dta files are read into memory in full,
+    and are parsed `STATA_CHUNKSIZE` rows at a time, so the other columns of only one
+    chunk are materialised at a time.
 
     Args:
         path: path to file
+        variable_types: optional mapping of column names to column types
+        columns: optional list of the column names to load
 
     Returns:
         pd.Dataframe: The data loaded into a pandas Dataframe
+
+    Raises:
+        ValueError: A variable's type or name was invalid (see `coerce_columns`).
     """
+    dtypes = None
+    if variable_types is not None:
+        dtypes = _get_dtypes(variable_types)
+    if columns is not None:
+        # Columns with a type of None are loaded as they are
+        dtypes = {name: (dtypes or {}).get(name) for name in columns}
 
     # grabs ext off end of file
     suffixes = path.suffixes
 
     if suffixes == [".csv"]:
-        df = pd.read_csv(path)
+        _check_csv_variable_names(path, dtypes)
+        df = pd.read_csv(path, **_get_csv_kwargs(dtypes))
     elif suffixes == [".csv", ".gz"]:
-        df = pd.read_csv(path, compression="gzip")
+        _check_csv_variable_names(path, dtypes)
+        df = pd.read_csv(path, compression="gzip", **_get_csv_kwargs(dtypes))
     elif suffixes == [".dta"]:
-        df = pd.read_stata(path, preserve_dtypes=False)
+        df = _read_stata(path, dtypes)
     elif suffixes == [".dta", ".gz"]:
-        # Current latest Pandas (v1.2.4) doesn't support reading .dta.gz files.
-        # However, development Pandas does. Rather than write (and test) a function
-        # for unzipping the file before passing it to read_stata, let's raise an error
-        # and wait for development Pandas to be released.
-        raise NotImplementedError()
+        # The reader decompresses the whole file into memory before it parses it
+        df = _read_stata(path, dtypes, compression="gzip")
     elif suffixes == [".feather"]:
-        df = pd.read_feather(path)
+        if dtypes is not None:
+            _check_variable_names(_read_arrow_schema(path).names, dtypes)
+        df = pd.read_feather(path, **_get_columns_kwargs(dtypes))
+    elif suffixes == [".parquet"]:
+        df = _read_parquet(path, dtypes)
+    elif suffixes == [".arrow"]:
+        df = _read_arrow(path, dtypes)
+    elif suffixes == [".csv", ".arrow"]:
+        df = _read_csv_arrow(path, dtypes)
+    else:
+        raise ImportActionError("Unsupported filetype attempted to be imported")
+
+    if dtypes is not None:
+        df = _coerce_loaded_columns(df, dtypes)
+    return df
+
+
+def iter_study_cohort(
+    path: Path,
+    chunksize: int,
+    variable_types: Optional[Dict] = None,
+    offset: int = 0,
+    infer_categories: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """
+    Loads the study cohort in chunks of at most `chunksize` rows, and yields a
+    dataframe for each chunk. Parquet files are read one batch at a time, and Arrow
+    IPC (arrow and feather) files are memory-mapped and sliced, so only the given
+    columns of one chunk are materialised at a time.
+
+    If `variable_types` is given, then only the given columns are loaded, and they are
+    coerced to the given types as they are loaded (see `load_study_cohort`).
+
+    If `offset` is given, then the rows in the first `offset` bytes are skipped; the
+    offset must be the start of a row. Only csv files can be loaded from an offset.
+
+    Whether the categories of a categorical column are numbers depends on every
+    category of the column, and on whether any of its values are missing, and not just
+    on those in one chunk. If `infer_categories`
+    is `False`, then categories are left as they were parsed, so that chunks can be
+    combined, and should be converted with `infer_category_labels` afterwards.
+
+    Args:
+        path: path to file
+        chunksize: the maximum number of rows in each chunk
+        variable_types: optional mapping of column names to column types
+        offset: the number of bytes to skip
+        infer_categories: whether to convert the categories of each chunk to numbers,
+            if they are all numbers
+
+    Returns:
+        Iterator[pd.Dataframe]: The data loaded into a pandas Dataframe, one chunk at
+            a time
+    """
+    suffixes = path.suffixes
+    if offset and suffixes != [".csv"]:
+        raise ImportActionError("Only csv files can be imported from an offset")
+
+    dtypes = None
+    if variable_types is not None:
+        dtypes = _get_dtypes(variable_types)
+
+    if suffixes in ([".csv"], [".csv", ".gz"]):
+        chunks = _iter_csv(path, chunksize, dtypes, offset)
+    elif suffixes == [".dta"]:
+        chunks = _iter_stata(path, chunksize, dtypes)
+    elif suffixes == [".dta", ".gz"]:
+        chunks = _iter_stata(path, chunksize, dtypes, compression="gzip")
+    elif suffixes in ([".feather"], [".arrow"]):
+        chunks = _iter_arrow(path, chunksize, dtypes)
+    elif suffixes == [".parquet"]:
+        chunks = _iter_parquet(path, chunksize, dtypes)
+    elif suffixes == [".csv", ".arrow"]:
+        chunks = _iter_csv_arrow(path, chunksize, dtypes)
+    else:
+        raise ImportActionError(
+            "Unsupported filetype attempted to be imported in chunks"
+        )
+
+    for chunk in chunks:
+        if dtypes is not None:
+            chunk = _coerce_loaded_columns(chunk, dtypes, infer_categories)
+        yield chunk
+
+
+def _iter_csv(path, chunksize, dtypes, offset):
+    _check_csv_variable_names(path, dtypes)
+    if offset:
+        yield from _iter_csv_from_offset(path, chunksize, dtypes, offset)
+        return
+
+    compression = "gzip" if path.suffix == ".gz" else None
+    with pd.read_csv(
+        path, compression=compression, chunksize=chunksize, **_get_csv_kwargs(dtypes)
+    ) as reader:
+        yield from reader
+
+
+def _iter_csv_from_offset(path, chunksize, dtypes, offset):
+    if offset >= path.stat().st_size:
+        return
+    # The rows after the offset don't have a header, so the names are read from it
+    names = _read_csv_column_names(path)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        reader = pd.read_csv(
+            f, header=None, names=names, chunksize=chunksize, **_get_csv_kwargs(dtypes)
+        )
+        with reader:
+            yield from reader
+
+
+def _iter_stata(path, chunksize, dtypes, compression=None):
+    # The reader copies the whole (decompressed) file into memory when it is opened,
+    # so only the parsed chunks, and not the file's bytes, are bounded by chunksize
+    with pd.read_stata(
+        path, preserve_dtypes=False, chunksize=chunksize, compression=compression
+    ) as reader:
+        if dtypes is not None:
+            _check_variable_names(reader.varlist, dtypes)
+        for chunk in reader:
+            if dtypes is not None:
+                # A copy, rather than a view, so that the columns can be coerced
+                chunk = chunk[list(dtypes)].copy()
+            yield chunk
+
+
+def _iter_arrow(path, chunksize, dtypes):
+    import pyarrow
+
+    with pyarrow.ipc.open_file(pyarrow.memory_map(str(path))) as reader:
+        if dtypes is not None:
+            _check_variable_names(reader.schema.names, dtypes)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if dtypes is not None:
+                batch = batch.select(list(dtypes))
+            # Slicing a batch doesn't copy it
+            for start in range(0, batch.num_rows, chunksize):
+                yield _arrow_table_to_pandas(batch.slice(start, chunksize))
+
+
+def _iter_parquet(path, chunksize, dtypes):
+    import pyarrow.parquet
+
+    columns = read_dictionary = None
+    if dtypes is not None:
+        columns, read_dictionary = _get_parquet_columns(path, dtypes)
+    parquet_file = pyarrow.parquet.ParquetFile(
+        path, memory_map=True, read_dictionary=read_dictionary
+    )
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield _arrow_table_to_pandas(batch)
+
+
+def estimate_column_sizes(
+    path: Path, variable_types: Optional[Dict] = None
+) -> Dict[str, int]:
+    """Estimates the number of bytes that each column of the study cohort would take
+    up, once loaded, from the file's schema rather than from its rows.
+
+    The columns are those that `load_study_cohort` would load, in the same order. The
+    estimates are deliberately pessimistic: each string is assumed to be loaded as a
+    Python string, rather than as a category. Csv files don't have a schema, so each
+    column is assumed to take up an equal share of the estimated memory of the file
+    (see `estimate_memory`).
+
+    Args:
+        path: path to file
+        variable_types: optional mapping of column names to column types
+
+    Returns:
+        Dict[str, int]: The estimated number of bytes of each column
+    """
+    dtypes = None
+    if variable_types is not None:
+        dtypes = _get_dtypes(variable_types)
+
+    suffixes = path.suffixes
+    if suffixes in ([".csv"], [".csv", ".gz"]):
+        sizes = _estimate_csv_column_sizes(path)
+    elif suffixes == [".dta"]:
+        sizes = _estimate_stata_column_sizes(path)
+    elif suffixes == [".dta", ".gz"]:
+        sizes = _estimate_stata_column_sizes(path, compression="gzip")
+    elif suffixes in ([".feather"], [".arrow"], [".csv", ".arrow"]):
+        sizes = _estimate_arrow_column_sizes(path)
+    elif suffixes == [".parquet"]:
+        sizes = _estimate_parquet_column_sizes(path)
     else:
         raise ImportActionError("Unsupported filetype attempted to be imported")
+
+    if dtypes is None:
+        return sizes
+    _check_variable_names(sizes, dtypes)
+    if suffixes in ([".csv"], [".csv", ".gz"], [".csv", ".arrow"]):
+        # The parser loads the given columns in the order of the file
+        return {name: size for name, size in sizes.items() if name in dtypes}
+    return {name: sizes[name] for name in dtypes}
+
+
+def _estimate_csv_column_sizes(path):
+    column_names = _read_csv_column_names(path)
+    size = estimate_memory(path) // max(len(column_names), 1)
+    return {name: size for name in column_names}
+
+
+def _estimate_stata_column_sizes(path, compression=None):
+    varlist, typlist, nobs = _read_stata_header(path, compression)
+    sizes = {}
+    # The type of a fixed-width string is its width, and that of a strL is "Q"
+    for name, typ in zip(varlist, typlist):
+        if isinstance(typ, int):
+            item_size = STRING_OVERHEAD + typ
+        elif typ == "Q":
+            # The length of a strL isn't known until it is read
+            item_size = STRING_OVERHEAD + 8
+        else:
+            # Numbers are loaded as 64-bit numbers
+            item_size = 8
+        sizes[name] = nobs * item_size
+    return sizes
+
+
+def _read_stata_header(path, compression=None):
+    """Returns the names and types of the variables of the dta file at `path`, and its
+    number of rows, without reading its rows.
+
+    The reader copies whatever it is given into memory, so it is given the start of the
+    file, which is doubled in size until it holds the whole header.
+    """
+    from pandas.io.stata import StataReader
+
+    open_file = gzip.open if compression == "gzip" else open
+    size = STATA_HEADER_SIZE
+    with open_file(path, "rb") as f:
+        start = f.read(size)
+        while True:
+            try:
+                with StataReader(io.BytesIO(start)) as reader:
+                    return reader.varlist, reader.typlist, reader.nobs
+            except (ValueError, TypeError, struct.error):
+                if len(start) < size:
+                    raise  # The start is the whole file
+            start += f.read(size)
+            size *= 2
+
+
+def _estimate_arrow_column_sizes(path):
+    import pyarrow
+
+    # The table's buffers refer to the memory map, so they aren't read
+    with pyarrow.ipc.open_file(pyarrow.memory_map(str(path))) as reader:
+        table = reader.read_all()
+    return {
+        field.name: column.nbytes
+        + (table.num_rows * STRING_OVERHEAD if _is_string_field(field) else 0)
+        for field, column in zip(table.schema, table.columns)
+    }
+
+
+def _estimate_parquet_column_sizes(path):
+    import pyarrow.parquet
+
+    parquet_file = pyarrow.parquet.ParquetFile(path, memory_map=True)
+    metadata = parquet_file.metadata
+    schema = parquet_file.schema_arrow
+    pandas_metadata = schema.pandas_metadata or {}
+    index_names = {
+        name
+        for name in pandas_metadata.get("index_columns", [])
+        if isinstance(name, str)  # Range indexes are stored as metadata
+    }
+    sizes = {name: 0 for name in schema.names if name not in index_names}
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            if column.path_in_schema in sizes:
+                sizes[column.path_in_schema] += column.total_uncompressed_size
+    for name in sizes:
+        if _is_string_field(schema.field(name)):
+            sizes[name] += metadata.num_rows * STRING_OVERHEAD
+    return sizes
+
+
+def group_columns(sizes: Dict[str, int], memory_budget: int) -> List[List[str]]:
+    """Splits columns into groups of consecutive columns, each of which takes up at
+    most `memory_budget` bytes, so that the groups can be loaded one at a time.
+
+    A column that takes up more than `memory_budget` bytes is a group on its own.
+    Concatenating the groups gives the columns in their original order.
+
+    Args:
+        sizes: the number of bytes of each column (see `estimate_column_sizes`)
+        memory_budget: the maximum number of bytes of each group
+
+    Returns:
+        List[List[str]]: The names of the columns in each group
+    """
+    groups = []
+    group, group_size = [], 0
+    for name, size in sizes.items():
+        if group and group_size + size > memory_budget:
+            groups.append(group)
+            group, group_size = [], 0
+        group.append(name)
+        group_size += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+def convert_csv_to_arrow(
+    path: Path,
+    f_out: Union[Path, str],
+    variable_types: Dict,
+    chunksize: int = 100_000,
+) -> None:
+    """Parses the columns in `variable_types` of the csv file at `path`, and writes them
+    to an Arrow IPC file at `f_out`, with their types, so that they can be
+    memory-mapped rather than parsed again.
+
+    The csv file is parsed `chunksize` rows at a time. Dates are written as timestamps,
+    categoricals as dictionaries, and integers as 64-bit integers, because each chunk
+    might need a different smaller type. Loading the converted file with the same
+    variable types gives the data frame that loading the csv file would have given
+    (see `load_study_cohort`).
+
+    Args:
+        path: path to a csv or csv.gz file
+        f_out: path to the Arrow IPC file to write
+        variable_types: mapping of column names to column types
+        chunksize: the maximum number of rows to parse at a time
+
+    Raises:
+        ValueError: A variable's type or name was invalid (see `coerce_columns`).
+    """
+    import pyarrow
+
+    dtypes = _get_dtypes(variable_types)
+    column_names = _read_csv_column_names(path)
+    _check_variable_names(column_names, dtypes)
+    # The parser loads the given columns in the order of the file
+    schema = pyarrow.schema(
+        [
+            _get_arrow_field(name, dtypes[name])
+            for name in column_names
+            if name in dtypes
+        ]
+    )
+
+    # An Arrow IPC file can't replace a column's dictionary, but it can extend it, so
+    # each chunk's categories follow the categories of the chunks before it
+    categories = {
+        name: pd.Index([], dtype=object)
+        for name, dtype in dtypes.items()
+        if dtype == "category"
+    }
+    options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    compression = "gzip" if path.suffix == ".gz" else None
+    with pyarrow.ipc.new_file(str(f_out), schema, options=options) as writer:
+        with pd.read_csv(
+            path,
+            compression=compression,
+            chunksize=chunksize,
+            **_get_csv_kwargs(dtypes),
+        ) as reader:
+            for chunk in reader:
+                for name, dtype in dtypes.items():
+                    series = chunk[name]
+                    if dtype == "category":
+                        seen = categories[name]
+                        seen = seen.append(series.cat.categories.difference(seen))
+                        chunk[name] = series.cat.set_categories(seen)
+                        categories[name] = seen
+                    elif dtype == "datetime64[ns]":
+                        chunk[name] = _parse_dates(series)
+                writer.write_table(
+                    pyarrow.Table.from_pandas(chunk, schema, preserve_index=False)
+                )
+
+
+def _get_arrow_field(name, dtype):
+    import pyarrow
+
+    if dtype == "category":
+        # The parser gives categories as strings
+        return pyarrow.field(
+            name, pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        )
+    return pyarrow.field(name, pyarrow.from_numpy_dtype(np.dtype(dtype)))
+
+
+def _read_csv_arrow(path, dtypes):
+    import pyarrow
+
+    with pyarrow.ipc.open_file(pyarrow.memory_map(str(path))) as reader:
+        if dtypes is not None:
+            _check_variable_names(reader.schema.names, dtypes)
+        table = reader.read_all()
+    return _csv_arrow_table_to_pandas(table, dtypes)
+
+
+def _iter_csv_arrow(path, chunksize, dtypes):
+    import pyarrow
+
+    with pyarrow.ipc.open_file(pyarrow.memory_map(str(path))) as reader:
+        if dtypes is not None:
+            _check_variable_names(reader.schema.names, dtypes)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for start in range(0, batch.num_rows, chunksize):
+                yield _csv_arrow_table_to_pandas(batch.slice(start, chunksize), dtypes)
+
+
+def _csv_arrow_table_to_pandas(table, dtypes):
+    """Converts a table (or batch) from `convert_csv_to_arrow` to the data frame that
+    the csv parser would have given for `dtypes`, before it is coerced."""
+    if dtypes is not None:
+        # The parser loads the given columns in the order of the file
+        table = table.select([name for name in table.column_names if name in dtypes])
+    df = _arrow_table_to_pandas(table)
+    for name in df.columns:
+        series = df[name]
+        if is_categorical_dtype(series):
+            # The parser sorts the categories of the rows that it parsed, whereas a
+            # dictionary has the categories of the rows before them, too
+            series = series.cat.remove_unused_categories()
+            df[name] = series.cat.reorder_categories(
+                series.cat.categories.sort_values()
+            )
+    return df
+
+
+def _check_csv_variable_names(path, dtypes):
+    """Checks the variable names against the header of the csv file at `path`, without
+    reading the rows."""
+    if dtypes is None:
+        return
+    _check_variable_names(_read_csv_column_names(path), dtypes)
+
+
+def _read_csv_column_names(path):
+    """Reads the column names from the header of the csv file at `path`, without
+    reading the rows."""
+    compression = "gzip" if path.suffix == ".gz" else None
+    return pd.read_csv(path, compression=compression, nrows=0).columns
+
+
+def _read_stata(path, dtypes, compression=None):
+    # Either way, the reader copies the whole (decompressed) file into memory, so
+    # loading a dta file needs memory for its bytes as well as for the data frame
+    if dtypes is None:
+        return pd.read_stata(path, preserve_dtypes=False, compression=compression)
+    # The reader materialises every column of the rows that it reads, even if it is
+    # given columns, so it reads a chunk of rows at a time, and the given columns of
+    # each chunk are kept. The reader reads the header when it is opened, so the
+    # variable names can be checked before the rows are read.
+    with pd.read_stata(
+        path,
+        preserve_dtypes=False,
+        chunksize=STATA_CHUNKSIZE,
+        compression=compression,
+    ) as reader:
+        _check_variable_names(reader.varlist, dtypes)
+        if reader.nobs == 0:
+            return reader.read(columns=list(dtypes))
+        chunks = [chunk[list(dtypes)] for chunk in reader]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _read_arrow_schema(path):
+    import pyarrow
+
+    with pyarrow.ipc.open_file(pyarrow.memory_map(str(path))) as reader:
+        return reader.schema
+
+
+def _read_parquet(path, dtypes):
+    import pyarrow.parquet
+
+    columns = read_dictionary = None
+    if dtypes is not None:
+        columns, read_dictionary = _get_parquet_columns(path, dtypes)
+    table = pyarrow.parquet.read_table(
+        path, columns=columns, memory_map=True, read_dictionary=read_dictionary
+    )
+    return _arrow_table_to_pandas(table)
+
+
+def _get_parquet_columns(path, dtypes):
+    """Returns the columns to read from the Parquet file at `path`, and those of them
+    to read as dictionaries."""
+    import pyarrow.parquet
+
+    schema = pyarrow.parquet.read_schema(path, memory_map=True)
+    _check_variable_names(schema.names, dtypes)
+    # String columns are usually dictionary-encoded in Parquet files; reading them
+    # as dictionaries means they become categoricals without being decoded
+    read_dictionary = [
+        name
+        for name, dtype in dtypes.items()
+        if dtype in ("category", "datetime64[ns]")
+        and _is_string_field(schema.field(name))
+    ]
+    return list(dtypes), read_dictionary
+
+
+def _read_arrow(path, dtypes):
+    import pyarrow
+
+    # The table's buffers refer to the memory map, so they aren't copied until they are
+    # converted to pandas. The memory map is closed when they are released.
+    with pyarrow.ipc.open_file(pyarrow.memory_map(str(path))) as reader:
+        if dtypes is not None:
+            _check_variable_names(reader.schema.names, dtypes)
+        table = reader.read_all()
+    if dtypes is not None:
+        table = table.select(list(dtypes))
+    return _arrow_table_to_pandas(table)
+
+
+def _is_string_field(field):
+    import pyarrow
+
+    return pyarrow.types.is_string(field.type) or pyarrow.types.is_large_string(
+        field.type
+    )
+
+
+def _arrow_table_to_pandas(table):
+    # Dictionary-encoded columns become categoricals. Splitting blocks avoids
+    # consolidating the columns into one 2-D array, which would copy them.
+    return table.to_pandas(split_blocks=True)
+
+
+def _check_variable_names(column_names, dtypes):
+    if not set(dtypes).issubset(column_names):
+        raise ValueError("Invalid variable name")
+
+
+def _get_csv_kwargs(dtypes):
+    if dtypes is None:
+        return {}
+    # Date columns are parsed as categoricals, and then converted by
+    # _coerce_loaded_columns, so that each distinct date is only parsed once
+    parser_dtypes = {
+        name: "category" if dtype == "datetime64[ns]" else dtype
+        for name, dtype in dtypes.items()
+        if dtype is not None
+    }
+    return {"usecols": list(dtypes), "dtype": parser_dtypes}
+
+
+def _get_columns_kwargs(dtypes):
+    if dtypes is None:
+        return {}
+    return {"columns": list(dtypes)}
+
+
+def _coerce_loaded_columns(df, dtypes, infer_categories=True):
+    """Coerces the columns of a loaded data frame, one column at a time, so that
+    columns that already have the given type are not copied."""
+    for name, dtype in dtypes.items():
+        series = df[name]
+        if dtype is None:
+            continue
+        if is_categorical_dtype(series) and dtype == "category":
+            if infer_categories:
+                df[name] = _infer_category_types(series)
+        elif dtype == "datetime64[ns]":
+            df[name] = _parse_dates(series)
+        elif dtype == "int64":
+            df[name] = _downcast_integer(series)
+        elif series.dtype != dtype:
+            df[name] = series.astype(dtype)
     return df
 
 
+def _downcast_integer(series):
+    """Coerces `series` to the smallest integer type that can hold its values."""
+    if not is_integer_dtype(series):
+        # Raises if the values can't be coerced, as coerce_columns would
+        series = series.astype("int64")
+    return pd.to_numeric(series, downcast="integer")
+
+
+def _parse_dates(series):
+    """Converts `series` to datetime64.
+
+    If `series` is a categorical, or can be converted to one, then its categories are
+    parsed and its codes are used to look up its units, so each distinct date is only
+    parsed once. Missing units become NaT, as do units that can't be parsed, or that
+    are out of range (such as 9999-12-31), so that they are counted as missing.
+    """
+    if is_datetime64_any_dtype(series):
+        return series
+    if not is_categorical_dtype(series):
+        series = series.astype("category")
+    categories = pd.DatetimeIndex(
+        pd.to_datetime(series.cat.categories, errors="coerce")
+    )
+    codes = series.cat.codes.to_numpy()
+    dates = categories.take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(dates, index=series.index, name=series.name)
+
+
+def _infer_category_types(series):
+    """Converts the categories of `series` from strings to the type that the csv parser
+    would have inferred for them (see `infer_category_labels`).
+
+    The CSV parser gives categories as strings. Had the column been parsed to an
+    inferred type and then coerced, then, for example, numeric values would have had
+    numeric categories. Only the categories, and not the units, are converted.
+    Categories that are the same once converted, such as "1" and "01", are merged.
+    """
+    categories = series.cat.categories
+    labels = infer_category_labels(categories, series.hasnans)
+    if labels is categories:
+        return series
+    unique_labels = labels.unique().sort_values()
+    indexer = unique_labels.get_indexer(labels)
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes == -1, -1, indexer.take(codes))
+    categorical = pd.Categorical.from_codes(codes, categories=unique_labels)
+    return pd.Series(categorical, index=series.index, name=series.name)
+
+
+def infer_category_labels(labels: pd.Index, has_missing: bool = False) -> pd.Index:
+    """Converts `labels` from strings to the type that the csv parser would have
+    inferred for a column of them: to booleans, if they are all `CSV_TRUE_VALUES` or
+    `CSV_FALSE_VALUES`, or to numbers, if they are all numbers. Integers are converted
+    to floats if the column has missing values (`has_missing`), as the parser can't
+    hold missing values in an integer column. Otherwise, returns `labels`, as it does if
+    there aren't any labels.
+
+    Labels that are distinct strings might be the same once converted, such as "1" and
+    "01".
+    """
+    if not is_object_dtype(labels) or labels.empty:
+        return labels
+    if labels.isin(CSV_TRUE_VALUES + CSV_FALSE_VALUES).all():
+        return pd.Index(labels.isin(CSV_TRUE_VALUES), dtype=bool)
+    try:
+        numeric_labels = pd.to_numeric(labels)
+    except (ValueError, TypeError):
+        return labels
+    if has_missing and is_integer_dtype(numeric_labels):
+        return numeric_labels.astype("float64")
+    return numeric_labels
+
+
 def coerce_columns(input_dataframe: pd.DataFrame, variable_types: Dict) -> pd.DataFrame:
     """Coerces the columns in the given data frame to the given types.
 
@@ -77,17 +796,35 @@ def coerce_columns(input_dataframe: pd.DataFrame, variable_types: Dict) -> pd.Da
         ValueError: A variable's type was invalid (i.e. not in the list above).
             A variable's name was invalid (i.e. not a column in the given data frame).
     """
+    dtypes = _get_dtypes(variable_types)
+
+    # Dates are parsed by _parse_dates, rather than by astype, which would parse every
+    # unit
+    dtypes_without_dates = {
+        name: dtype for name, dtype in dtypes.items() if dtype != "datetime64[ns]"
+    }
     try:
-        dtypes = {
-            v_name: TYPE_MAPPING[v_type] for v_name, v_type in variable_types.items()
-        }
+        df = input_dataframe.astype(dtypes_without_dates)
+        for name, dtype in dtypes.items():
+            if dtype == "datetime64[ns]":
+                df[name] = _parse_dates(df[name])
     except KeyError as e:
-        raise ValueError("Invalid variable type") from e
+        raise ValueError("Invalid variable name") from e
+
+    for name, dtype in dtypes.items():
+        if dtype == "int64":
+            df[name] = _downcast_integer(df[name])
+    return df
 
+
+def _get_dtypes(variable_types):
+    """Maps from column names to external types to column names to internal types."""
     try:
-        return input_dataframe.astype(dtypes)
+        return {
+            v_name: TYPE_MAPPING[v_type] for v_name, v_type in variable_types.items()
+        }
     except KeyError as e:
-        raise ValueError("Invalid variable name") from e
+        raise ValueError("Invalid variable type") from e
 
 
 def change_binary_to_categorical(series: pd.Series) -> pd.Series:
@@ -95,6 +832,10 @@ def change_binary_to_categorical(series: pd.Series) -> pd.Series:
     If the series only contains 0s or 1s, it changes the series to a
     categorical type.
 
+    Only bool and numeric series can contain only 0s or 1s, so other series are
+    returned without being checked. Numeric series are checked with their minimum and
+    maximum, rather than with a mask of every value.
+
     Args:
         series: Data series being transformed
     Returns:
@@ -102,18 +843,55 @@ def change_binary_to_categorical(series: pd.Series) -> pd.Series:
     """
     # if the data is only ints of 0 or 1, it is a binary data type. this is
     # changed into category
-    if series.isin([0, 1]).all():
-        series = series.astype("category")
+    if series.empty:
+        # Dates aren't 0s or 1s, even if there aren't any
+        return series if is_date(series) else series.astype("category")
+
+    if is_bool_dtype(series):
+        if series.hasnans:
+            # Nullable booleans can be missing, and missing values are neither 0 nor 1
+            return series
+        minimum, maximum = series.min(), series.max()
+    elif is_numeric_dtype(series):
+        minimum, maximum = series.min(), series.max()
+        if not (minimum >= 0 and maximum <= 1):
+            # Also the case if the minimum and maximum are missing
+            return series
+        if series.hasnans:
+            return series
+        if not is_integer_dtype(series) and not series.isin([0, 1]).all():
+            # Floats between 0 and 1 aren't binary
+            return series
+    else:
+        return series
 
-    return series
+    if is_extension_array_dtype(series):
+        # The values of nullable types are objects, which can't be used as codes
+        return series.astype("category")
+    return _binary_to_categorical(series, minimum, maximum)
+
+
+def _binary_to_categorical(series, minimum, maximum):
+    """Converts a series of 0s and 1s to a categorical, as `astype("category")` would,
+    but uses the values as codes rather than factorizing them."""
+    values = series.to_numpy()
+    categories = pd.Index(np.arange(minimum, maximum + 1), dtype=values.dtype)
+    codes = values.astype("int8") - np.int8(minimum)
+    categorical = pd.Categorical.from_codes(codes, categories=categories)
+    return pd.Series(categorical, index=series.index, name=series.name)
 
 
 def is_discrete(series: Series) -> bool:
     """Check whether the given series is discrete."""
-    tests = [is_bool_dtype, is_categorical_dtype, is_datetime64_any_dtype]
+    tests = [is_bool_dtype, is_categorical_dtype]
     return any(x(series) for x in tests)
 
 
+def is_date(series: Series) -> bool:
+    """Check whether the given series contains dates."""
+    return is_datetime64_any_dtype(series)
+
+
 def is_continuous(series: Series) -> bool:
     """Check whether the given series is continuous."""
     if result := is_bool_dtype(series):
@@ -137,11 +915,19 @@ def summarize(series: Series) -> Series:
     M. Brandt et al., 'Guidelines for the checking of output based on microdata
     research', Jan. 2010, Accessed: Oct. 28, 2021. [Online]. Available:
     https://uwe-repository.worktribe.com/output/983615
+
+    Dates are summarized by `summarize_dates`, rather than by `Series.describe`.
     """
+    if is_date(series):
+        return summarize_dates(*_count_dates(series), name=series.name)
     return series.describe()
 
 
-def group(series: Series) -> Series:
+def group(
+    series: Series,
+    bins: Union[str, int] = "auto",
+    max_categories: Optional[int] = None,
+) -> Series:
     """Groups a series into a frequency table.
 
     Here, we're defining "frequency table" rather loosely; a table of the number of
@@ -150,37 +936,459 @@ def group(series: Series) -> Series:
     If `series` is discrete, then the frequency table will be the result of a group
     by/count operation on the units. The index of the series will contain the groups,
     including the "null" group. ("Null" is represented by the default missing value
-    marker.)
-
+    marker.) If `max_categories` is given, then all but the largest groups are folded
+    into one group (see `fold_categories`).
 
     If `series` is continuous, then the frequency table will be the result of a binning
     operation on the units. The index of the series, which will be an `IntervalIndex`,
-    will contain the bins.
+    will contain the bins. See `get_bin_edges` for `bins`.
+
+    If `series` contains dates, then the frequency table will be the result of grouping
+    the units into calendar periods (see `group_dates`).
     """
     if is_discrete(series):
-        return _group_discrete(series)
+        return _group_discrete(series, max_categories)
+
+    if is_date(series):
+        return group_dates(_date_values(series), name=series.name)
 
     if is_continuous(series):
-        return _group_continuous(series)
+        return _group_continuous(series, bins)
 
     assert False, series
 
 
-def _group_discrete(series):
+def _group_discrete(series, max_categories=None):
     if not is_discrete(series):
         raise TypeError("The series must be discrete")
-    return series.value_counts(dropna=False)  # Retains series.name
+    frequency_table = series.value_counts(dropna=False)  # Retains series.name
+    return fold_categories(frequency_table, max_categories)
 
 
-def _group_continuous(series):
+def fold_categories(frequency_table: Series, max_categories: Optional[int]) -> Series:
+    """Folds all but the `max_categories` largest groups of a discrete frequency table
+    into one group, labelled `OTHER_CATEGORY`, so that the size of the table is bounded
+    whatever the cardinality of the variable. If a group already has that label, then
+    the folded group is labelled `OTHER_CATEGORY` with a number, such as "Other (2)".
+
+    `frequency_table` must be sorted by the number of units in each group, in
+    descending order, as `Series.value_counts` sorts it, so the largest groups are the
+    first. The "null" group is never folded; it follows the "other" group. If
+    `max_categories` is `None`, or if there aren't more groups than `max_categories`,
+    then `frequency_table` is returned unchanged.
+    """
+    if max_categories is None:
+        return frequency_table
+    is_missing = frequency_table.index.isna()
+    counts = frequency_table.to_numpy()[~is_missing]
+    if len(counts) <= max_categories:
+        return frequency_table
+
+    labels = list(frequency_table.index[~is_missing][:max_categories])
+    labels.append(_get_other_label(frequency_table.index))
+    data = list(counts[:max_categories]) + [counts[max_categories:].sum()]
+    if is_missing.any():
+        labels.append(np.nan)
+        data.append(frequency_table.to_numpy()[is_missing].sum())
+    return pd.Series(
+        data,
+        index=pd.Index(labels, dtype="object"),
+        dtype="int64",
+        name=frequency_table.name,
+    )
+
+
+def _get_other_label(labels):
+    """Returns a label for the folded group that isn't one of `labels`."""
+    label = OTHER_CATEGORY
+    i = 1
+    while label in labels:
+        i += 1
+        label = f"{OTHER_CATEGORY} ({i})"
+    return label
+
+
+def _group_continuous(series, bins="auto"):
     if not is_continuous(series):
         raise TypeError("The series must be continuous")
-    hist, bin_edges = np.histogram(series, bins="auto")
-    idx = pd.IntervalIndex.from_arrays(left=bin_edges[:-1], right=bin_edges[1:])
-    return pd.Series(hist, index=idx, name=series.name)
+    df = series.to_frame()
+    name = df.columns[0]  # Unnamed series become the column 0
+    summary = _summarize_continuous_frame(df, [name])
+    return _group_continuous_frame(df, summary, bins)[name].rename(series.name)
+
+
+def _date_values(series):
+    """Returns the dates in `series` that aren't missing, as nanoseconds since the
+    epoch."""
+    values = series.to_numpy(dtype="datetime64[ns]").view("int64")
+    return values[values != np.iinfo("int64").min]  # NaT
+
+
+def _count_dates(series):
+    return np.unique(_date_values(series), return_counts=True)
 
 
-def redact(frequency_table: Series, less_than=10, greater_than_pct=0.9) -> Series:
+def summarize_dates(
+    values: np.ndarray, counts: np.ndarray, name: Optional[str] = None
+) -> Series:
+    """Computes summary statistics for dates from their integer representation.
+
+    The statistics are those that `Series.describe(datetime_is_numeric=True)` computes;
+    that is, the count, mean, minimum, quartiles, and maximum. Except for the count,
+    they are rounded to the nearest second.
+
+    Args:
+        values: distinct dates, in ascending order, as nanoseconds since the epoch.
+        counts: the number of units with each date.
+        name: the name of the returned series.
+    """
+    index = ["count", "mean", "min", "25%", "50%", "75%", "max"]
+    n = int(counts.sum())
+    if n == 0:
+        return pd.Series([0] + [pd.NaT] * 6, index=index, name=name, dtype="object")
+    floats = values.astype(float)
+    mean = (floats * counts).sum() / n
+    quartiles = weighted_quantiles(floats, counts, [0.25, 0.5, 0.75])
+    stats = [mean, floats[0], *quartiles, floats[-1]]
+    timestamps = [pd.Timestamp(round(stat / 10**9), unit="s") for stat in stats]
+    return pd.Series([n] + timestamps, index=index, name=name, dtype="object")
+
+
+def weighted_quantiles(
+    values: np.ndarray, counts: np.ndarray, qs: List[float]
+) -> List[float]:
+    """Computes quantiles of the units represented by `values` and `counts`, using
+    linear interpolation (the default method of `numpy.percentile`)."""
+    cumulative = np.cumsum(counts)
+    n = cumulative[-1]
+    last = len(values) - 1
+    quantiles = []
+    for q in qs:
+        position = (n - 1) * q
+        lower = np.floor(position)
+        lower_idx, upper_idx = np.searchsorted(cumulative, [lower, lower + 1], "right")
+        lower_value = values[min(lower_idx, last)]
+        upper_value = values[min(upper_idx, last)]
+        fraction = position - lower
+        quantiles.append(lower_value + fraction * (upper_value - lower_value))
+    return quantiles
+
+
+def get_date_frequency(first: int, last: int) -> str:
+    """Gets the frequency of the calendar periods into which dates between `first` and
+    `last` (in nanoseconds since the epoch) are grouped (see `DATE_FREQUENCIES`)."""
+    n_days = (last - first) / NANOSECONDS_PER_DAY
+    for max_days, freq in DATE_FREQUENCIES:
+        if max_days is None or n_days <= max_days:
+            return freq
+
+
+def group_dates(
+    values: np.ndarray,
+    counts: Optional[np.ndarray] = None,
+    name: Optional[str] = None,
+) -> Series:
+    """Groups dates into a frequency table of calendar periods.
+
+    The frequency of the periods (day, week, month, or year) is picked from the range
+    of the dates (see `get_date_frequency`), so the number of periods is bounded,
+    however many distinct dates there are. Weeks start on Mondays. Each date's period
+    is computed from its integer representation, in one pass, and the periods are
+    counted with `np.bincount`. Periods without units are included, so the periods are
+    contiguous.
+
+    Args:
+        values: dates that aren't missing, as nanoseconds since the epoch.
+        counts: the number of units with each date. If not given, then each date is one
+            unit.
+        name: the name of the returned series.
+
+    Returns:
+        A series of the number of units in each period, with a `PeriodIndex`.
+    """
+    if len(values) == 0:
+        index = pd.PeriodIndex([], freq="D")
+        return pd.Series([], index=index, name=name, dtype="int64")
+
+    freq = get_date_frequency(values.min(), values.max())
+    dates = values.view("datetime64[ns]")
+    if freq == "D":
+        codes = values // NANOSECONDS_PER_DAY
+    elif freq == "W":
+        # 1970-01-01, day 0, was a Thursday, so Mondays are 3 days after multiples of 7
+        codes = (values // NANOSECONDS_PER_DAY + 3) // 7
+    else:
+        codes = dates.astype(f"datetime64[{freq}]").view("int64")
+
+    first_code = codes.min()
+    hist = np.bincount(codes - first_code, weights=counts).astype("int64")
+    start = pd.Period(pd.Timestamp(dates[codes.argmin()]), freq=freq)
+    index = pd.period_range(start=start, periods=len(hist), freq=freq)
+    return pd.Series(hist, index=index, name=name)
+
+
+def get_bin_edges(
+    count: int,
+    minimum: float,
+    maximum: float,
+    q25: float,
+    q75: float,
+    bins: Union[str, int] = "auto",
+) -> np.ndarray:
+    """Computes the edges of equal-width bins for a continuous column from its summary
+    statistics.
+
+    The edges are those that `numpy.histogram` would compute from the column's values,
+    but the quartiles needn't be computed again, and the values needn't be read.
+
+    Args:
+        count: the number of units that aren't missing.
+        minimum: the minimum value.
+        maximum: the maximum value.
+        q25: the 25% quantile. Only used if `bins` is "auto".
+        q75: the 75% quantile. Only used if `bins` is "auto".
+        bins: either "auto", for the width that `bins="auto"` would compute (the
+            smaller of the Freedman-Diaconis and Sturges estimators); or the number of
+            bins.
+    """
+    if count == 0:
+        return np.array([0.0, 1.0])
+    first_edge, last_edge = float(minimum), float(maximum)
+    ptp = last_edge - first_edge
+    if first_edge == last_edge:
+        first_edge, last_edge = first_edge - 0.5, last_edge + 0.5
+
+    if bins != "auto":
+        n_equal_bins = int(bins)
+    else:
+        fd_width = 2.0 * (q75 - q25) * count ** (-1.0 / 3.0)
+        sturges_width = ptp / (np.log2(count) + 1.0)
+        width = min(fd_width, sturges_width) if fd_width else sturges_width
+        n_equal_bins = int(np.ceil((last_edge - first_edge) / width)) if width else 1
+    return np.linspace(first_edge, last_edge, n_equal_bins + 1, endpoint=True)
+
+
+def _group_continuous_frame(df, summaries, bins):
+    """Groups the continuous columns of a data frame into frequency tables, with edges
+    computed from their summaries by `get_bin_edges`.
+
+    Because the edges are known, each column is binned in one pass over its values,
+    with the equal-width binning of `numpy.histogram`; the quartiles aren't computed
+    again. Missing values aren't counted.
+    """
+    frequency_tables = {}
+    for name, summary in summaries.items():
+        bin_edges = get_bin_edges(
+            summary["count"],
+            summary["min"],
+            summary["max"],
+            summary["25%"],
+            summary["75%"],
+            bins,
+        )
+        # Passing the number of bins and the range, rather than the edges, lets
+        # numpy.histogram compute each value's bin rather than search for it. Missing
+        # values are outside the range, so they aren't counted.
+        hist, _ = np.histogram(
+            df[name].to_numpy(),
+            bins=len(bin_edges) - 1,
+            range=(bin_edges[0], bin_edges[-1]),
+        )
+        idx = pd.IntervalIndex.from_arrays(left=bin_edges[:-1], right=bin_edges[1:])
+        frequency_tables[name] = pd.Series(hist, index=idx, name=name)
+    return frequency_tables
+
+
+def summarize_frame(
+    df: pd.DataFrame, columns: Optional[List[str]] = None
+) -> Dict[str, Series]:
+    """Computes summary statistics for each column in a data frame.
+
+    The statistics for each column are the same as those that `summarize` computes.
+    However, rather than calling `Series.describe` once per column, the continuous
+    columns are summarized together, in one vectorised pass over a 2-D array, and the
+    categorical columns are summarized from the counts of their integer codes.
+
+    Args:
+        df: a data frame
+        columns: the columns to summarize. If not given, then every column is
+            summarized.
+
+    Returns:
+        A mapping of column names to summary statistics, in the order of the columns.
+    """
+    columns = list(df.columns) if columns is None else columns
+    continuous = [name for name in columns if is_continuous(df[name])]
+
+    summaries = {}
+    summaries.update(_summarize_continuous_frame(df, continuous))
+    for name in columns:
+        series = df[name]
+        if is_categorical_dtype(series):
+            counts = _count_categorical(series, dropna=True)
+            summaries[name] = _summarize_categorical_counts(counts, series.name)
+        elif name not in summaries:
+            summaries[name] = summarize(series)
+    return {name: summaries[name] for name in columns}
+
+
+def group_frame(
+    df: pd.DataFrame,
+    columns: Optional[List[str]] = None,
+    summaries: Optional[Dict[str, Series]] = None,
+    bins: Union[str, int] = "auto",
+    max_categories: Optional[int] = None,
+) -> Dict[str, Series]:
+    """Groups each column in a data frame into a frequency table.
+
+    The frequency table for each column is the same as that which `group` computes.
+    However, the frequency tables for the categorical columns are computed from the
+    counts of their integer codes, and the continuous columns are binned with bin edges
+    computed from their summary statistics.
+
+    Args:
+        df: a data frame
+        columns: the columns to group. If not given, then every column is grouped.
+        summaries: the summary statistics that `summarize_frame` computed for the
+            columns. If not given, then they are computed for the continuous columns.
+        bins: see `get_bin_edges`.
+        max_categories: see `fold_categories`.
+
+    Returns:
+        A mapping of column names to frequency tables, in the order of the columns.
+    """
+    columns = list(df.columns) if columns is None else columns
+    continuous = [name for name in columns if is_continuous(df[name])]
+    if summaries is None:
+        summaries = _summarize_continuous_frame(df, continuous)
+
+    frequency_tables = _group_continuous_frame(
+        df, {name: summaries[name] for name in continuous}, bins
+    )
+    for name in columns:
+        series = df[name]
+        if is_categorical_dtype(series):
+            frequency_tables[name] = fold_categories(
+                _count_categorical(series, dropna=False), max_categories
+            )
+        elif name not in frequency_tables:
+            frequency_tables[name] = group(series, bins, max_categories)
+    return {name: frequency_tables[name] for name in columns}
+
+
+def stratify_frame(
+    df: pd.DataFrame, stratify_by: str
+) -> Iterator[Tuple[Any, pd.DataFrame]]:
+    """Splits a data frame into strata, one for each value of the discrete column
+    `stratify_by`, and yields the value and the rows of each stratum.
+
+    Every stratum is split from the same codes, in one pass: the rows are reordered by
+    their code with a stable sort, and the size of each stratum is counted with
+    `np.bincount`, so each stratum is a slice of the reordered data frame, rather than
+    a copy selected by a mask per stratum. The strata are in the order of the
+    categories, and strata without units are skipped. The units whose value is missing
+    are the last stratum, whose value is NaN.
+
+    Args:
+        df: a data frame
+        stratify_by: the name of a discrete column of `df`
+
+    Returns:
+        Iterator[Tuple[Any, pd.DataFrame]]: The value and the rows of each stratum
+
+    Raises:
+        ValueError: `stratify_by` wasn't the name of a discrete column of `df`.
+    """
+    if stratify_by not in df.columns:
+        raise ValueError("Invalid variable name")
+    series = df[stratify_by]
+    if not (is_discrete(series) or is_object_dtype(series)):
+        raise ValueError(f"Can't stratify by {stratify_by}, which isn't discrete")
+
+    categorical = series.astype("category").array
+    n_categories = len(categorical.categories)
+    # Missing units have the code -1; they're moved to the last stratum
+    codes = np.where(categorical.codes == -1, n_categories, categorical.codes)
+    sizes = np.bincount(codes, minlength=n_categories + 1)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    reordered = df.take(np.argsort(codes, kind="stable"))
+
+    values = list(categorical.categories) + [np.nan]
+    for i, value in enumerate(values):
+        if sizes[i] > 0:
+            yield value, reordered.iloc[offsets[i] : offsets[i + 1]]
+
+
+def _summarize_continuous_frame(df, columns):
+    if not columns:
+        return {}
+
+    block = df[columns].to_numpy(dtype=float)
+    has_missing = np.isnan(block).any()
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        # All-missing columns have missing statistics, as they do with describe
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        count = block.shape[0] - np.isnan(block).sum(axis=0)
+        mean = np.nanmean(block, axis=0)
+        std = np.nanstd(block, axis=0, ddof=1)
+        minimum = np.nanmin(block, axis=0)
+        maximum = np.nanmax(block, axis=0)
+        percentile = np.nanpercentile if has_missing else np.percentile
+        quartiles = percentile(block, [25, 50, 75], axis=0)
+
+    stats = np.vstack([count, mean, std, minimum, quartiles, maximum])
+    index = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+    return {
+        name: pd.Series(stats[:, i], index=index, dtype="float64", name=name)
+        for i, name in enumerate(columns)
+    }
+
+
+def _count_categorical(series, dropna):
+    """Counts the units in each category of a categorical series with `np.bincount`,
+    and returns them as `Series.value_counts` would."""
+    categorical = series.array
+    codes = categorical.codes
+    n_categories = len(categorical.categories)
+    # Missing units have the code -1, so shifting by one counts them in the first bin
+    counts = np.bincount(codes + 1, minlength=n_categories + 1)
+
+    index_codes = np.arange(n_categories)
+    if not dropna and counts[0] > 0:
+        index_codes = np.append(index_codes, -1)
+        counts = np.append(counts[1:], counts[0])
+    else:
+        counts = counts[1:]
+
+    index = pd.CategoricalIndex(
+        pd.Categorical.from_codes(index_codes, dtype=categorical.dtype)
+    )
+    frequency_table = pd.Series(counts, index=index, dtype="int64", name=series.name)
+    return frequency_table.sort_values(ascending=False)
+
+
+def _summarize_categorical_counts(counts, name):
+    """Summarizes the counts of a categorical series, as `Series.describe` would."""
+    count_unique = len(counts[counts != 0])
+    if count_unique > 0:
+        top, freq = counts.index[0], counts.iloc[0]
+        dtype = None
+    else:
+        top, freq = np.nan, np.nan
+        dtype = "object"
+    return pd.Series(
+        [counts.sum(), count_unique, top, freq],
+        index=["count", "unique", "top", "freq"],
+        name=name,
+        dtype=dtype,
+    )
+
+
+def redact(
+    frequency_table: Series,
+    less_than=REDACTION_THRESHOLDS["less_than"],
+    greater_than_pct=REDACTION_THRESHOLDS["greater_than_pct"],
+) -> Series:
     """Redacts a frequency table according to the given heuristics.
 
     The heuristics are from Brandt et al.
@@ -204,6 +1412,82 @@ def redact(frequency_table: Series, less_than=10, greater_than_pct=0.9) -> Serie
     return frequency_table.mask(unit_mask | unit_dist_mask)  # Retains series.name
 
 
+def redact_tables(
+    frequency_tables: Dict[str, Series],
+    thresholds: Optional[Dict[str, Dict[str, float]]] = None,
+) -> Tuple[Dict[str, Series], Dict[str, Dict]]:
+    """Redacts several frequency tables at once, as `redact` would redact each of them.
+
+    The tables are concatenated into one array, with the offset of each table, so the
+    heuristics are applied to every cell in one vectorised pass, and the total of each
+    table is computed from the cumulative sum of the array. Each redacted table is a
+    view of the array, rather than a copy.
+
+    Args:
+        frequency_tables: a mapping of variable names to frequency tables
+        thresholds: a mapping of variable names to the `less_than` and
+            `greater_than_pct` thresholds for the variable. Variables that aren't given,
+            and thresholds that aren't given, have the defaults of `redact`.
+
+    Returns:
+        A mapping of variable names to redacted frequency tables, and a mapping of
+        variable names to records of redaction. Each record has the thresholds, and, for
+        each redacted cell, the cell's label and the names of the thresholds that it
+        didn't satisfy. The records don't contain the redacted values.
+    """
+    thresholds = {} if thresholds is None else thresholds
+    names = list(frequency_tables)
+    variable_thresholds = [get_redaction_thresholds(thresholds, name) for name in names]
+
+    lengths = np.array([len(frequency_tables[name]) for name in names], dtype="int64")
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    values = np.concatenate(
+        [np.empty(0)] + [frequency_tables[name].to_numpy(dtype=float) for name in names]
+    )
+    cumulative = np.concatenate([[0], np.cumsum(values)])
+    totals = np.repeat(cumulative[offsets[1:]] - cumulative[offsets[:-1]], lengths)
+    less_than = np.repeat([t["less_than"] for t in variable_thresholds], lengths)
+    greater_than_pct = np.repeat(
+        [t["greater_than_pct"] for t in variable_thresholds], lengths
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # A table without units has no cells that exceed its total
+        unit_mask = values < less_than
+        unit_dist_mask = values / totals > greater_than_pct
+    values[unit_mask | unit_dist_mask] = np.nan
+
+    redacted_tables = {}
+    records = {}
+    for i, name in enumerate(names):
+        start, stop = offsets[i], offsets[i + 1]
+        table = frequency_tables[name]
+        redacted_tables[name] = pd.Series(
+            values[start:stop], index=table.index, name=table.name, copy=False
+        )
+        cells = []
+        for j in np.flatnonzero(unit_mask[start:stop] | unit_dist_mask[start:stop]):
+            reasons = []
+            if unit_mask[start + j]:
+                reasons.append("less_than")
+            if unit_dist_mask[start + j]:
+                reasons.append("greater_than_pct")
+            cells.append({"cell": str(table.index[j]), "reasons": reasons})
+        records[name] = {**variable_thresholds[i], "cells": cells}
+    return redacted_tables, records
+
+
+def get_redaction_thresholds(
+    thresholds: Dict[str, Dict[str, float]], name: str
+) -> Dict[str, float]:
+    """Gets the redaction thresholds for the variable called `name` from `thresholds`
+    (see `redact_tables`)."""
+    variable_thresholds = thresholds.get(name, {})
+    if unknown := set(variable_thresholds) - set(REDACTION_THRESHOLDS):
+        raise ValueError(f"Invalid redaction thresholds for {name}: {sorted(unknown)}")
+    return {**REDACTION_THRESHOLDS, **variable_thresholds}
+
+
 def _get_unit_mask(frequency_table, less_than):
     """True for values that are less than `less_than`. Otherwise False."""
     return frequency_table < less_than
@@ -215,16 +1499,50 @@ def _get_unit_distribution_mask(frequency_table, greater_than_pct):
     return frequency_table / frequency_table.sum() > greater_than_pct
 
 
-def plot(series: Series) -> Figure:
+def plot(series: Series, ax: Optional[Axes] = None) -> Figure:
     """Plots a series.
 
-    If `series` has an interval index, then it will be plotted as a histogram.
+    If `series` has an interval index, then it will be plotted as a histogram. If it
+    has a period index, then it will be plotted as a bar chart with a time axis.
     Otherwise, it will be plotted as a bar chart.
+
+    If `ax` is given, then it is cleared and the series is plotted on it. Otherwise,
+    the series is plotted on a new figure. Either way, the figure isn't registered with
+    `matplotlib.pyplot`, so it is released when it is no longer referenced.
     """
+    if ax is None:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+    else:
+        ax.clear()
+        # Clearing the axes doesn't reset their data limits, so a chart without data
+        # (for example, one whose every cell was redacted) would have the previous
+        # chart's limits. Recomputing them from the (cleared) artists resets them.
+        ax.relim()
+        # Nor does it reset the figure's margins, which _plot_dates widens
+        _reset_margins(ax.get_figure())
+
     if is_interval_dtype(series.index):
-        return _plot_hist(series)
+        _plot_hist(series, ax)
+    elif isinstance(series.index, pd.PeriodIndex):
+        _plot_dates(series, ax)
     else:
-        return _plot_barh(series)
+        _plot_barh(series, ax)
+    return ax.get_figure()
+
+
+def _reset_margins(fig):
+    """Resets the margins of `fig` to those of a new figure."""
+    params = SubplotParams()
+    fig.subplots_adjust(
+        left=params.left,
+        bottom=params.bottom,
+        right=params.right,
+        top=params.top,
+        wspace=params.wspace,
+        hspace=params.hspace,
+    )
 
 
 def _series_with_interval_index_to_histogram(series):
@@ -235,19 +1553,89 @@ def _series_with_interval_index_to_histogram(series):
     return hist, bin_edges
 
 
-def _plot_hist(series):
+def _plot_hist(series, ax):
     hist, bin_edges = _series_with_interval_index_to_histogram(series)
-    fig, ax = plt.subplots()
     ax.hist(x=bin_edges[:-1], bins=bin_edges, weights=hist)
     ax.set_title(series.name)
-    return fig
 
 
-def _plot_barh(series):
-    ax = series.plot.barh(title=series.name)
-    return ax.figure
+def _plot_dates(series, ax):
+    # Each period's bar spans the period, so weeks, months, and years are to scale
+    starts = series.index.start_time
+    widths = (series.index.end_time - starts) / pd.Timedelta(days=1)
+    ax.bar(starts, series.to_numpy(dtype=float), width=widths, align="edge")
+    ax.set_title(series.name)
+    ax.get_figure().autofmt_xdate()
+
+
+def _plot_barh(series, ax):
+    # Mirrors Series.plot.barh, which draws through matplotlib.pyplot
+    positions = np.arange(len(series))
+    ax.barh(positions, series.to_numpy(dtype=float), height=0.5)
+    ax.set_yticks(positions)
+    ax.set_yticklabels([str(label) for label in series.index])
+    ax.set_title(series.name)
+
+
+class ChartRenderer:
+    """Renders charts onto one figure, which is reused for each chart.
+
+    Creating a figure is expensive, relative to drawing on one, and figures that are
+    created through `matplotlib.pyplot` are never released unless they are closed.
+    Consequently, a renderer creates one figure and one set of axes, clears the axes for
+    each chart, and releases them when it is closed. A chart must be saved before the
+    next chart is plotted.
+    """
+
+    def __init__(self):
+        self._figure = Figure()
+        FigureCanvasAgg(self._figure)
+        self._ax = self._figure.add_subplot()
+
+    def plot(self, series: Series) -> Figure:
+        """Plots a series on the renderer's figure (see `plot`)."""
+        if self._figure is None:
+            raise ValueError("The renderer is closed")
+        return plot(series, ax=self._ax)
+
+    def close(self) -> None:
+        """Releases the renderer's figure."""
+        if self._figure is not None:
+            self._figure.clear()
+            self._figure = self._ax = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# The formats in which charts can be encoded.
+CHART_FORMATS = ["png", "svg"]
 
 
 def save(fig: Figure, f_path: Union[Path, str]):
     """Saves `fig` to `f_path`."""
     fig.savefig(f_path)
+
+
+def encode(fig: Figure, chart_format: str = "png", salt: str = "") -> bytes:
+    """Encodes `fig` in the given format (see `CHART_FORMATS`).
+
+    SVGs keep their text as text, rather than as paths, and have no creation date, so
+    they are compact and reproducible. Their ids are derived from `salt`, so that the
+    ids of SVGs with different salts don't clash when the SVGs are inlined in one
+    document.
+    """
+    if chart_format not in CHART_FORMATS:
+        raise ValueError(f"Invalid chart format: {chart_format}")
+    buffer = io.BytesIO()
+    if chart_format == "svg":
+        with rc_context(
+            {"svg.fonttype": "none", "svg.hashsalt": f"cohortreport{salt}"}
+        ):
+            fig.savefig(buffer, format="svg", metadata={"Date": None})
+    else:
+        fig.savefig(buffer, format=chart_format)
+    return buffer.getvalue()
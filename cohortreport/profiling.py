@@ -0,0 +1,126 @@
+"""Records the wall time, CPU time, and peak memory of each stage of a report."""
+
+import contextlib
+import json
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+# On Linux, ru_maxrss is in kilobytes; on macOS, it's in bytes.
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# Returned by a disabled profiler, so that a disabled stage costs a method call.
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+def peak_memory() -> int:
+    """Returns the peak resident memory of this process, in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+class Profiler:
+    """Records the wall time, CPU time, and peak memory of each stage of a report.
+
+    Each stage is recorded for the report as a whole, or for a variable. Peak memory is
+    the peak resident memory of the process when the stage finished; because it never
+    falls, the stage that first raised it is the one that needed the memory.
+
+    A profiler can be pickled, so that the records of stages that ran in a worker
+    process can be returned and added to the profiler of the main process.
+
+    Args:
+        enabled: whether to record stages. If `False`, then `stage` does nothing.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.records: List[Dict] = []
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    def stage(self, name: str, variable: Optional[str] = None):
+        """Returns a context manager that records the stage called `name`, for
+        `variable` if given."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._record(name, variable)
+
+    @contextlib.contextmanager
+    def _record(self, name, variable):
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.records.append(
+                {
+                    "stage": name,
+                    "variable": variable,
+                    "wall_seconds": time.perf_counter() - start_wall,
+                    "cpu_seconds": time.process_time() - start_cpu,
+                    "peak_memory_bytes": peak_memory(),
+                }
+            )
+
+    def extend(self, records: List[Dict]) -> None:
+        """Adds records from another profiler; for example, one in a worker process."""
+        self.records.extend(records)
+
+    def summarize_stages(self) -> Dict[str, Dict]:
+        """Totals the wall and CPU time, and takes the maximum peak memory, of each
+        stage, in the order in which the stages were first recorded."""
+        stages = {}
+        for record in self.records:
+            stage = stages.setdefault(
+                record["stage"],
+                {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0},
+            )
+            stage["count"] += 1
+            stage["wall_seconds"] += record["wall_seconds"]
+            stage["cpu_seconds"] += record["cpu_seconds"]
+            stage["peak_memory_bytes"] = max(
+                stage.get("peak_memory_bytes", 0), record["peak_memory_bytes"]
+            )
+        return stages
+
+    def summarize_variables(self) -> Dict[str, Dict[str, Dict]]:
+        """Groups the records of each variable by stage."""
+        variables = {}
+        for record in self.records:
+            if record["variable"] is None:
+                continue
+            stages = variables.setdefault(record["variable"], {})
+            stages[record["stage"]] = {
+                key: record[key]
+                for key in ["wall_seconds", "cpu_seconds", "peak_memory_bytes"]
+            }
+        return variables
+
+    def to_dict(self) -> Dict:
+        return {
+            "wall_seconds": time.perf_counter() - self._start_wall,
+            "cpu_seconds": time.process_time() - self._start_cpu,
+            "peak_memory_bytes": peak_memory(),
+            "stages": self.summarize_stages(),
+            "variables": self.summarize_variables(),
+        }
+
+    def write(self, path) -> None:
+        """Writes the profile to `path`, as JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def format_table(self) -> str:
+        """Formats the totals of each stage as a table."""
+        lines = [
+            f"{'stage':<16}{'count':>8}{'wall (s)':>12}{'cpu (s)':>12}{'peak (MB)':>12}"
+        ]
+        for name, stage in self.summarize_stages().items():
+            lines.append(
+                f"{name:<16}{stage['count']:>8}"
+                f"{stage['wall_seconds']:>12.3f}{stage['cpu_seconds']:>12.3f}"
+                f"{stage['peak_memory_bytes'] / 1024 / 1024:>12.1f}"
+            )
+        return "\n".join(lines)
@@ -1,27 +1,109 @@
+import base64
+import contextlib
+import functools
+import itertools
+import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
 
-import pkg_resources
-from jinja2 import Template
+import pandas as pd
+from jinja2 import Environment, FileSystemLoader
 
+from cohortreport import MODULE_ROOT, incremental, outofcore
+from cohortreport.accumulators import accumulate
+from cohortreport.cache import ResultCache, hash_series
 from cohortreport.errors import ConfigAndFileMismatchError
+from cohortreport.inputcache import InputCache
 from cohortreport.processing import (
+    CHART_FORMATS,
+    ChartRenderer,
     change_binary_to_categorical,
-    coerce_columns,
-    group,
+    encode,
+    estimate_column_sizes,
+    get_redaction_thresholds,
+    group_columns,
+    group_frame,
+    iter_study_cohort,
     load_study_cohort,
-    plot,
-    redact,
-    save,
-    summarize,
+    redact_tables,
+    stratify_frame,
+    summarize_frame,
 )
+from cohortreport.profiling import Profiler
+from cohortreport.storage import make_key
+from cohortreport.writer import BackgroundWriter
+
+
+# The number of rows that are read at a time, when reading incrementally, out of core,
+# or approximately, without a chunksize.
+STREAMING_CHUNKSIZE = 100_000
+
+# The renderer that plots each variable in this process. It's created when the first
+# variable is plotted, so that each worker process has its own.
+_renderer = None
+
+
+def _get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = ChartRenderer()
+    return _renderer
+
+
+def _close_renderer():
+    global _renderer
+    if _renderer is not None:
+        _renderer.close()
+        _renderer = None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_template():
+    """Loads and compiles the report template once per process."""
+    environment = Environment(loader=FileSystemLoader(MODULE_ROOT / "resources"))
+    return environment.get_template("report_template.html")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_stylesheet():
+    return (MODULE_ROOT / "resources" / "report.css").read_text(encoding="utf-8")
+
+
+def _to_template_report(report_dict):
+    """Replaces the summary of a variable's report with a list of its rows, so that the
+    template iterates over a list, rather than over a series."""
+    template_report = dict(report_dict)
+    template_report["written_report"] = list(report_dict["written_report"].items())
+    return template_report
 
 
 def make_report(
     path: Path,
     output_dir: str,
     variable_types: Optional[Dict[str, str]],
+    chunksize: Optional[int] = None,
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    cache_max_size: int = 1024,
+    use_cache: bool = True,
+    profile: bool = False,
+    profile_to_stderr: bool = False,
+    approximate: bool = False,
+    bins: Union[str, int] = "auto",
+    max_categories: Optional[int] = None,
+    state_dir: Optional[str] = None,
+    redaction_thresholds: Optional[Dict[str, Dict[str, float]]] = None,
+    chart_format: str = "png",
+    self_contained: bool = False,
+    spill_threshold: Optional[int] = None,
+    spill_dir: Optional[str] = None,
+    column_budget: Optional[int] = None,
+    input_cache_dir: Optional[str] = None,
+    input_cache_max_size: int = 4096,
+    stratify_by: Optional[str] = None,
 ) -> None:
     """Makes a report for a cohort.
 
@@ -31,54 +113,750 @@ def make_report(
         output_dir: a path to a directory where the report will be written.
         variable_types: for CSV files, a mapping of column names to column types. For
             other file types, this is optional (`None`).
+        chunksize: the maximum number of rows to read at a time. If
+            given, then the cohort is streamed through per-column accumulators, rather
+            than loaded into memory. Otherwise, it is loaded into memory (`None`).
+        workers: the number of worker processes that make the report for each
+            variable. If not given, then the report for each variable is made in this
+            process (`None`).
+        cache_dir: a path to a directory where the report for each variable is cached,
+            so that it is only made again if the variable has changed. If not given,
+            then reports are not cached (`None`).
+        cache_max_size: the maximum size of the cache, in megabytes.
+        use_cache: whether to use the cache. Pass `False` to bypass it.
+        profile: whether to record the wall time, CPU time, and peak memory of each
+            stage, and to write them to a JSON file next to the report.
+        profile_to_stderr: if `profile` is `True`, whether to also print the totals
+            of each stage to stderr.
+        approximate: whether to summarize continuous variables with many distinct
+            values with sketches, in constant memory, rather than exactly. If `True`,
+            then the cohort is streamed through approximate accumulators, even if
+            `chunksize` isn't given. The counts of a sketched variable's bins are
+            approximate, and are redacted with the same thresholds as exact counts, so
+            a bin that is redacted by an exact report might not be redacted by an
+            approximate one.
+        bins: the number of bins into which each continuous variable is grouped, or
+            "auto" for a number that depends on the variable's summary statistics.
+        max_categories: the number of groups of each categorical variable that are
+            reported. The other groups are folded into one group (see
+            `fold_categories`). If not given, then every group is reported (`None`).
+        state_dir: for csv files, a path to a directory where the state of the report
+            is saved, so that the next report for the same file only reads the rows
+            that have been appended since. If not given, then every row is read every
+            time (`None`).
+        redaction_thresholds: a mapping of variable names to the `less_than` and
+            `greater_than_pct` thresholds with which the variable's frequency table is
+            redacted. Variables that aren't given, and thresholds that aren't given,
+            have the default thresholds (`None`).
+        chart_format: the format of each variable's chart; either "png" or "svg".
+        self_contained: whether to inline the charts and the stylesheet in the report,
+            so that the report is one file that doesn't depend on a CDN, rather than
+            writing a file for each chart.
+        spill_threshold: the number of megabytes that the per-column accumulators may
+            hold before they are spilled to disk. If given, then the cohort is read in
+            chunks, and the accumulators are merged one column at a time, so that
+            cohorts that are larger than memory can be reported (see
+            `accumulate_out_of_core`). If not given, then accumulators aren't spilled
+            (`None`).
+        spill_dir: a path to a directory where spilled accumulators are written. If not
+            given, then they are written to the system's temporary directory (`None`).
+        column_budget: the number of megabytes of columns that are loaded at a time,
+            when the cohort is loaded into memory. If given, then the columns are split
+            into groups from the file's schema (see `group_columns`), and each group
+            is loaded, and its variables are summarized and grouped, before the next
+            group is loaded. If not given, then every column is loaded at once
+            (`None`).
+        input_cache_dir: for CSV files, a path to a directory where the parsed columns
+            are cached, so that later reports for the same file and variable types
+            memory-map them rather than parse the file again (see `InputCache`). If
+            not given, then the file is parsed every time (`None`).
+        input_cache_max_size: the maximum size of the input cache, in megabytes.
+        stratify_by: the name of a categorical or binary variable by which every
+            other variable is stratified. If given, then each other variable's summary,
+            frequency table, redacted frequency table, and chart are made for each
+            stratum, in one pass (see `stratify_frame`). If not given, then variables
+            aren't stratified (`None`).
     """
     ext = "".join(path.suffixes)
     if (ext == ".csv" or ext == ".csv.gz") and variable_types is None:
         raise ConfigAndFileMismatchError(
             f"If you pass a {ext} file, then you must also pass `variable_types`"
         )
+    if bins != "auto" and (
+        isinstance(bins, bool) or not isinstance(bins, int) or bins < 1
+    ):
+        raise ValueError("`bins` must be either 'auto' or a number of bins")
+    if max_categories is not None and (
+        isinstance(max_categories, bool)
+        or not isinstance(max_categories, int)
+        or max_categories < 0
+    ):
+        raise ValueError("`max_categories` must be a number of categories")
+    if chunksize is not None and (
+        isinstance(chunksize, bool) or not isinstance(chunksize, int) or chunksize < 1
+    ):
+        raise ValueError("`chunksize` must be a number of rows")
+    if workers is not None and (
+        isinstance(workers, bool) or not isinstance(workers, int) or workers < 1
+    ):
+        raise ValueError("`workers` must be a number of processes")
+    # Passed to group_frame and to ColumnAccumulator.group
+    grouping = {"bins": bins, "max_categories": max_categories}
+    if redaction_thresholds is None:
+        redaction_thresholds = {}
+    for name in redaction_thresholds:
+        # Raises if there are invalid thresholds
+        get_redaction_thresholds(redaction_thresholds, name)
+    if chart_format not in CHART_FORMATS:
+        raise ValueError(f"`chart_format` must be one of {CHART_FORMATS}")
+    if spill_threshold is not None and (
+        isinstance(spill_threshold, bool)
+        or not isinstance(spill_threshold, (int, float))
+        or spill_threshold < 0
+    ):
+        raise ValueError("`spill_threshold` must be a number of megabytes")
+    if stratify_by is not None:
+        if variable_types is not None and stratify_by not in variable_types:
+            raise ValueError("`stratify_by` must be one of the `variable_types`")
+        if (
+            chunksize is not None
+            or approximate
+            or spill_threshold is not None
+            or (state_dir is not None and ext == ".csv")
+        ):
+            raise ValueError(
+                "`stratify_by` can't be combined with `chunksize`, `approximate`, "
+                "`spill_threshold`, or `state_dir`"
+            )
+    if column_budget is not None and (
+        isinstance(column_budget, bool)
+        or not isinstance(column_budget, (int, float))
+        or column_budget < 0
+    ):
+        raise ValueError("`column_budget` must be a number of megabytes")
 
-    # loads data into dataframe
-    df = load_study_cohort(path)
-
-    # do type conversion if csv files by using variable type config passed in
-    if variable_types is not None:
-        df = coerce_columns(df, variable_types)
+    profiler = Profiler(enabled=profile)
 
-    template_str = pkg_resources.resource_string(
-        "cohortreport", "resources/report_template.html"
-    )
-    template = Template(template_str.decode("utf8"))
+    template = _get_template()
+    stylesheet = _get_stylesheet() if self_contained else None
 
     os.makedirs(output_dir, exist_ok=True)
 
-    # loops through the dataframe column by column and suppreses low
-    # numbers, make a cohort report and then a graph
+    cache = None
+    if cache_dir is not None and use_cache:
+        cache = ResultCache(Path(cache_dir), cache_max_size * 1024 * 1024)
+
+    # Rows are appended to csv files from an offset into the csv file, so reports that
+    # are made incrementally always parse the csv file
+    incrementally = state_dir is not None and ext == ".csv"
+
+    # Csv files are parsed once, and then memory-mapped by later reports
+    cohort_path = path
+    if input_cache_dir is not None and ext in (".csv", ".csv.gz") and not incrementally:
+        input_cache = InputCache(
+            Path(input_cache_dir), input_cache_max_size * 1024 * 1024
+        )
+        with profiler.stage("input_cache"):
+            cohort_path = input_cache.get(path, variable_types)
+            input_cache.evict(keep=cohort_path)
+
+    # The variable and the stratum of each stratified report
+    strata = {}
+
+    if incrementally:
+        results = _iter_results_incrementally(
+            path, variable_types, chunksize, profiler, approximate, grouping, state_dir
+        )
+    elif spill_threshold is not None:
+        results = _iter_results_out_of_core(
+            cohort_path,
+            variable_types,
+            chunksize,
+            profiler,
+            approximate,
+            grouping,
+            spill_threshold * 1024 * 1024,
+            spill_dir,
+        )
+    elif chunksize is not None or approximate:
+        results = _iter_results_in_chunks(
+            cohort_path, variable_types, chunksize, profiler, approximate, grouping
+        )
+    else:
+        results = _iter_results(
+            cohort_path,
+            variable_types,
+            cache,
+            profiler,
+            grouping,
+            redaction_thresholds,
+            chart_format,
+            None if column_budget is None else column_budget * 1024 * 1024,
+            stratify_by,
+            strata,
+        )
+
+    # Charts are written in the background, while the next variable's report is made.
+    # Every chart is written, and checked, before the report is.
+    with BackgroundWriter() as writer:
+        reports = _make_variable_reports(
+            results,
+            output_dir,
+            workers,
+            cache,
+            profiler,
+            redaction_thresholds,
+            chart_format,
+            self_contained,
+            writer,
+            strata,
+        )
+        with profiler.stage("flush"):
+            writer.flush()
+
+    if cache is not None:
+        with profiler.stage("evict_cache"):
+            cache.evict()
+
+    _close_renderer()
+
+    # The report is rendered straight to its file, piece by piece, so it's never held
+    # in memory
+    with profiler.stage("render"):
+        template_reports = {
+            name: _to_template_report(report) for name, report in reports.items()
+        }
+        with open(
+            f"{output_dir}/descriptives_{path.stem}.html", "w", encoding="utf-8"
+        ) as f:
+            for html in template.generate(
+                reports=template_reports, stylesheet=stylesheet
+            ):
+                f.write(html)
+
+    with profiler.stage("write"):
+        with open(
+            f"{output_dir}/redactions_{path.stem}.json", "w", encoding="utf-8"
+        ) as f:
+            json.dump(
+                {name: report["redaction"] for name, report in reports.items()},
+                f,
+                indent=2,
+            )
+    print(f"Created cohort report at {output_dir}descriptives_{path.stem}.html")
+
+    if profile:
+        profiler.write(Path(output_dir) / f"profile_{path.stem}.json")
+        if profile_to_stderr:
+            print(profiler.format_table(), file=sys.stderr)
+
+
+def _make_variable_reports(
+    results,
+    output_dir,
+    workers,
+    cache,
+    profiler,
+    redaction_thresholds,
+    chart_format,
+    self_contained,
+    writer,
+    strata=None,
+):
+    """Makes the report for each variable from the results of `_iter_results`, or of
+    one of its alternatives, and queues each chart with `writer`.
+
+    The strata of a variable (see `_iter_stratified_results`) are redacted with the
+    variable's redaction thresholds.
+
+    Returns a mapping of variable names to reports, in the order of the results.
+    """
+    strata = {} if strata is None else strata
+    # Each result is either a report that was read from the cache, or the summary and
+    # frequency table from which the report is made
     reports = {}
-    for name, series in df.iteritems():
+    uncached = {}
+    for name, result in results:
+        if isinstance(result, dict):
+            with profiler.stage("read_cache", name):
+                reports[name] = _read_cached_variable_report(result)
+            with profiler.stage("save", name):
+                reports[name] = _save_chart(
+                    _get_chart_name(name, strata),
+                    reports[name],
+                    output_dir,
+                    chart_format,
+                    self_contained,
+                    writer,
+                )
+        else:
+            reports[name] = None  # Keeps the order of the variables
+            uncached[name] = result
+
+    stratum_thresholds = {
+        name: redaction_thresholds[stratum["variable"]]
+        for name, stratum in strata.items()
+        if stratum["variable"] in (redaction_thresholds or {})
+    }
+
+    # suppresses low numbers in every frequency table at once
+    with profiler.stage("redact"):
+        redacted_tables, redactions = redact_tables(
+            {name: grouped_series for name, (_, grouped_series, _) in uncached.items()},
+            {**(redaction_thresholds or {}), **stratum_thresholds},
+        )
+
+    # Each task is the summary, frequency table, and redacted frequency table from
+    # which the report is made. It's shipped to a worker on its own.
+    tasks = [
+        (
+            name,
+            summarized_series,
+            grouped_series,
+            redacted_tables[name],
+            redactions[name],
+            chart_format,
+            cache,
+            key,
+        )
+        for name, (summarized_series, grouped_series, key) in uncached.items()
+    ]
+
+    # loops through the tasks variable by variable and makes a cohort report and then
+    # a graph. If profiling, then each task returns the records of its stages, too, as
+    # it may run in a worker process. Each report is saved as soon as it's made, so
+    # its chart is written while the next report is made.
+    make_variable_report = _make_variable_report
+    if profiler.enabled:
+        make_variable_report = _make_profiled_variable_report
+    with contextlib.ExitStack() as stack:
+        if workers is not None:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            # Executor.map returns results in the order of the tasks
+            report_dicts = executor.map(make_variable_report, *zip(*tasks))
+        else:
+            report_dicts = (make_variable_report(*task) for task in tasks)
+        for task, report_dict in zip(tasks, report_dicts):
+            name = task[0]
+            if profiler.enabled:
+                report_dict, records = report_dict
+                profiler.extend(records)
+            with profiler.stage("save", name):
+                reports[name] = _save_chart(
+                    _get_chart_name(name, strata),
+                    report_dict,
+                    output_dir,
+                    chart_format,
+                    self_contained,
+                    writer,
+                )
+    return reports
+
+
+def _iter_results(
+    path,
+    variable_types,
+    cache,
+    profiler,
+    grouping=None,
+    redaction_thresholds=None,
+    chart_format="png",
+    column_budget=None,
+    stratify_by=None,
+    strata=None,
+):
+    """Yields the name of each variable, with either its cached report or its summary,
+    frequency table, and cache key, having loaded the cohort into memory.
+
+    If `column_budget` is given, then the columns are loaded in groups of at most
+    `column_budget` bytes, one group at a time, so that peak memory is set by the
+    largest group rather than by every column. The variables are yielded in the order
+    in which they would be loaded together.
+
+    If `stratify_by` is given, then each other variable is yielded once per stratum
+    (see `_iter_stratified_results`), and the variable and stratum of each such name
+    are recorded in `strata`.
+    """
+    if column_budget is None:
+        column_groups = [None]  # Every column
+    else:
+        with profiler.stage("schedule"):
+            sizes = estimate_column_sizes(path, variable_types)
+            sizes.pop("patient_id", None)
+            column_groups = group_columns(sizes, column_budget)
+
+    for columns in column_groups:
+        yield from _iter_column_group_results(
+            path,
+            variable_types,
+            columns,
+            cache,
+            profiler,
+            grouping,
+            redaction_thresholds,
+            chart_format,
+            stratify_by,
+            strata,
+        )
+
+
+def _iter_column_group_results(
+    path,
+    variable_types,
+    columns,
+    cache,
+    profiler,
+    grouping=None,
+    redaction_thresholds=None,
+    chart_format="png",
+    stratify_by=None,
+    strata=None,
+):
+    """Yields the name of each variable in `columns`, or of every variable if
+    `columns` is `None`, with either its cached report or its summary, frequency table,
+    and cache key.
+
+    The summaries and frequency tables of the variables that aren't cached are computed
+    together, with `summarize_frame` and `group_frame`. The bin edges of the continuous
+    variables are computed from their summaries. `grouping` is passed to `group_frame`.
+    """
+    grouping = {} if grouping is None else grouping
+    load_columns = columns
+    if stratify_by is not None and columns is not None and stratify_by not in columns:
+        # Every group is stratified, but the stratifying variable is only reported once
+        load_columns = columns + [stratify_by]
+    # loads data into dataframe, doing type conversion as it's loaded if csv files by
+    # using variable type config passed in
+    with profiler.stage("load"):
+        df = load_study_cohort(path, variable_types, load_columns)
+
+    names = [
+        name
+        for name in df.columns
+        if name != "patient_id" and (columns is None or name in columns)
+    ]
+    with profiler.stage("coerce"):
+        for name in df.columns.drop("patient_id", errors="ignore"):
+            series = df[name]
+            transformed_series = change_binary_to_categorical(series=series)
+            if transformed_series is not series:
+                df[name] = transformed_series
+
+    if stratify_by is not None:
+        yield from _iter_stratified_results(
+            df, names, stratify_by, profiler, grouping, strata
+        )
+        return
+
+    keys = {}
+    cached = {}
+    if cache is not None:
+        with profiler.stage("hash"):
+            for name in names:
+                # The key is a hash of the variable's values, so the summary and
+                # frequency table needn't be computed for variables that are cached
+                keys[name] = make_key(
+                    name,
+                    str(df[name].dtype),
+                    hash_series(df[name], index=False),
+                    repr(get_redaction_thresholds(redaction_thresholds or {}, name)),
+                    repr(grouping),
+                    chart_format,
+                )
+                if (cached_report := cache.get(keys[name])) is not None:
+                    cached[name] = cached_report
+
+    names_to_compute = [name for name in names if name not in cached]
+    with profiler.stage("summarize"):
+        summaries = summarize_frame(df, names_to_compute)
+    with profiler.stage("group"):
+        frequency_tables = group_frame(df, names_to_compute, summaries, **grouping)
+
+    for name in names:
+        if name in cached:
+            yield name, cached[name]
+        else:
+            yield name, (summaries[name], frequency_tables[name], keys.get(name))
+
+
+def _iter_stratified_results(df, names, stratify_by, profiler, grouping, strata):
+    """Yields the name of each variable in `names`, with its summary, frequency table,
+    and cache key; other than `stratify_by`, each variable is yielded once per stratum
+    of `stratify_by`, with the stratum's summary and frequency table.
+
+    The data frame is split into strata once (see `stratify_frame`), and each stratum's
+    summaries and frequency tables are computed together, as they would be for a data
+    frame of only the stratum's rows. The name of each stratum of a variable is
+    recorded in `strata`, with the variable and the stratum's value and chart name.
+
+    The cache key is `None`, so the report is keyed by a hash of the summary and
+    frequency table.
+    """
+    stratified_names = [name for name in names if name != stratify_by]
+    with profiler.stage("stratify"):
+        stratified = list(stratify_frame(df, stratify_by))
+
+    summaries = []
+    frequency_tables = []
+    for _, stratum_df in stratified:
+        with profiler.stage("summarize"):
+            summaries.append(summarize_frame(stratum_df, stratified_names))
+        with profiler.stage("group"):
+            frequency_tables.append(
+                group_frame(stratum_df, stratified_names, summaries[-1], **grouping)
+            )
+
+    for name in names:
+        if name == stratify_by:
+            # The strata of the stratifying variable would each have one group
+            with profiler.stage("summarize"):
+                summary = summarize_frame(df, [name])
+            with profiler.stage("group"):
+                frequency_table = group_frame(df, [name], summary, **grouping)
+            yield name, (summary[name], frequency_table[name], None)
+            continue
+        for i, (value, _) in enumerate(stratified):
+            if pd.isna(value):
+                stratum_name = f"{name} ({stratify_by} missing)"
+            else:
+                stratum_name = f"{name} ({stratify_by} = {value})"
+            strata[stratum_name] = {
+                "variable": name,
+                "stratum": value,
+                # Values can contain characters that aren't allowed in file names
+                "chart_name": f"{name}.{stratify_by}_{i}",
+            }
+            yield stratum_name, (summaries[i][name], frequency_tables[i][name], None)
+
+
+def _iter_results_in_chunks(
+    path, variable_types, chunksize, profiler, approximate=False, grouping=None
+):
+    """Yields the name of each variable, with its summary, frequency table, and cache
+    key, having streamed the cohort through per-column accumulators.
+
+    If `chunksize` is `None`, then `STREAMING_CHUNKSIZE` rows are read at a time, so
+    that approximate accumulators summarize the cohort without loading it into memory.
+
+    The cache key is `None`, so the report is keyed by a hash of the summary and
+    frequency table.
+    """
+    if chunksize is None:
+        chunksize = STREAMING_CHUNKSIZE
+    chunks = iter_study_cohort(path, chunksize, variable_types, infer_categories=False)
+
+    # Loading and accumulating are interleaved, so they're recorded as one stage
+    with profiler.stage("accumulate"):
+        accumulators = accumulate(chunks, approximate=approximate)
+
+    yield from _iter_accumulated_results(accumulators, profiler, grouping)
+
+
+def _iter_results_incrementally(
+    path, variable_types, chunksize, profiler, approximate, grouping, state_dir
+):
+    """Yields the name of each variable, with its summary, frequency table, and cache
+    key, having fed the rows that were appended to the cohort since the last report
+    to the accumulators of the last report.
+
+    If there isn't a state for the cohort, or the rows that the state's accumulators
+    consumed have changed, then every row is read. Afterwards, the state is saved.
+    """
+    key = make_key(repr(variable_types), repr(approximate))
+    state = incremental.load_state(state_dir, path, key)
+    size = path.stat().st_size
+
+    with profiler.stage("hash"):
+        offset = state.offset if state is not None else 0
+        prefix_digest, digest = incremental.hash_file(path, offset, size)
+
+    if state is not None and prefix_digest == state.digest:
+        accumulators = state.accumulators
+    else:
+        accumulators, offset = {}, 0
+
+    if chunksize is None:
+        chunksize = STREAMING_CHUNKSIZE
+    chunks = iter_study_cohort(
+        path, chunksize, variable_types, offset, infer_categories=False
+    )
+    with profiler.stage("accumulate"):
+        accumulators = accumulate(
+            chunks, approximate=approximate, accumulators=accumulators
+        )
+
+    # If the last row is incomplete, or if rows were appended while the cohort was
+    # read, then the accumulators didn't consume exactly the first `size` bytes
+    if incremental.ends_with_newline(path) and path.stat().st_size == size:
+        with profiler.stage("save_state"):
+            state = incremental.CohortState(key, size, digest, accumulators)
+            incremental.save_state(state_dir, path, state)
+
+    yield from _iter_accumulated_results(accumulators, profiler, grouping)
+
+
+def _iter_results_out_of_core(
+    path,
+    variable_types,
+    chunksize,
+    profiler,
+    approximate,
+    grouping,
+    memory_budget,
+    spill_dir,
+):
+    """Yields the name of each variable, with its summary, frequency table, and cache
+    key, having streamed the cohort through per-column accumulators that are spilled
+    to disk when they hold more than `memory_budget` bytes.
+
+    Each variable's spilled accumulators are merged just before its summary and
+    frequency table are computed, so only one variable's merged accumulator is held in
+    memory at a time.
+    """
+    if chunksize is None:
+        chunksize = STREAMING_CHUNKSIZE
+    chunks = iter_study_cohort(path, chunksize, variable_types, infer_categories=False)
+    accumulators = outofcore.accumulate_out_of_core(
+        chunks, memory_budget, spill_dir, approximate
+    )
+    # Reading and spilling happen before the first variable is merged
+    with profiler.stage("accumulate"):
+        accumulators = _peek(accumulators)
+
+    yield from _iter_accumulated_results(accumulators, profiler, grouping)
+
+
+def _peek(iterator):
+    """Advances `iterator` to its first item, and returns an iterator over all items."""
+    iterator = iter(iterator)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iter(())
+    return itertools.chain([first], iterator)
+
+
+def _iter_accumulated_results(accumulators, profiler, grouping=None):
+    """Yields the name of each variable, with its summary, frequency table, and cache
+    key, from `accumulators`; either a mapping of names to accumulators, or an iterable
+    of names and accumulators."""
+    grouping = {} if grouping is None else grouping
+    if isinstance(accumulators, dict):
+        accumulators = accumulators.items()
+    for name, accumulator in accumulators:
         if name == "patient_id":
             continue
 
-        transformed_series = change_binary_to_categorical(series=series)
+        with profiler.stage("summarize", name):
+            summarized_series = accumulator.summarize()
+        with profiler.stage("group", name):
+            grouped_series = accumulator.group(**grouping)
+        yield name, (summarized_series, grouped_series, None)
 
-        summarized_series = summarize(transformed_series)
 
-        grouped_series = group(transformed_series)
-        redacted_series = redact(grouped_series)
-        figure = plot(redacted_series)
-        path_to_figure = Path(output_dir) / f"{name}.png"
-        save(figure, path_to_figure)
+def _make_variable_report(
+    name,
+    summarized_series,
+    grouped_series,
+    redacted_series,
+    redaction,
+    chart_format="png",
+    cache=None,
+    key=None,
+    profiler=None,
+):
+    """Makes the report for a variable from its summary, frequency table, redacted
+    frequency table, and record of redaction (see `redact_tables`).
+
+    The report's chart is encoded, but not saved (see `_save_chart`).
+
+    If `cache` is given but `key` isn't, then the report is keyed by a hash of the
+    variable's summary and frequency table, the redaction thresholds, and the chart
+    format.
+
+    This is a module-level function, so that it can be shipped to a worker process.
+    """
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    if cache is not None and key is None:
+        key = make_key(
+            name,
+            hash_series(summarized_series),
+            hash_series(grouped_series),
+            repr({k: v for k, v in redaction.items() if k != "cells"}),
+            chart_format,
+        )
+        if (cached := cache.get(key)) is not None:
+            with profiler.stage("read_cache", name):
+                return _read_cached_variable_report(cached)
+
+    with profiler.stage("plot", name):
+        figure = _get_renderer().plot(redacted_series)
+    with profiler.stage("encode", name):
+        chart = encode(figure, chart_format, salt=name)
+
+    if cache is not None:
+        with profiler.stage("write_cache", name):
+            cache.put(
+                key,
+                {
+                    "written_report": summarized_series,
+                    "redacted": redacted_series,
+                    "redaction": redaction,
+                    "figure": chart,
+                },
+            )
+
+    return {
+        "written_report": summarized_series,
+        "redaction": redaction,
+        "chart": chart,
+    }
 
-        report_dict = {
-            "written_report": summarized_series,
-            "graph": str(path_to_figure.name),
-        }
-        reports[name] = report_dict
 
-    html = template.render(reports=reports)
+def _make_profiled_variable_report(*args):
+    """Makes the report for a variable, as `_make_variable_report` does, and returns it
+    with the records of its stages."""
+    profiler = Profiler()
+    report_dict = _make_variable_report(*args, profiler=profiler)
+    return report_dict, profiler.records
 
-    with open(
-        f"{output_dir}/descriptives_{path.stem}.html", "w", encoding="utf-8"
-    ) as f:
-        f.write(html)
-        print(f"Created cohort report at {output_dir}descriptives_{path.stem}.html")
+
+def _read_cached_variable_report(cached):
+    return {
+        "written_report": cached["written_report"],
+        "redaction": cached["redaction"],
+        "chart": cached["figure"],
+    }
+
+
+def _get_chart_name(name, strata):
+    """Gets the name of the file, without its extension, of the chart for `name`."""
+    if name in strata:
+        return strata[name]["chart_name"]
+    return name
+
+
+def _save_chart(name, report_dict, output_dir, chart_format, self_contained, writer):
+    """Queues the variable's encoded chart to be written by `writer`, or, if
+    `self_contained` is `True`, inlines it.
+
+    Returns the variable's report with its encoded chart replaced by the keys that the
+    template uses to show the chart: either "svg", an SVG element, or "graph", the
+    source of an image.
+    """
+    report_dict = dict(report_dict)
+    chart = report_dict.pop("chart")
+    if not self_contained:
+        path_to_figure = Path(output_dir) / f"{name}.{chart_format}"
+        writer.write(path_to_figure, chart)
+        report_dict["graph"] = str(path_to_figure.name)
+    elif chart_format == "svg":
+        # Drops the XML declaration and doctype, which aren't allowed in HTML
+        svg = chart.decode("utf-8")
+        report_dict["svg"] = svg[svg.index("<svg") :]
+    else:
+        data = base64.b64encode(chart).decode("ascii")
+        report_dict["graph"] = f"data:image/{chart_format};base64,{data}"
+    return report_dict
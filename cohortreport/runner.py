@@ -0,0 +1,183 @@
+"""Runs `make_report` over several input files, optionally concurrently."""
+
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from cohortreport.utils import estimate_memory
+
+
+@dataclass
+class FileResult:
+    """The outcome of making a report for an input file."""
+
+    path: Path
+    seconds: float
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def run_reports(paths: List[Path], config: Dict) -> List[FileResult]:
+    """Makes a report for each input file, and returns the outcome for each file.
+
+    An error in one input file is recorded in its outcome; it doesn't stop the reports
+    for the other input files from being made.
+
+    If `config["file_workers"]` is given, then the input files are processed in this
+    number of worker processes. If `config["memory_budget"]` (in megabytes) is also
+    given, then a file isn't started while the estimated memory of the files that are
+    being processed, plus that of the file, would exceed it. A file is always started
+    if no other files are being processed.
+
+    If a worker process dies, for example because it was OOM-killed, then the files
+    that were being processed are retried one at a time, in a new pool, so that the
+    file that killed it is recorded as failed and the other files are still processed.
+
+    Raises:
+        ValueError: `config["file_workers"]` wasn't a number of processes. The other
+            options are checked by `make_report`, for each input file.
+    """
+    file_workers = config["file_workers"]
+    if file_workers is not None and (
+        isinstance(file_workers, bool)
+        or not isinstance(file_workers, int)
+        or file_workers < 1
+    ):
+        raise ValueError("`file_workers` must be a number of processes")
+    options = {
+        "output_dir": config["output_path"],
+        "variable_types": config["variable_types"],
+        "chunksize": config["chunksize"],
+        "workers": config["workers"],
+        "cache_dir": config["cache_dir"],
+        "cache_max_size": config["cache_max_size"],
+        "use_cache": config["use_cache"],
+        "profile": config["profile"],
+        "profile_to_stderr": config["profile_to_stderr"],
+        "approximate": config["approximate"],
+        "bins": config["bins"],
+        "max_categories": config["max_categories"],
+        "state_dir": config["state_dir"],
+        "redaction_thresholds": config["redaction_thresholds"],
+        "chart_format": config["chart_format"],
+        "self_contained": config["self_contained"],
+        "spill_threshold": config["spill_threshold"],
+        "spill_dir": config["spill_dir"],
+        "column_budget": config["column_budget"],
+        "input_cache_dir": config["input_cache_dir"],
+        "input_cache_max_size": config["input_cache_max_size"],
+        "stratify_by": config["stratify_by"],
+    }
+    if config["file_workers"] is None:
+        return [_run_report(path, options) for path in paths]
+
+    budget = None
+    if config["memory_budget"] is not None:
+        budget = config["memory_budget"] * 1024 * 1024
+
+    results = [None] * len(paths)
+    pending = list(enumerate(paths))
+    running = {}  # future -> (index of path, estimated memory, start time)
+    # The files that were being processed when a worker process died. Any of them may
+    # have killed it, so each is retried on its own; if it kills a worker again, then
+    # it is recorded as failed.
+    retried = set()
+    executor = ProcessPoolExecutor(max_workers=config["file_workers"])
+    try:
+        while pending or running:
+            while pending and len(running) < config["file_workers"]:
+                if running and (
+                    pending[0][0] in retried or _any_retried(running, retried)
+                ):
+                    break
+                estimate = _estimate_memory_or_zero(pending[0][1])
+                in_use = sum(memory for _, memory, _ in running.values())
+                if running and budget is not None and in_use + estimate > budget:
+                    break
+                i, path = pending.pop(0)
+                future = executor.submit(_run_report, path, options)
+                running[future] = (i, estimate, time.perf_counter())
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            if any(_is_broken(future) for future in done):
+                # Every file that is being processed fails, so wait for them all,
+                # and then replace the pool
+                done, _ = wait(running)
+                executor.shutdown()
+                executor = ProcessPoolExecutor(max_workers=config["file_workers"])
+
+            for future in done:
+                i, _, start = running.pop(future)
+                if not _is_broken(future):
+                    results[i] = future.result()
+                elif i not in retried:
+                    retried.add(i)
+                    pending.insert(0, (i, paths[i]))
+                else:
+                    error = future.exception()
+                    print(
+                        f"Failed to create cohort report for {paths[i]}: {error!r}",
+                        file=sys.stderr,
+                    )
+                    results[i] = FileResult(
+                        paths[i], time.perf_counter() - start, repr(error)
+                    )
+    finally:
+        executor.shutdown()
+
+    # Results are returned in the order of the input files, not in the order in which
+    # they finished
+    return results
+
+
+def _is_broken(future):
+    """Checks whether `future` failed because its worker process died; for example,
+    because it was OOM-killed."""
+    return isinstance(future.exception(), BrokenProcessPool)
+
+
+def _any_retried(running, retried):
+    return any(i in retried for i, _, _ in running.values())
+
+
+def _estimate_memory_or_zero(path):
+    try:
+        return estimate_memory(path)
+    except OSError:
+        # The file doesn't exist, so make_report will fail quickly
+        return 0
+
+
+def _run_report(path, options):
+    """Makes a report for the input file at `path`, recording the time taken and any
+    error rather than raising it.
+
+    This is a module-level function, so that it can be shipped to a worker process.
+    """
+    # Importing make_report imports pandas, numpy, and matplotlib, which is slow; it's
+    # deferred until a report is made, so that the CLI starts quickly
+    from cohortreport.report import make_report
+
+    start = time.perf_counter()
+    try:
+        make_report(path=path, **options)
+    except Exception as e:
+        print(f"Failed to create cohort report for {path}: {e!r}", file=sys.stderr)
+        # The error is returned as a string, because not all errors can be pickled
+        return FileResult(path, time.perf_counter() - start, repr(e))
+    return FileResult(path, time.perf_counter() - start)
+
+
+def print_summary(results: List[FileResult]) -> None:
+    """Prints the time taken, and whether it succeeded, for each input file."""
+    print("Cohort report timings:")
+    for result in results:
+        status = "ok" if result.succeeded else "failed"
+        print(f"  {result.path}: {result.seconds:.2f}s ({status})")
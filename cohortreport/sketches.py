@@ -0,0 +1,280 @@
+"""Sketches summarize a continuous column in constant memory, with bounded error.
+
+Each sketch consumes a column one chunk at a time and can be merged with another sketch
+of the same kind, so the sketches of several chunks, or of several worker processes,
+can be combined.
+
+* `QuantileSketch` is a KLL sketch [1]. It holds about `3 * k` values, however many
+  units it has consumed. The rank of a quantile is within about `1.7%` of the number of
+  units of the rank of the exact quantile, with probability 99%, for the default `k`
+  of 200.
+* `DistinctCountSketch` is a HyperLogLog sketch [2]. It holds `2 ** p` one-byte
+  registers. The relative standard error of the number of distinct values is
+  `1.04 / sqrt(2 ** p)`; that is, about `0.8%` for the default `p` of 14.
+* `ContinuousSketch` combines both with the exact count, mean, standard deviation,
+  minimum, and maximum of the column, which can be computed in one pass.
+
+[1] Z. Karnin, K. Lang, and E. Liberty, 'Optimal quantile approximation in streams',
+2016. Available: https://arxiv.org/abs/1603.05346
+
+[2] P. Flajolet et al., 'HyperLogLog: the analysis of a near-optimal cardinality
+estimation algorithm', 2007. Available:
+https://algo.inria.fr/flajolet/Publications/FlFuGaMe07.pdf
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_K = 200
+
+DEFAULT_P = 14
+
+# The capacity of each level of a KLL sketch is this fraction of the capacity of the
+# level above it.
+_CAPACITY_DECAY = 2 / 3
+
+
+class QuantileSketch:
+    """Approximates the quantiles of the values that it has consumed.
+
+    The sketch holds levels of values. A value at level `h` stands for `2 ** h` units.
+    When a level is over its capacity, its values are sorted, and every other value is
+    promoted to the next level; which of each pair is promoted is random. The sketch's
+    random number generator is seeded, so the same values, in the same order, give the
+    same quantiles.
+
+    Args:
+        k: the capacity of the top level. Larger values of `k` use more memory but give
+            smaller errors.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes held by the sketch's levels."""
+        return sum(level.nbytes for level in self._levels)
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds `values`, each of which stands for one unit."""
+        self._add(0, np.asarray(values, dtype=float))
+        self.n += len(values)
+        self._compress()
+
+    def update_counts(self, values: np.ndarray, counts: np.ndarray) -> None:
+        """Adds `values`, each of which stands for the corresponding number of units.
+
+        A value that stands for `c` units is added at each level `h` for which bit `h`
+        of `c` is set, so no error is introduced.
+        """
+        values = np.asarray(values, dtype=float)
+        counts = np.asarray(counts, dtype="int64")
+        if len(counts) == 0:
+            return
+        for level in range(int(counts.max()).bit_length()):
+            self._add(level, values[(counts >> level) & 1 == 1])
+        self.n += int(counts.sum())
+        self._compress()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Adds the values in another sketch."""
+        for level, values in enumerate(other._levels):
+            self._add(level, values)
+        self.n += other.n
+        self._compress()
+
+    def _add(self, level, values):
+        while len(self._levels) <= level:
+            self._levels.append(np.empty(0))
+        self._levels[level] = np.concatenate([self._levels[level], values])
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(math.ceil(self.k * _CAPACITY_DECAY**depth), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self._levels):
+            values = self._levels[level]
+            if len(values) > self._capacity(level):
+                values = np.sort(values)
+                # If there are an odd number of values, then the largest stays
+                n_paired = len(values) - len(values) % 2
+                offset = self._rng.integers(2)
+                self._levels[level] = values[n_paired:]
+                self._add(level + 1, values[offset:n_paired:2])
+            level += 1
+
+    def _sorted(self):
+        """Returns the values in the sketch, sorted, and the cumulative number of units
+        that they stand for."""
+        values = np.concatenate(self._levels)
+        weights = np.concatenate(
+            [
+                np.full(len(values), 2**level)
+                for level, values in enumerate(self._levels)
+            ]
+        )
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs) -> np.ndarray:
+        """Returns the approximate `qs` quantiles (between 0 and 1)."""
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        values, cumulative = self._sorted()
+        targets = np.maximum(np.asarray(qs, dtype=float) * cumulative[-1], 1)
+        positions = np.searchsorted(cumulative, targets, side="left")
+        return values[np.minimum(positions, len(values) - 1)]
+
+    def histogram(self, bin_edges: np.ndarray) -> np.ndarray:
+        """Returns the approximate number of units in each bin, as `numpy.histogram`
+        would; that is, every bin but the last is half-open.
+
+        `bin_edges` must span the minimum and maximum values. The counts sum to the
+        number of units, and the count in each bin is within twice the rank error of
+        the exact count.
+        """
+        values, cumulative = self._sorted()
+        cumulative = np.concatenate([[0], cumulative])
+        inner_edges = np.searchsorted(values, bin_edges[1:-1], side="left")
+        bounds = np.concatenate([[0], cumulative[inner_edges], [cumulative[-1]]])
+        return np.diff(bounds).astype("int64")
+
+
+class DistinctCountSketch:
+    """Approximates the number of distinct values that it has consumed.
+
+    Args:
+        p: the number of bits of each value's hash that choose its register. The sketch
+            has `2 ** p` registers.
+    """
+
+    def __init__(self, p: int = DEFAULT_P):
+        self.p = p
+        self._registers = np.zeros(2**p, dtype="uint8")
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes held by the sketch's registers."""
+        return self._registers.nbytes
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds `values`."""
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_array(np.asarray(values))
+        registers = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        remaining = hashes << np.uint64(self.p)
+        # The rank is the position of the first set bit of the remaining bits
+        ranks = np.full(len(hashes), 64 - self.p + 1, dtype="uint8")
+        is_set = remaining != 0
+        highest_bits = np.floor(np.log2(remaining[is_set].astype(float)))
+        ranks[is_set] = 64 - highest_bits.astype("uint8")
+        np.maximum.at(self._registers, registers, ranks)
+
+    def merge(self, other: "DistinctCountSketch") -> None:
+        """Adds the values in another sketch with the same `p`."""
+        np.maximum(self._registers, other._registers, out=self._registers)
+
+    def count(self) -> int:
+        """Returns the approximate number of distinct values."""
+        m = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self._registers.astype(float))
+        n_zeros = int((self._registers == 0).sum())
+        if estimate <= 2.5 * m and n_zeros:
+            # Linear counting is more accurate for small numbers of distinct values
+            estimate = m * math.log(m / n_zeros)
+        return int(round(estimate))
+
+
+class ContinuousSketch:
+    """Summarizes a continuous column in constant memory.
+
+    The count, mean, standard deviation, minimum, and maximum are exact (up to
+    floating-point error); the quantiles, the number of distinct values, and
+    histograms are approximate.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, p: int = DEFAULT_P):
+        self.quantile_sketch = QuantileSketch(k)
+        self.distinct_count_sketch = DistinctCountSketch(p)
+        self.n = 0
+        self.mean = 0.0
+        self._sum_of_squares = 0.0  # Of the differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def std(self) -> float:
+        if self.n < 2:
+            return np.nan
+        return math.sqrt(self._sum_of_squares / (self.n - 1))
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes held by the sketch's quantile and distinct count
+        sketches."""
+        return self.quantile_sketch.nbytes + self.distinct_count_sketch.nbytes
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds `values`, which mustn't be missing."""
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        mean = values.mean()
+        self._add_moments(
+            len(values),
+            mean,
+            ((values - mean) ** 2).sum(),
+            values.min(),
+            values.max(),
+        )
+        self.quantile_sketch.update(values)
+        self.distinct_count_sketch.update(values)
+
+    def update_counts(self, values: np.ndarray, counts: np.ndarray) -> None:
+        """Adds `values`, each of which stands for the corresponding number of units."""
+        values = np.asarray(values, dtype=float)
+        counts = np.asarray(counts, dtype="int64")
+        n = int(counts.sum())
+        if n == 0:
+            return
+        mean = (values * counts).sum() / n
+        self._add_moments(
+            n,
+            mean,
+            (counts * (values - mean) ** 2).sum(),
+            values[counts > 0].min(),
+            values[counts > 0].max(),
+        )
+        self.quantile_sketch.update_counts(values, counts)
+        self.distinct_count_sketch.update(values[counts > 0])
+
+    def merge(self, other: "ContinuousSketch") -> None:
+        """Adds the values in another sketch."""
+        if other.n == 0:
+            return
+        self._add_moments(
+            other.n, other.mean, other._sum_of_squares, other.min, other.max
+        )
+        self.quantile_sketch.merge(other.quantile_sketch)
+        self.distinct_count_sketch.merge(other.distinct_count_sketch)
+
+    def _add_moments(self, n, mean, sum_of_squares, minimum, maximum):
+        # Chan et al.'s method for combining the moments of two sets of values
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self._sum_of_squares += sum_of_squares + delta**2 * self.n * n / total
+        self.n = total
+        self.min = min(self.min, float(minimum))
+        self.max = max(self.max, float(maximum))
@@ -0,0 +1,84 @@
+"""Keys, atomic writes, and eviction for the files that are kept from one report to the
+next: the cache of the report for each variable, the cache of parsed csv input files,
+and the state of each input file that is reported incrementally.
+
+Each file is written to a temporary file in the same directory, which then replaces the
+file, so a report that fails, or that is made at the same time as another report,
+doesn't leave a partial file.
+"""
+
+import contextlib
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, Union
+
+from cohortreport import __version__
+
+
+def make_key(*parts: str) -> str:
+    """Makes a key from the given parts and the version of cohort-report."""
+    h = hashlib.sha256(__version__.encode("utf8"))
+    for part in parts:
+        h.update(b"\0")
+        h.update(part.encode("utf8"))
+    return h.hexdigest()
+
+
+def make_path_key(path: Union[Path, str]) -> str:
+    """Makes a key from the name of the file at `path` and a hash of its resolved path,
+    so that files with the same name in different directories have different keys."""
+    path_hash = hashlib.sha256(str(Path(path).resolve()).encode("utf8")).hexdigest()
+    return f"{Path(path).name}.{path_hash[:16]}"
+
+
+@contextlib.contextmanager
+def replace_atomically(path: Union[Path, str]) -> Iterator[Path]:
+    """Returns a context manager that yields the path to a temporary file, which
+    replaces the file at `path` if the block exits without an error, and is removed
+    otherwise."""
+    fd, tmp_path = tempfile.mkstemp(dir=Path(path).parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        yield Path(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+
+
+def dump_pickle(path: Union[Path, str], value: Any) -> None:
+    """Pickles `value` to the file at `path`, atomically."""
+    with replace_atomically(path) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def evict_least_recently_used(
+    paths: Iterable[Path], max_size: int, keep: Optional[Path] = None
+) -> None:
+    """Removes the least recently used files of `paths`, by modification time, other
+    than `keep`, until the files and `keep` are no larger than `max_size` bytes.
+
+    Files that another process removes in the meantime are skipped, so a directory of
+    files can be shared by several processes.
+    """
+    entries = []
+    for path in paths:
+        if keep is not None and path == Path(keep):
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    size = sum(entry_size for _, entry_size, _ in entries)
+    if keep is not None and Path(keep).exists():
+        size += Path(keep).stat().st_size
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size:
+            break
+        path.unlink(missing_ok=True)
+        size -= entry_size
@@ -1,7 +1,39 @@
+from pathlib import Path
 from typing import Dict
 
 
-DEFAULTS = {"output_path": "cohort_reports_outputs/", "variable_types": None}
+# How many times larger than the file on disk a loaded cohort is assumed to be. These
+# are deliberately pessimistic: it's better to run fewer files at once than to be
+# OOM-killed.
+EXPANSION_FACTORS = {".gz": 8}
+DEFAULT_EXPANSION_FACTOR = 2
+
+DEFAULTS = {
+    "output_path": "cohort_reports_outputs/",
+    "variable_types": None,
+    "chunksize": None,
+    "workers": None,
+    "file_workers": None,
+    "memory_budget": None,
+    "cache_dir": None,
+    "cache_max_size": 1024,
+    "use_cache": True,
+    "profile": False,
+    "profile_to_stderr": False,
+    "approximate": False,
+    "bins": "auto",
+    "max_categories": None,
+    "state_dir": None,
+    "redaction_thresholds": None,
+    "chart_format": "png",
+    "self_contained": False,
+    "spill_threshold": None,
+    "spill_dir": None,
+    "column_budget": None,
+    "input_cache_dir": None,
+    "input_cache_max_size": 4096,
+    "stratify_by": None,
+}
 
 
 def load_config(config) -> Dict:
@@ -20,3 +52,9 @@ def load_config(config) -> Dict:
     cfg = DEFAULTS.copy()
     cfg.update(config)
     return cfg
+
+
+def estimate_memory(path: Path) -> int:
+    """Estimates the number of bytes needed to load the input file at `path`."""
+    factor = EXPANSION_FACTORS.get(path.suffix, DEFAULT_EXPANSION_FACTOR)
+    return path.stat().st_size * factor
@@ -0,0 +1,77 @@
+"""Writes files in background threads, so that slow writes, such as those to a network
+filesystem, don't block the computation of the next variable's report."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple, Union
+
+
+# The number of threads that write files.
+DEFAULT_THREADS = 4
+
+# The number of files that can be queued or being written before `write` blocks.
+DEFAULT_MAX_PENDING = 16
+
+
+class BackgroundWriter:
+    """Writes files in a pool of background threads.
+
+    `write` returns once the file is queued, unless `max_pending` files are already
+    queued or being written, in which case it blocks until one of them has been written.
+    This back-pressure bounds the memory that is held by queued files. `flush` blocks
+    until every queued file has been written, and then checks that each file has the
+    expected size; it raises the first error that a write raised, if any.
+
+    Args:
+        threads: the number of threads that write files.
+        max_pending: the maximum number of files that can be queued or being written.
+    """
+
+    def __init__(
+        self, threads: int = DEFAULT_THREADS, max_pending: int = DEFAULT_MAX_PENDING
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="cohortreport-writer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = []
+        self._written: List[Tuple[Path, int]] = []
+
+    def write(self, path: Union[Path, str], data: bytes) -> None:
+        """Queues `data` to be written to `path`, replacing any existing file."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(_write_bytes, Path(path), data)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        self._written.append((Path(path), len(data)))
+
+    def flush(self) -> None:
+        """Blocks until every queued file has been written, and checks that each file
+        has the expected size."""
+        futures, self._futures = self._futures, []
+        written, self._written = self._written, []
+        for future in futures:
+            future.result()  # Raises the write's error, if any
+        for path, size in written:
+            if path.stat().st_size != size:
+                raise OSError(f"{path} has {path.stat().st_size} bytes, not {size}")
+
+    def close(self) -> None:
+        """Waits for queued files to be written, and stops the threads."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
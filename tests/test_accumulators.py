@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas import testing
+
+from cohortreport import accumulators, processing
+
+
+@pytest.fixture
+def cohort():
+    rng = np.random.default_rng(seed=1)
+    n = 1_000
+    return pd.DataFrame(
+        {
+            "patient_id": range(n),
+            "sex": rng.choice(["F", "M", None], size=n),
+            "has_copd": rng.integers(0, 2, size=n),
+            "age": rng.integers(18, 100, size=n),
+            "bmi": rng.normal(28, 5, size=n).round(1),
+            "diagnosed_on": pd.Series(
+                pd.Timestamp("2020-01-01")
+                + pd.to_timedelta(rng.integers(0, 1_000, size=n), unit="D")
+            )
+            .dt.strftime("%Y-%m-%d")
+            .where(rng.random(n) > 0.1),
+        }
+    )
+
+
+def chunk(df, chunksize):
+    # As with the csv parser, an empty frame is one empty chunk
+    for start in range(0, max(len(df), 1), chunksize):
+        yield df.iloc[start : start + chunksize]
+
+
+variable_types = {
+    "sex": "categorical",
+    "has_copd": "binary",
+    "age": "int",
+    "bmi": "float",
+    "diagnosed_on": "date",
+}
+
+
+@pytest.mark.parametrize("rows", ["all", "none", "missing"])
+@pytest.mark.parametrize("name", ["sex", "has_copd", "age", "bmi", "diagnosed_on"])
+def test_accumulate_matches_in_memory(cohort, name, rows):
+    if rows == "none":
+        cohort = cohort.iloc[:0]
+    elif rows == "missing":
+        # Every value of the variable is missing, other than those of the variables
+        # that can't be missing
+        cohort = cohort.copy()
+        if name not in ("has_copd", "age"):
+            cohort[name] = None
+    accs = accumulators.accumulate(chunk(cohort, 64), variable_types)
+
+    series = processing.coerce_columns(cohort, variable_types)[name]
+    series = processing.change_binary_to_categorical(series)
+    testing.assert_series_equal(accs[name].summarize(), processing.summarize(series))
+    testing.assert_series_equal(accs[name].group(), processing.group(series))
+
+
+def test_group_with_inferred_category_labels(tmp_path):
+    path = tmp_path / "input.csv"
+    pd.DataFrame({"imd": ["01", "1", None, "2"] * 10}).to_csv(path, index=False)
+    types = {"imd": "categorical"}
+
+    chunks = processing.iter_study_cohort(path, 3, types, infer_categories=False)
+    accs = accumulators.accumulate(chunks)
+
+    # "01" and "1" are the same label, which is a float, as "imd" has missing values
+    series = processing.load_study_cohort(path, types)["imd"]
+    assert list(series.cat.categories) == [1.0, 2.0]
+    testing.assert_series_equal(accs["imd"].group(), processing.group(series))
+
+
+def test_group_with_max_categories(cohort):
+    accs = accumulators.accumulate(chunk(cohort, 64), variable_types)
+
+    series = processing.coerce_columns(cohort, variable_types)["age"].astype("category")
+    acc = accumulators.ColumnAccumulator("age")
+    acc.update(series)
+    testing.assert_series_equal(
+        acc.group(max_categories=5), processing.group(series, max_categories=5)
+    )
+    # Continuous variables aren't folded
+    assert len(accs["age"].group(max_categories=5)) > 6
+
+
+def test_merge(cohort):
+    first = accumulators.accumulate(chunk(cohort.iloc[:500], 100), variable_types)
+    second = accumulators.accumulate(chunk(cohort.iloc[500:], 100), variable_types)
+    whole = accumulators.accumulate([cohort], variable_types)
+
+    first["bmi"].merge(second["bmi"])
+
+    testing.assert_series_equal(first["bmi"].group(), whole["bmi"].group())
+    testing.assert_series_equal(first["bmi"].summarize(), whole["bmi"].summarize())
+
+
+def test_single_value():
+    acc = accumulators.ColumnAccumulator("bmi")
+    acc.update(pd.Series([25.0], name="bmi"))
+
+    exp = processing.group(pd.Series([25.0], name="bmi"))
+    testing.assert_series_equal(acc.group(), exp)
+
+
+@pytest.mark.parametrize("name", ["sex", "has_copd", "age", "bmi"])
+def test_accumulate_approximately_with_few_values_is_exact(cohort, name):
+    exact = accumulators.accumulate(chunk(cohort, 64), variable_types)
+    approximate = accumulators.accumulate(
+        chunk(cohort, 64), variable_types, approximate=True
+    )
+
+    testing.assert_series_equal(approximate[name].summarize(), exact[name].summarize())
+    testing.assert_series_equal(approximate[name].group(), exact[name].group())
+
+
+def test_accumulate_approximately_with_many_values():
+    rng = np.random.default_rng(seed=1)
+    series = pd.Series(rng.normal(28, 5, size=50_000), name="bmi")
+    acc = accumulators.ApproximateColumnAccumulator("bmi", max_exact_values=1_000)
+
+    for start in range(0, len(series), 5_000):
+        acc.update(series.iloc[start : start + 5_000])
+
+    summary = acc.summarize()
+    exp = processing.summarize(series)
+    assert acc._sketch is not None
+    assert summary["count"] == exp["count"]
+    assert summary["mean"] == pytest.approx(exp["mean"])
+    assert summary["min"] == exp["min"]
+    assert summary["50% (approx.)"] == pytest.approx(exp["50%"], abs=0.5)
+    assert summary["distinct values (approx.)"] == pytest.approx(50_000, rel=0.03)
+    assert acc.group().sum() == len(series)
+
+
+def test_merge_approximately():
+    rng = np.random.default_rng(seed=1)
+    series = pd.Series(rng.normal(28, 5, size=20_000), name="bmi")
+    sketched = accumulators.ApproximateColumnAccumulator("bmi", max_exact_values=1_000)
+    sketched.update(series.iloc[:10_000])
+    exact = accumulators.ApproximateColumnAccumulator("bmi", max_exact_values=1_000)
+    exact.update(series.iloc[10_000:10_500])
+
+    exact.merge(sketched)
+
+    assert exact._sketch is not None
+    assert exact.summarize()["count"] == 10_500
+
+
+def test_memory_usage():
+    rng = np.random.default_rng(seed=1)
+    series = pd.Series(rng.normal(28, 5, size=50_000), name="bmi")
+    exact = accumulators.ColumnAccumulator("bmi")
+    approx = accumulators.ApproximateColumnAccumulator("bmi", max_exact_values=1_000)
+
+    exact.update(series)
+    approx.update(series)
+
+    # A value and a count for each distinct value
+    assert exact.memory_usage() >= 50_000 * 16
+    assert approx.memory_usage() == approx._sketch.nbytes < 50_000 * 16
+
+
+def test_group_with_number_of_bins(cohort):
+    accs = accumulators.accumulate(chunk(cohort, 64), variable_types)
+
+    exp = processing.group(cohort["bmi"], bins=5)
+    testing.assert_series_equal(accs["bmi"].group(bins=5), exp)
+
+
+@pytest.mark.parametrize(
+    "values", [["1", "2"] * 5 + ["a", "b"] * 5, ["1", "2"] * 5 + ["10", "3"] * 5]
+)
+def test_accumulate_categories_that_are_numbers_in_some_chunks(tmp_path, values):
+    path = tmp_path / "input.csv"
+    pd.DataFrame({"practice": values}).to_csv(path, index=False)
+    types = {"practice": "categorical"}
+    chunks = processing.iter_study_cohort(path, 10, types, infer_categories=False)
+
+    accs = accumulators.accumulate(chunks)
+
+    series = processing.load_study_cohort(path, types)["practice"]
+    testing.assert_series_equal(
+        accs["practice"].summarize(), processing.summarize(series)
+    )
+    testing.assert_series_equal(accs["practice"].group(), processing.group(series))
+
+
+def test_too_many_values(monkeypatch):
+    monkeypatch.setattr(accumulators, "MAX_VALUES", 100)
+    series = pd.Series(np.arange(200) / 10, name="bmi")
+    exact = accumulators.ColumnAccumulator("bmi")
+    approx = accumulators.ApproximateColumnAccumulator("bmi", max_exact_values=1_000)
+
+    with pytest.raises(accumulators.TooManyValuesError):
+        exact.update(series)
+    # An approximate accumulator sketches the values instead
+    approx.update(series)
+    assert approx.summarize()["count"] == 200
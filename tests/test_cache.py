@@ -0,0 +1,38 @@
+import os
+
+import pandas as pd
+
+from cohortreport import cache
+from cohortreport.storage import make_key
+
+
+def test_get_and_put(tmp_path):
+    result_cache = cache.ResultCache(tmp_path, max_size=1024)
+    key = make_key("bmi", "float64")
+
+    assert result_cache.get(key) is None
+    result_cache.put(key, {"figure": b"png"})
+    assert result_cache.get(key) == {"figure": b"png"}
+
+
+def test_evict(tmp_path):
+    result_cache = cache.ResultCache(tmp_path, max_size=300)
+    for i, key in enumerate(["a", "b", "c"]):
+        result_cache.put(key, {"figure": b"x" * 100})
+        # The least recently used entry is "a"
+        os.utime(tmp_path / f"{key}.pickle", (i, i))
+
+    result_cache.evict()
+
+    assert result_cache.get("a") is None
+    assert result_cache.get("b") is not None
+    assert result_cache.get("c") is not None
+
+
+def test_hash_series():
+    series = pd.Series([1, 2, 3], name="age")
+    assert cache.hash_series(series) == cache.hash_series(series.copy())
+    assert cache.hash_series(series) != cache.hash_series(series + 1)
+    assert cache.hash_series(series, index=False) == cache.hash_series(
+        series.set_axis([3, 4, 5]), index=False
+    )
@@ -0,0 +1,65 @@
+import hashlib
+
+import pytest
+
+from cohortreport import incremental
+from cohortreport.accumulators import ColumnAccumulator
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_bytes(b"patient_id,age\n1,20\n2,30\n")
+    return path
+
+
+@pytest.mark.parametrize("offset", [0, 14, 25])
+def test_hash_file(path, offset, monkeypatch):
+    monkeypatch.setattr(incremental, "BLOCK_SIZE", 4)
+    data = path.read_bytes()
+
+    prefix_digest, digest = incremental.hash_file(path, offset, len(data))
+
+    assert prefix_digest == hashlib.sha256(data[:offset]).hexdigest()
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_hash_file_with_offset_beyond_size(path):
+    prefix_digest, _ = incremental.hash_file(path, 100, path.stat().st_size)
+    assert prefix_digest is None
+
+
+def test_ends_with_newline(path, tmp_path):
+    assert incremental.ends_with_newline(path)
+
+    path.write_bytes(b"patient_id,age\n1,2")
+    assert not incremental.ends_with_newline(path)
+
+    path.write_bytes(b"")
+    assert not incremental.ends_with_newline(path)
+
+
+def test_save_and_load_state(path, tmp_path):
+    state_dir = str(tmp_path / "state")
+    state = incremental.CohortState(
+        "key", 25, "digest", {"age": ColumnAccumulator("age")}
+    )
+
+    incremental.save_state(state_dir, path, state)
+
+    loaded_state = incremental.load_state(state_dir, path, "key")
+    assert loaded_state.offset == 25
+    assert list(loaded_state.accumulators) == ["age"]
+
+
+def test_load_state_with_other_key(path, tmp_path):
+    state_dir = str(tmp_path / "state")
+    incremental.save_state(
+        state_dir, path, incremental.CohortState("key", 25, "digest", {})
+    )
+
+    assert incremental.load_state(state_dir, path, "other key") is None
+
+
+def test_load_state_without_state(path, tmp_path):
+    assert incremental.load_state(str(tmp_path / "state"), path, "key") is None
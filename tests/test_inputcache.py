@@ -0,0 +1,113 @@
+import os
+from unittest import mock
+
+import pandas as pd
+import pytest
+from pandas import testing
+
+from cohortreport import inputcache, processing
+
+
+@pytest.fixture
+def path_to_input_csv(tmp_path):
+    cohort = pd.DataFrame(
+        {
+            "patient_id": range(10),
+            "sex": ["M", "F", None, "F", "M"] * 2,
+            "age": range(10),
+            "bmi": [21.5, None, 30.25, 28.0, 19.75] * 2,
+        }
+    )
+    path = tmp_path / "input.csv.gz"
+    cohort.to_csv(path, index=False)
+    return path
+
+
+variable_types = {"sex": "categorical", "age": "int", "bmi": "float"}
+
+
+def test_get_loads_as_csv(tmp_path, path_to_input_csv):
+    input_cache = inputcache.InputCache(tmp_path / "cache", max_size=1024**2)
+
+    entry_path = input_cache.get(path_to_input_csv, variable_types)
+
+    assert entry_path.suffixes == [".csv", ".arrow"]
+    testing.assert_frame_equal(
+        processing.load_study_cohort(entry_path, variable_types),
+        processing.load_study_cohort(path_to_input_csv, variable_types),
+    )
+
+
+def test_get_converts_once(tmp_path, path_to_input_csv):
+    input_cache = inputcache.InputCache(tmp_path / "cache", max_size=1024**2)
+    first = input_cache.get(path_to_input_csv, variable_types)
+
+    with mock.patch.object(inputcache, "convert_csv_to_arrow") as convert:
+        with mock.patch.object(inputcache, "hash_file") as hash_file:
+            second = input_cache.get(path_to_input_csv, dict(variable_types))
+
+    assert second == first
+    convert.assert_not_called()
+    hash_file.assert_not_called()  # The size and modification time are unchanged
+
+
+def test_get_with_other_variable_types(tmp_path, path_to_input_csv):
+    input_cache = inputcache.InputCache(tmp_path / "cache", max_size=1024**2)
+    first = input_cache.get(path_to_input_csv, variable_types)
+
+    other_variable_types = {"sex": "categorical", "age": "float"}
+    second = input_cache.get(path_to_input_csv, other_variable_types)
+
+    assert second != first
+    assert first.exists()
+    testing.assert_frame_equal(
+        processing.load_study_cohort(second, other_variable_types),
+        processing.load_study_cohort(path_to_input_csv, other_variable_types),
+    )
+
+
+def test_get_with_changed_file(tmp_path, path_to_input_csv):
+    input_cache = inputcache.InputCache(tmp_path / "cache", max_size=1024**2)
+    stale = input_cache.get(path_to_input_csv, variable_types)
+    stale_other = input_cache.get(path_to_input_csv, {"age": "int"})
+
+    pd.DataFrame({"patient_id": [1], "sex": ["F"], "age": [1], "bmi": [1.0]}).to_csv(
+        path_to_input_csv, index=False
+    )
+    fresh = input_cache.get(path_to_input_csv, variable_types)
+
+    assert fresh != stale
+    assert not stale.exists()
+    assert not stale_other.exists()
+    assert len(processing.load_study_cohort(fresh, variable_types)) == 1
+
+
+def test_get_with_touched_file(tmp_path, path_to_input_csv):
+    input_cache = inputcache.InputCache(tmp_path / "cache", max_size=1024**2)
+    first = input_cache.get(path_to_input_csv, variable_types)
+
+    os.utime(path_to_input_csv, ns=(0, 0))
+    with mock.patch.object(inputcache, "convert_csv_to_arrow") as convert:
+        second = input_cache.get(path_to_input_csv, variable_types)
+
+    # The bytes are unchanged, so the entry isn't stale
+    assert second == first
+    convert.assert_not_called()
+
+
+def test_evict(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"input_{i}.csv"
+        pd.DataFrame({"patient_id": range(100), "age": i}).to_csv(path, index=False)
+        paths.append(path)
+    input_cache = inputcache.InputCache(tmp_path / "cache", max_size=0)
+    entries = []
+    for i, path in enumerate(paths):
+        entries.append(input_cache.get(path, {"age": "int"}))
+        # The least recently used entry is the first
+        os.utime(entries[-1], (i, i))
+
+    input_cache.evict(keep=entries[0])
+
+    assert [entry.exists() for entry in entries] == [True, False, False]
@@ -1,5 +1,6 @@
 import json
 import re
+import subprocess
 import sys
 from unittest import mock
 
@@ -70,3 +71,63 @@ def test_main(path_to_input_csv):
     output_html = path_to_output_html.read_text()
     src_attrs = re.findall(r'src="([\w\.]+)"', output_html)
     assert src_attrs == ["sex.png", "bmi.png", "has_copd.png"]
+
+
+def test_main_with_missing_input_file(path_to_input_csv):
+    path_to_output_dir = path_to_input_csv.parent
+    config = {
+        "output_path": str(path_to_output_dir),
+        "variable_types": {"bmi": "float"},
+    }
+    path_to_missing_csv = path_to_output_dir / "missing.csv"
+    test_argv = [
+        "",
+        "--config",
+        json.dumps(config),
+        str(path_to_missing_csv),
+        str(path_to_input_csv),
+    ]
+
+    with mock.patch.object(sys, "argv", test_argv):
+        with pytest.raises(SystemExit) as e:
+            __main__.main()
+
+    assert e.value.code == 1
+    # The missing input file doesn't stop the other input file
+    assert (path_to_output_dir / f"descriptives_{path_to_input_csv.stem}.html").exists()
+
+
+def test_import_defers_heavy_modules():
+    # Importing pandas, numpy, matplotlib, jinja2, and pkg_resources takes seconds, so
+    # they shouldn't be imported until a report is made
+    heavy_modules = ["pandas", "numpy", "matplotlib", "jinja2", "pkg_resources"]
+    code = (
+        "import sys, cohortreport.__main__; "
+        f"print([m for m in {heavy_modules!r} if m in sys.modules])"
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == "[]"
+
+
+def test_version_does_not_import_heavy_modules():
+    # -X importtime lists every module that is imported, so this checks what --version
+    # imports without timing it, which would be flaky on slow machines
+    heavy_modules = {"pandas", "numpy", "matplotlib", "jinja2", "pkg_resources"}
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "cohortreport", "--version"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    imported = {
+        line.split("|")[-1].strip().split(".")[0]
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    assert imported & heavy_modules == set()
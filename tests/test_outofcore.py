@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas import testing
+
+from cohortreport import accumulators, outofcore, processing
+
+
+@pytest.fixture
+def cohort():
+    rng = np.random.default_rng(seed=1)
+    n = 1_000
+    return pd.DataFrame(
+        {
+            "patient_id": range(n),
+            "sex": rng.choice(["F", "M", None], size=n),
+            "age": rng.integers(18, 100, size=n),
+            "bmi": rng.normal(28, 5, size=n).round(1),
+        }
+    )
+
+
+def chunk(df, chunksize):
+    for start in range(0, len(df), chunksize):
+        yield processing.coerce_columns(
+            df.iloc[start : start + chunksize], variable_types
+        )
+
+
+variable_types = {"sex": "categorical", "age": "int", "bmi": "float"}
+
+
+@pytest.mark.parametrize("memory_budget", [0, 10_000, 10**9])
+def test_accumulate_out_of_core_matches_in_memory(cohort, tmp_path, memory_budget):
+    expected = accumulators.accumulate(chunk(cohort, 64))
+
+    observed = outofcore.accumulate_out_of_core(
+        chunk(cohort, 64), memory_budget, spill_dir=str(tmp_path)
+    )
+
+    names = []
+    for name, acc in observed:
+        names.append(name)
+        testing.assert_series_equal(acc.summarize(), expected[name].summarize())
+        testing.assert_series_equal(acc.group(), expected[name].group())
+    assert names == list(expected)
+    assert list(tmp_path.iterdir()) == []  # The spilled accumulators are removed
+
+
+def test_accumulate_out_of_core_spills_over_budget(cohort, tmp_path):
+    observed = outofcore.accumulate_out_of_core(
+        chunk(cohort, 100), 0, spill_dir=str(tmp_path)
+    )
+
+    name, _ = next(observed)
+    (scratch_dir,) = tmp_path.iterdir()
+    # Each chunk is a partition, whose first column has been merged
+    assert len(list(scratch_dir.iterdir())) == 10
+    assert len(list(scratch_dir.glob("*/0.pickle"))) == 0
+    assert len(list(scratch_dir.glob("*/1.pickle"))) == 10
+
+    observed.close()
+    assert list(tmp_path.iterdir()) == []
@@ -1,4 +1,5 @@
 import datetime
+import warnings
 from pathlib import Path
 from unittest import mock
 
@@ -6,7 +7,6 @@ import numpy as np
 import pandas as pd
 import pytest
 from matplotlib.axes import Axes
-from matplotlib.figure import Figure
 from pandas import testing
 
 from cohortreport import processing
@@ -30,12 +30,13 @@ class TestLoadStudyCohort:
     def test_dta(self, mock):
         f_in = Path("input.dta")
         processing.load_study_cohort(f_in)
-        mock.assert_called_once_with(f_in, preserve_dtypes=False)
+        mock.assert_called_once_with(f_in, preserve_dtypes=False, compression=None)
 
     @mock.patch("cohortreport.processing.pd.read_stata")
     def test_dta_gz(self, mock):
-        with pytest.raises(NotImplementedError):
-            processing.load_study_cohort(Path("input.dta.gz"))
+        f_in = Path("input.dta.gz")
+        processing.load_study_cohort(f_in)
+        mock.assert_called_once_with(f_in, preserve_dtypes=False, compression="gzip")
 
     @mock.patch("cohortreport.processing.pd.read_feather")
     def test_feather(self, mock):
@@ -48,6 +49,288 @@ class TestLoadStudyCohort:
             processing.load_study_cohort(Path("input.xlsx"))  # No chance!
 
 
+@pytest.fixture
+def cohort_dataframe():
+    return pd.DataFrame(
+        {
+            "patient_id": [1, 2, 3],
+            "has_copd": [1, 0, 1],
+            "imd": [10, 2, 1],
+            "age": [56, 65, 70],
+            "bmi": [21.2, 25.4, 30.1],
+        }
+    )
+
+
+def write_cohort(df, f_out):
+    ext = "".join(f_out.suffixes)
+    if ext in [".feather", ".arrow"]:
+        # Feather (version 2) files are Arrow IPC files
+        df.to_feather(f_out)
+    elif ext == ".parquet":
+        df.to_parquet(f_out, index=False)
+    elif ext in [".dta", ".dta.gz"]:
+        df.to_stata(f_out, write_index=False)
+    else:
+        df.to_csv(f_out, index=False)
+
+
+cohort_variable_types = {
+    "has_copd": "binary",
+    "imd": "categorical",
+    "bmi": "float",
+}
+
+
+class TestLoadStudyCohortWithVariableTypes:
+    @pytest.mark.parametrize(
+        "ext", [".csv", ".csv.gz", ".feather", ".dta", ".dta.gz", ".parquet", ".arrow"]
+    )
+    def test_loads_only_given_columns_with_given_types(
+        self, tmp_path, ext, cohort_dataframe
+    ):
+        f_in = tmp_path / f"input{ext}"
+        write_cohort(cohort_dataframe, f_in)
+
+        obs = processing.load_study_cohort(f_in, cohort_variable_types)
+
+        exp = processing.coerce_columns(
+            cohort_dataframe[list(cohort_variable_types)], cohort_variable_types
+        )
+        testing.assert_frame_equal(obs, exp)
+
+    def test_variable_names_do_not_match_column_names(self, tmp_path, cohort_dataframe):
+        f_in = tmp_path / "input.csv"
+        cohort_dataframe.to_csv(f_in, index=False)
+
+        with pytest.raises(ValueError, match="Invalid variable name"):
+            processing.load_study_cohort(f_in, {"bmi_col": "float"})
+
+    def test_invalid_variable_type(self, tmp_path, cohort_dataframe):
+        f_in = tmp_path / "input.csv"
+        cohort_dataframe.to_csv(f_in, index=False)
+
+        with pytest.raises(ValueError, match="Invalid variable type"):
+            processing.load_study_cohort(f_in, {"bmi": "badgers"})
+
+
+@pytest.mark.parametrize("ext", [".parquet", ".arrow"])
+def test_load_study_cohort_with_dictionary_encoded_column(tmp_path, ext):
+    f_in = tmp_path / f"input{ext}"
+    df = pd.DataFrame({"sex": pd.Categorical(["F", "M", "F"]), "age": [1, 2, 3]})
+    write_cohort(df, f_in)
+
+    obs = processing.load_study_cohort(f_in, {"sex": "categorical"})
+
+    testing.assert_frame_equal(obs, df[["sex"]])
+
+
+@pytest.mark.parametrize("ext", [".dta", ".dta.gz", ".feather", ".parquet", ".arrow"])
+def test_load_study_cohort_with_invalid_variable_name(tmp_path, ext, cohort_dataframe):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe, f_in)
+
+    with pytest.raises(ValueError, match="Invalid variable name"):
+        processing.load_study_cohort(f_in, {"bmi_col": "float"})
+
+
+@pytest.mark.parametrize(
+    "ext", [".csv", ".csv.gz", ".feather", ".dta", ".dta.gz", ".parquet", ".arrow"]
+)
+def test_iter_study_cohort_with_variable_types(tmp_path, ext, cohort_dataframe):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe, f_in)
+
+    chunks = list(processing.iter_study_cohort(f_in, 2, cohort_variable_types))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert list(chunks[0].columns) == list(cohort_variable_types)
+    assert chunks[0]["bmi"].dtype == "float64"
+    exp = processing.load_study_cohort(f_in, cohort_variable_types)
+    for obs, start in zip(chunks, [0, 2]):
+        # Each chunk's categories are those of its own values
+        testing.assert_frame_equal(
+            obs.reset_index(drop=True),
+            exp.iloc[start : start + 2].reset_index(drop=True),
+            check_categorical=False,
+        )
+
+
+def test_load_study_cohort_infers_category_labels(tmp_path):
+    f_in = tmp_path / "input.csv"
+    pd.DataFrame(
+        {
+            "with_missing": [1, None, 2],
+            "zero_padded": ["01", "1", "2"],
+            "boolean": ["True", "false", None],
+            "mixed": ["1", "a", "2"],
+        }
+    ).to_csv(f_in, index=False)
+    variable_types = {
+        "with_missing": "categorical",
+        "zero_padded": "categorical",
+        "boolean": "categorical",
+        "mixed": "categorical",
+    }
+
+    obs = processing.load_study_cohort(f_in, variable_types)
+
+    # The labels are those of a column that was parsed, and then coerced
+    exp = processing.coerce_columns(pd.read_csv(f_in), variable_types)
+    testing.assert_frame_equal(obs, exp)
+    assert list(obs["with_missing"].cat.categories) == [1.0, 2.0]
+    assert list(obs["zero_padded"].cat.categories) == [1, 2]
+    assert list(obs["boolean"].cat.categories) == [False, True]
+
+
+@pytest.mark.parametrize("ext", [".dta", ".dta.gz"])
+def test_iter_study_cohort_from_dta_does_not_warn(tmp_path, ext, cohort_dataframe):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe, f_in)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.SettingWithCopyWarning)
+        list(processing.iter_study_cohort(f_in, 2, cohort_variable_types))
+
+
+@pytest.mark.parametrize("ext", [".dta", ".feather", ".parquet", ".arrow"])
+def test_iter_study_cohort_with_invalid_variable_name(tmp_path, ext, cohort_dataframe):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe, f_in)
+
+    with pytest.raises(ValueError, match="Invalid variable name"):
+        list(processing.iter_study_cohort(f_in, 2, {"bmi_col": "float"}))
+
+
+@pytest.mark.parametrize(
+    "ext", [".csv", ".csv.gz", ".feather", ".dta", ".dta.gz", ".parquet", ".arrow"]
+)
+def test_load_study_cohort_with_columns(tmp_path, ext, cohort_dataframe):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe, f_in)
+
+    obs = processing.load_study_cohort(f_in, cohort_variable_types, ["imd", "bmi"])
+
+    exp = processing.load_study_cohort(f_in, cohort_variable_types)
+    testing.assert_frame_equal(obs, exp[["imd", "bmi"]])
+
+
+@pytest.mark.parametrize("ext", [".dta", ".dta.gz"])
+def test_load_study_cohort_from_dta_in_chunks(
+    tmp_path, ext, cohort_dataframe, monkeypatch
+):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe, f_in)
+    exp = processing.load_study_cohort(f_in, cohort_variable_types)
+    monkeypatch.setattr(processing, "STATA_CHUNKSIZE", 2)
+
+    obs = processing.load_study_cohort(f_in, cohort_variable_types, ["bmi", "imd"])
+
+    testing.assert_frame_equal(obs, exp[["bmi", "imd"]])
+
+
+@pytest.mark.parametrize("ext", [".dta", ".dta.gz"])
+def test_estimate_column_sizes_reads_dta_header(
+    tmp_path, ext, cohort_dataframe, monkeypatch
+):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe, f_in)
+    exp = processing.estimate_column_sizes(f_in)
+    # The header is longer than this, so the start of the file is doubled until it
+    # holds the header
+    monkeypatch.setattr(processing, "STATA_HEADER_SIZE", 16)
+
+    assert processing.estimate_column_sizes(f_in) == exp
+    assert exp["bmi"] == len(cohort_dataframe) * 8
+
+
+@pytest.mark.parametrize(
+    "ext", [".csv", ".csv.gz", ".feather", ".dta", ".dta.gz", ".parquet", ".arrow"]
+)
+def test_estimate_column_sizes(tmp_path, ext, cohort_dataframe):
+    f_in = tmp_path / f"input{ext}"
+    write_cohort(cohort_dataframe.assign(sex=["F", "M", "F"]), f_in)
+
+    sizes = processing.estimate_column_sizes(f_in)
+    typed_sizes = processing.estimate_column_sizes(f_in, cohort_variable_types)
+
+    assert list(sizes) == ["patient_id", "has_copd", "imd", "age", "bmi", "sex"]
+    assert all(size > 0 for size in sizes.values())
+    if not ext.startswith(".csv"):
+        # Strings are larger than numbers, once loaded
+        assert sizes["sex"] > sizes["age"]
+    # The columns that load_study_cohort would load, in the same order
+    exp = processing.load_study_cohort(f_in, cohort_variable_types)
+    assert list(typed_sizes) == list(exp.columns)
+
+
+def test_group_columns():
+    sizes = {"a": 4, "b": 4, "c": 10, "d": 1, "e": 5}
+
+    assert processing.group_columns(sizes, 8) == [["a", "b"], ["c"], ["d", "e"]]
+    assert processing.group_columns(sizes, 0) == [["a"], ["b"], ["c"], ["d"], ["e"]]
+    assert processing.group_columns(sizes, 100) == [["a", "b", "c", "d", "e"]]
+    assert processing.group_columns({}, 8) == []
+
+
+def test_iter_study_cohort_with_offset(tmp_path, cohort_dataframe):
+    f_in = tmp_path / "input.csv"
+    cohort_dataframe.iloc[:1].to_csv(f_in, index=False)
+    offset = f_in.stat().st_size
+    cohort_dataframe.iloc[1:].to_csv(f_in, mode="a", header=False, index=False)
+
+    chunks = list(
+        processing.iter_study_cohort(f_in, 10, cohort_variable_types, offset=offset)
+    )
+
+    assert [len(chunk) for chunk in chunks] == [len(cohort_dataframe) - 1]
+    assert list(chunks[0].columns) == list(cohort_variable_types)
+
+
+def test_iter_study_cohort_with_offset_at_end(tmp_path, cohort_dataframe):
+    f_in = tmp_path / "input.csv"
+    cohort_dataframe.to_csv(f_in, index=False)
+
+    chunks = processing.iter_study_cohort(f_in, 10, offset=f_in.stat().st_size)
+
+    assert list(chunks) == []
+
+
+def test_convert_csv_to_arrow(tmp_path):
+    f_in = tmp_path / "input.csv"
+    pd.DataFrame(
+        {
+            "bmi": [30.5, None, 21.0, 19.5, 25.0],
+            # The categories of later chunks extend those of earlier chunks
+            "sex": ["M", "M", "F", None, "I"],
+            "died_on": ["2021-03-01", None, "2020-01-15", "2021-03-01", "2019-12-31"],
+            "age": [50, 1000, 20, 30, 40],
+            "has_copd": [0, 1, 1, 0, 1],
+        }
+    ).to_csv(f_in, index=False)
+    variable_types = {
+        "age": "int",
+        "sex": "categorical",
+        "died_on": "date",
+        "has_copd": "binary",
+        "bmi": "float",
+    }
+    f_out = tmp_path / "input.csv.arrow"
+
+    processing.convert_csv_to_arrow(f_in, f_out, variable_types, chunksize=2)
+
+    testing.assert_frame_equal(
+        processing.load_study_cohort(f_out, variable_types),
+        processing.load_study_cohort(f_in, variable_types),
+    )
+    for chunk, exp in zip(
+        processing.iter_study_cohort(f_out, 2, variable_types),
+        processing.iter_study_cohort(f_in, 2, variable_types),
+    ):
+        # Each chunk of a csv file is indexed from the start of the file
+        testing.assert_frame_equal(chunk, exp.reset_index(drop=True))
+
+
 @pytest.fixture
 def input_dataframe():
     return pd.DataFrame(
@@ -74,10 +357,11 @@ class TestTypeVariables:
             "test_float": "float",
         }
         typed_df = processing.coerce_columns(input_dataframe, variable_types)
-        assert typed_df["test_binary"].dtype == "int64"
+        assert typed_df["test_binary"].dtype == "int8"
         assert typed_df["test_categorical"].dtype == "category"
-        assert typed_df["test_int"].dtype == "int64"
-        assert typed_df["test_date"].dtype == "category"
+        # Integers are downcast to the smallest type that can hold them
+        assert typed_df["test_int"].dtype == "int8"
+        assert typed_df["test_date"].dtype == "datetime64[ns]"
         assert typed_df["test_float"].dtype == "float64"
 
     def test_variable_names_do_not_match_column_names(self, input_dataframe):
@@ -131,17 +415,73 @@ class TestTypeVariables:
             processing.coerce_columns(input_dataframe, variable_types)
 
 
+class TestChangeBinaryToCategorical:
+    @pytest.mark.parametrize(
+        "series",
+        [
+            pd.Series([0, 1, 1], dtype="int8", name="has_copd"),
+            pd.Series([1, 1], dtype="int64"),
+            pd.Series([0.0, 1.0]),
+            pd.Series([True, False]),
+            pd.Series([True, False], dtype="boolean"),
+            pd.Series([0, 1], dtype="Int64"),
+            pd.Series([], dtype="int64"),
+        ],
+    )
+    def test_binary(self, series):
+        obs = processing.change_binary_to_categorical(series)
+
+        testing.assert_series_equal(obs, series.astype("category"))
+        assert obs.cat.codes.dtype == "int8"
+
+    @pytest.mark.parametrize(
+        "series",
+        [
+            pd.Series([0, 2]),
+            pd.Series([-1, 0]),
+            pd.Series([0.5, 1.0]),
+            pd.Series([0, 1, np.nan]),
+            pd.Series([True, None, False], dtype="boolean"),
+            pd.Series(["0", "1"]),
+            pd.Series(pd.to_datetime(["2021-01-01"])),
+        ],
+    )
+    def test_not_binary(self, series):
+        obs = processing.change_binary_to_categorical(series)
+
+        assert obs is series
+
+    def test_does_not_mask_columns_that_cannot_be_binary(self):
+        series = mock.MagicMock(spec_set=pd.Series)
+        series.empty = False
+        series.dtype = np.dtype("datetime64[ns]")
+
+        processing.change_binary_to_categorical(series)
+
+        series.isin.assert_not_called()
+
+
 class TestIsDiscrete:
     def test_with_discrete(self):
         assert processing.is_discrete(pd.Series(dtype=bool))
         assert processing.is_discrete(pd.Series(dtype="boolean"))
         assert processing.is_discrete(pd.Series(dtype="category"))
-        assert processing.is_discrete(pd.Series(dtype="datetime64[ns]"))
-        assert processing.is_discrete(pd.Series(dtype="datetime64[ns, UTC]"))
 
     def test_with_not_discrete(self):
         assert not processing.is_discrete(pd.Series(dtype=float))
         assert not processing.is_discrete(pd.Series(dtype=int))
+        assert not processing.is_discrete(pd.Series(dtype="datetime64[ns]"))
+        assert not processing.is_discrete(pd.Series(dtype="datetime64[ns, UTC]"))
+
+
+class TestIsDate:
+    def test_with_date(self):
+        assert processing.is_date(pd.Series(dtype="datetime64[ns]"))
+        assert processing.is_date(pd.Series(dtype="datetime64[ns, UTC]"))
+
+    def test_with_not_date(self):
+        assert not processing.is_date(pd.Series(dtype="category"))
+        assert not processing.is_date(pd.Series(dtype=int))
 
 
 class TestIsContinuous:
@@ -164,6 +504,7 @@ def test_summarize():
     # file). Consequently, we mock the `Series` that we pass to `summarize` and
     # test that `Series.describe` was called without arguments.
     series = mock.MagicMock(spec_set=pd.Series)
+    series.dtype = np.dtype("float64")  # Dates aren't summarized by Series.describe
 
     processing.summarize(series)
 
@@ -200,6 +541,186 @@ class TestGroup:
         testing.assert_series_equal(obs, exp)
 
 
+class TestDates:
+    def test_coerce_columns_parses_each_date_once(self):
+        df = pd.DataFrame({"d": ["2021-08-31", "2021-09-01", "2021-08-31", None]})
+
+        obs = processing.coerce_columns(df, {"d": "date"})["d"]
+
+        exp = pd.Series(
+            pd.to_datetime(["2021-08-31", "2021-09-01", "2021-08-31", None])
+        )
+        testing.assert_series_equal(obs, exp, check_names=False)
+
+    def test_coerce_columns_with_invalid_dates(self):
+        df = pd.DataFrame({"d": ["2021-08-31", "9999-12-31", "2021-02-30", None]})
+
+        obs = processing.coerce_columns(df, {"d": "date"})["d"]
+
+        # Out of range and malformed dates are missing
+        exp = pd.Series(pd.to_datetime(["2021-08-31", None, None, None]))
+        testing.assert_series_equal(obs, exp, check_names=False)
+
+    def test_summarize_matches_describe(self):
+        series = pd.Series(
+            pd.to_datetime(["2021-01-01", "2021-03-05", None, "2022-06-30"]), name="d"
+        )
+
+        obs = processing.summarize(series)
+
+        testing.assert_series_equal(obs, series.describe(datetime_is_numeric=True))
+
+    def test_summarize_with_all_missing(self):
+        obs = processing.summarize(pd.Series([pd.NaT, pd.NaT], name="d"))
+
+        assert obs["count"] == 0
+        assert obs[1:].isna().all()
+
+    @pytest.mark.parametrize(
+        "last,freq",
+        [
+            ("2021-01-31", "D"),
+            ("2022-06-30", "W-SUN"),
+            ("2025-12-31", "M"),
+            ("2040-01-01", "A-DEC"),
+        ],
+    )
+    def test_group_picks_frequency_from_range(self, last, freq):
+        dates = pd.to_datetime(["2021-01-01", "2021-01-13", last, None])
+
+        obs = processing.group(pd.Series(dates, name="d"))
+
+        assert obs.index.freqstr == freq
+        assert obs.name == "d"
+        # Missing dates aren't counted, and the periods are contiguous
+        assert obs.sum() == 3
+        assert obs.index.is_monotonic_increasing
+        assert len(obs) == len(pd.period_range(obs.index[0], obs.index[-1]))
+        # Each date is counted in the period that contains it
+        exp = dates.dropna().to_period(obs.index.freq).value_counts()
+        testing.assert_series_equal(
+            obs[obs > 0], exp.sort_index(), check_names=False, check_freq=False
+        )
+
+    def test_group_weeks_start_on_mondays(self):
+        # 2021-01-03 was a Sunday, and 2021-01-04 was a Monday
+        dates = pd.to_datetime(["2021-01-03", "2021-01-04", "2021-06-01"])
+
+        obs = processing.group(pd.Series(dates))
+
+        assert obs.index[0].start_time == pd.Timestamp("2020-12-28")
+        assert list(obs.iloc[:2]) == [1, 1]
+
+    def test_group_with_weights(self):
+        values = pd.to_datetime(["2021-01-01", "2021-01-03"]).to_numpy().view("int64")
+
+        obs = processing.group_dates(values, np.array([2, 5]))
+
+        assert list(obs) == [2, 0, 5]
+
+    def test_group_with_all_missing(self):
+        obs = processing.group(pd.Series([pd.NaT], name="d"))
+
+        assert obs.empty
+
+    def test_plot(self):
+        mocked_ax = mock.MagicMock(spec_set=Axes)
+        dates = pd.to_datetime(["2021-01-01", "2021-03-05"])
+
+        processing.plot(processing.group(pd.Series(dates, name="d")), ax=mocked_ax)
+
+        mocked_ax.bar.assert_called_once()
+        mocked_ax.set_title.assert_called_once_with("d")
+
+
+@pytest.fixture
+def typed_dataframe():
+    rng = np.random.default_rng(seed=1)
+    n = 1_000
+    return pd.DataFrame(
+        {
+            "sex": pd.Categorical(rng.choice(["F", "M", None], size=n)),
+            "has_copd": pd.Categorical(rng.integers(0, 2, size=n)),
+            "no_category": pd.Categorical([None] * n, categories=["a"]),
+            "age": rng.integers(18, 100, size=n),
+            "bmi": np.where(rng.random(n) < 0.1, np.nan, rng.normal(28, 5, size=n)),
+            "has_condition": rng.integers(0, 2, size=n).astype(bool),
+        }
+    )
+
+
+def test_summarize_frame(typed_dataframe):
+    obs = processing.summarize_frame(typed_dataframe)
+
+    assert list(obs) == list(typed_dataframe.columns)
+    for name, series in typed_dataframe.iteritems():
+        testing.assert_series_equal(obs[name], processing.summarize(series))
+
+
+def test_group_frame(typed_dataframe):
+    columns = ["sex", "has_copd", "no_category", "age", "has_condition"]
+
+    obs = processing.group_frame(typed_dataframe, columns)
+
+    assert list(obs) == columns
+    for name in columns:
+        testing.assert_series_equal(obs[name], processing.group(typed_dataframe[name]))
+
+
+@pytest.mark.parametrize("bins", ["auto", 7])
+def test_group_frame_matches_numpy_histogram(bins):
+    rng = np.random.default_rng(seed=1)
+    df = pd.DataFrame(
+        {
+            "bmi": rng.normal(28, 5, size=1_000),
+            "age": rng.integers(18, 100, size=1_000).astype("int8"),
+            "constant": np.full(1_000, 3.0),
+        }
+    )
+    df.loc[::10, "bmi"] = np.nan
+
+    obs = processing.group_frame(df, bins=bins)
+
+    for name in df.columns:
+        hist, bin_edges = np.histogram(df[name].dropna(), bins=bins)
+        np.testing.assert_array_equal(obs[name].values, hist)
+        np.testing.assert_array_equal(obs[name].index.left, bin_edges[:-1])
+        np.testing.assert_array_equal(obs[name].index.right, bin_edges[1:])
+
+
+def test_group_frame_with_summaries(typed_dataframe):
+    summaries = processing.summarize_frame(typed_dataframe)
+
+    obs = processing.group_frame(typed_dataframe, ["age"], summaries, bins=3)
+
+    assert len(obs["age"]) == 3
+    assert obs["age"].index[0].left == summaries["age"]["min"]
+
+
+class TestGetBinEdges:
+    def test_auto(self):
+        values = np.random.default_rng(seed=1).normal(28, 5, size=1_000)
+        q25, q75 = np.percentile(values, [25, 75])
+
+        obs = processing.get_bin_edges(
+            len(values), values.min(), values.max(), q25, q75
+        )
+
+        np.testing.assert_array_equal(obs, np.histogram_bin_edges(values, "auto"))
+
+    def test_with_number_of_bins(self):
+        obs = processing.get_bin_edges(10, 0, 10, 2.5, 7.5, bins=5)
+        np.testing.assert_array_equal(obs, [0, 2, 4, 6, 8, 10])
+
+    def test_with_one_value(self):
+        obs = processing.get_bin_edges(10, 1, 1, 1, 1)
+        np.testing.assert_array_equal(obs, [0.5, 1.5])
+
+    def test_without_units(self):
+        obs = processing.get_bin_edges(0, np.nan, np.nan, np.nan, np.nan)
+        np.testing.assert_array_equal(obs, [0, 1])
+
+
 def test_group_discrete_with_float():
     with pytest.raises(TypeError):
         processing._group_discrete(pd.Series(dtype=float))
@@ -237,6 +758,136 @@ def test_redact():
     testing.assert_series_equal(obs, exp)
 
 
+class TestFoldCategories:
+    @pytest.fixture
+    def frequency_table(self):
+        # Sorted as Series.value_counts sorts it
+        return pd.Series(
+            [40, 40, 12, 7, 5, 3],
+            index=["b", "d", np.nan, "f", "a", "c"],
+            name="practice",
+        )
+
+    def test_folds_smaller_groups(self, frequency_table):
+        obs = processing.fold_categories(frequency_table, 3)
+
+        exp = pd.Series(
+            [40, 40, 7, 8, 12],
+            index=pd.Index(["b", "d", "f", "Other", np.nan], dtype=object),
+            name="practice",
+        )
+        testing.assert_series_equal(obs, exp)
+
+    @pytest.mark.parametrize(
+        "labels,exp_label",
+        [
+            (["Other", "b", "c"], "Other (2)"),
+            (["Other", "Other (2)", "c"], "Other (3)"),
+        ],
+    )
+    def test_with_group_called_other(self, labels, exp_label):
+        frequency_table = pd.Series([50, 40, 5], index=labels, name="practice")
+
+        obs = processing.fold_categories(frequency_table, 1)
+
+        assert list(obs.index) == ["Other", exp_label]
+        assert list(obs) == [50, 45]
+
+    def test_with_categorical_group_called_other(self):
+        series = pd.Series(["Other"] * 50 + ["a"] * 40 + ["b"] * 5, dtype="category")
+
+        obs = processing.group(series, max_categories=2)
+
+        assert obs.index.is_unique
+
+    def test_with_no_categories(self, frequency_table):
+        obs = processing.fold_categories(frequency_table, 0)
+
+        assert list(obs) == [95, 12]
+
+    @pytest.mark.parametrize("max_categories", [None, 5, 10])
+    def test_does_not_fold(self, frequency_table, max_categories):
+        obs = processing.fold_categories(frequency_table, max_categories)
+
+        assert obs is frequency_table
+
+    def test_group_frame_matches_group(self):
+        rng = np.random.default_rng(seed=1)
+        df = pd.DataFrame(
+            {
+                "practice": pd.Categorical(rng.integers(0, 1_000, size=10_000)),
+                "code": rng.integers(0, 1_000, size=10_000).astype(bool),
+            }
+        )
+
+        obs = processing.group_frame(df, max_categories=10)
+
+        assert len(obs["practice"]) == 11
+        assert obs["practice"].sum() == 10_000
+        for name in df.columns:
+            exp = processing.group(df[name], max_categories=10)
+            testing.assert_series_equal(obs[name], exp)
+
+
+class TestRedactTables:
+    @pytest.fixture
+    def frequency_tables(self):
+        return {
+            "age_band": pd.Series([10, 9, 172], index=["0", "16-29", "30-39"]),
+            "has_condition": pd.Series([1, 19], index=[False, True]),
+            "no_units": pd.Series([0], index=["a"]),
+            "empty": pd.Series([], dtype="int64"),
+        }
+
+    def test_matches_redact(self, frequency_tables):
+        obs, _ = processing.redact_tables(frequency_tables)
+
+        assert list(obs) == list(frequency_tables)
+        for name, frequency_table in frequency_tables.items():
+            # Redacted tables are always floats, even if no cells were redacted
+            testing.assert_series_equal(
+                obs[name], processing.redact(frequency_table), check_dtype=False
+            )
+
+    def test_tables_are_views(self, frequency_tables):
+        obs, _ = processing.redact_tables(frequency_tables)
+
+        assert obs["age_band"].to_numpy().base is obs["has_condition"].to_numpy().base
+
+    def test_with_thresholds(self, frequency_tables):
+        thresholds = {"has_condition": {"less_than": 1, "greater_than_pct": 0.99}}
+
+        obs, _ = processing.redact_tables(frequency_tables, thresholds)
+
+        testing.assert_series_equal(
+            obs["has_condition"], frequency_tables["has_condition"].astype(float)
+        )
+        testing.assert_series_equal(
+            obs["age_band"], processing.redact(frequency_tables["age_band"])
+        )
+
+    def test_records(self, frequency_tables):
+        thresholds = {"age_band": {"less_than": 5}}
+
+        _, obs = processing.redact_tables(frequency_tables, thresholds)
+
+        assert obs["age_band"] == {
+            "less_than": 5,
+            "greater_than_pct": 0.9,
+            "cells": [{"cell": "30-39", "reasons": ["greater_than_pct"]}],
+        }
+        assert obs["has_condition"]["cells"] == [
+            {"cell": "False", "reasons": ["less_than"]},
+            {"cell": "True", "reasons": ["greater_than_pct"]},
+        ]
+        assert obs["no_units"]["cells"] == [{"cell": "a", "reasons": ["less_than"]}]
+        assert obs["empty"]["cells"] == []
+
+    def test_with_invalid_thresholds(self, frequency_tables):
+        with pytest.raises(ValueError, match="age_band"):
+            processing.redact_tables(frequency_tables, {"age_band": {"more_than": 1}})
+
+
 def test_get_unit_mask():
     # a frequency table with a count of 1 for False and a count of 19 for True
     frequency_table = pd.Series(
@@ -317,12 +968,9 @@ class TestPlotHist:
 
         assert obs_fig.axes[0].get_title() == "bmi"
 
-    @mock.patch("cohortreport.processing.plt.subplots")
-    def test_is_histogram(self, mocked_subplots):
+    def test_is_histogram(self):
         # Test the function's implementation
-        mocked_fig = mock.MagicMock(spec_set=Figure)
         mocked_ax = mock.MagicMock(spec_set=Axes)
-        mocked_subplots.return_value = mocked_fig, mocked_ax
 
         processing.plot(
             pd.Series(
@@ -330,9 +978,11 @@ class TestPlotHist:
                 pd.IntervalIndex.from_tuples([(0.5, 1.5)]),
                 dtype=int,
                 name="bmi",
-            )
+            ),
+            ax=mocked_ax,
         )
 
+        mocked_ax.clear.assert_called_once()
         mocked_ax.hist.assert_called_once()
 
 
@@ -352,9 +1002,120 @@ class TestPlotBarh:
 
     def test_is_barh(self):
         # Test the function's implementation
-        mocked_series = mock.MagicMock(spec_set=pd.Series)
-        mocked_series.name = "has_condition"
+        mocked_ax = mock.MagicMock(spec_set=Axes)
+
+        processing.plot(
+            pd.Series([1], index=[False], dtype=int, name="has_condition"),
+            ax=mocked_ax,
+        )
+
+        mocked_ax.barh.assert_called_once()
+        mocked_ax.set_title.assert_called_once_with("has_condition")
+
+
+class TestEncode:
+    @pytest.fixture
+    def figure(self):
+        return processing.plot(pd.Series([1, 2], index=["a", "b"], name="sex"))
+
+    def test_png(self, figure):
+        assert processing.encode(figure).startswith(b"\x89PNG")
+
+    def test_svg_is_reproducible(self, figure):
+        obs = processing.encode(figure, "svg", salt="sex")
+
+        assert b"<svg" in obs
+        assert obs == processing.encode(figure, "svg", salt="sex")
+        # Text is kept as text
+        assert b">sex</text>" in obs
+
+    def test_svg_ids_depend_on_salt(self, figure):
+        obs_1 = processing.encode(figure, "svg", salt="a")
+        obs_2 = processing.encode(figure, "svg", salt="b")
+
+        assert obs_1 != obs_2
+
+    def test_with_invalid_format(self, figure):
+        with pytest.raises(ValueError):
+            processing.encode(figure, "gif")
+
+
+class TestChartRenderer:
+    def test_reuses_figure(self):
+        with processing.ChartRenderer() as renderer:
+            fig_1 = renderer.plot(pd.Series([1], index=[False], name="has_condition"))
+            fig_2 = renderer.plot(
+                pd.Series([1], pd.IntervalIndex.from_tuples([(0.5, 1.5)]), name="bmi")
+            )
+
+            assert fig_1 is fig_2
+            assert len(fig_2.axes) == 1
+            assert fig_2.axes[0].get_title() == "bmi"
+
+    def test_does_not_register_figures_with_pyplot(self):
+        import matplotlib.pyplot as plt
+
+        n_figures = len(plt.get_fignums())
+        with processing.ChartRenderer() as renderer:
+            renderer.plot(pd.Series([1], index=[False], name="has_condition"))
+        processing.plot(pd.Series([1], index=[False], name="has_condition"))
+
+        assert len(plt.get_fignums()) == n_figures
+
+    def test_chart_without_data_does_not_depend_on_previous_chart(self):
+        redacted = pd.Series(
+            [np.nan], pd.IntervalIndex.from_tuples([(0.5, 1.5)]), name="bmi"
+        )
+        with processing.ChartRenderer() as renderer:
+            exp = processing.encode(renderer.plot(redacted))
+        with processing.ChartRenderer() as renderer:
+            renderer.plot(pd.Series([50, 50], index=["F", "M"], name="sex"))
+            obs = processing.encode(renderer.plot(redacted))
+
+        assert obs == exp
+
+    def test_chart_does_not_depend_on_previous_date_chart(self):
+        bmi = pd.Series([5, 10], pd.IntervalIndex.from_breaks([0, 1, 2]), name="bmi")
+        dates = pd.Series(
+            [1, 2], pd.period_range("2020-01", periods=2, freq="M"), name="died_on"
+        )
+        with processing.ChartRenderer() as renderer:
+            exp = processing.encode(renderer.plot(bmi))
+        with processing.ChartRenderer() as renderer:
+            renderer.plot(dates)
+            obs = processing.encode(renderer.plot(bmi))
+
+        assert obs == exp
+
+    def test_closed(self):
+        renderer = processing.ChartRenderer()
+        renderer.close()
+
+        with pytest.raises(ValueError):
+            renderer.plot(pd.Series([1], index=[False], name="has_condition"))
+
+
+def test_stratify_frame():
+    df = pd.DataFrame(
+        {
+            "sex": pd.Categorical(
+                ["M", "F", None, "M", "F"], categories=["F", "M", "X"]
+            ),
+            "age": [1, 2, 3, 4, 5],
+        }
+    )
+
+    strata = list(processing.stratify_frame(df, "sex"))
+
+    # Strata without units are skipped, and missing units are the last stratum
+    assert [value for value, _ in strata[:2]] == ["F", "M"]
+    assert pd.isna(strata[2][0])
+    testing.assert_frame_equal(strata[0][1], df[df["sex"] == "F"])
+    testing.assert_frame_equal(strata[1][1], df[df["sex"] == "M"])
+    testing.assert_frame_equal(strata[2][1], df[df["sex"].isna()])
 
-        processing.plot(mocked_series)
 
-        mocked_series.plot.barh.assert_called_once_with(title="has_condition")
+def test_stratify_frame_by_continuous_column():
+    df = pd.DataFrame({"bmi": [21.2, 25.4]})
+    with pytest.raises(ValueError, match="isn't discrete"):
+        list(processing.stratify_frame(df, "bmi"))
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from cohortreport.profiling import Profiler
+
+
+class TestProfiler:
+    def test_stage(self):
+        profiler = Profiler()
+
+        with profiler.stage("load"):
+            pass
+        with profiler.stage("plot", "age"):
+            pass
+
+        assert [r["stage"] for r in profiler.records] == ["load", "plot"]
+        assert [r["variable"] for r in profiler.records] == [None, "age"]
+        record = profiler.records[0]
+        assert record["wall_seconds"] >= 0
+        assert record["cpu_seconds"] >= 0
+        assert record["peak_memory_bytes"] > 0
+
+    def test_stage_records_when_raising(self):
+        profiler = Profiler()
+
+        with pytest.raises(ValueError):
+            with profiler.stage("load"):
+                raise ValueError
+
+        assert len(profiler.records) == 1
+
+    def test_stage_when_disabled(self):
+        profiler = Profiler(enabled=False)
+
+        with profiler.stage("load"):
+            pass
+
+        assert profiler.records == []
+
+    def test_summarize_stages(self):
+        profiler = Profiler()
+        profiler.extend(
+            [
+                {
+                    "stage": "plot",
+                    "variable": "age",
+                    "wall_seconds": 1.0,
+                    "cpu_seconds": 0.5,
+                    "peak_memory_bytes": 100,
+                },
+                {
+                    "stage": "plot",
+                    "variable": "sex",
+                    "wall_seconds": 2.0,
+                    "cpu_seconds": 1.5,
+                    "peak_memory_bytes": 50,
+                },
+            ]
+        )
+
+        stages = profiler.summarize_stages()
+
+        assert stages == {
+            "plot": {
+                "count": 2,
+                "wall_seconds": 3.0,
+                "cpu_seconds": 2.0,
+                "peak_memory_bytes": 100,
+            }
+        }
+        assert set(profiler.summarize_variables()) == {"age", "sex"}
+
+    def test_write(self, tmp_path):
+        profiler = Profiler()
+        with profiler.stage("load"):
+            pass
+
+        profiler.write(tmp_path / "profile.json")
+
+        profile = json.loads((tmp_path / "profile.json").read_text())
+        assert profile["stages"]["load"]["count"] == 1
+        assert profile["variables"] == {}
+        assert "load" in profiler.format_table()
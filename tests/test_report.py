@@ -1,5 +1,8 @@
+import json
 import pathlib
+from unittest import mock
 
+import pandas as pd
 import pytest
 
 from cohortreport import errors, report
@@ -9,3 +12,536 @@ from cohortreport import errors, report
 def test_make_report_with_csv_file_but_without_variable_types(ext):
     with pytest.raises(errors.ConfigAndFileMismatchError):
         report.make_report(pathlib.Path(f"output/input{ext}"), "output", None)
+
+
+@pytest.fixture
+def path_to_input_csv(tmp_path):
+    cohort = pd.DataFrame(
+        {
+            "patient_id": range(100),
+            "sex": ["M", "F"] * 50,
+            "age": range(100),
+            "has_copd": [0, 1] * 50,
+        }
+    )
+    path = tmp_path / "input.csv"
+    cohort.to_csv(path, index=False)
+    return path
+
+
+variable_types = {"sex": "categorical", "age": "int", "has_copd": "binary"}
+
+
+def test_make_report_compiles_template_once(tmp_path, path_to_input_csv):
+    report._get_template.cache_clear()
+
+    report.make_report(path_to_input_csv, str(tmp_path / "first"), variable_types)
+    with mock.patch("cohortreport.report.Environment") as mocked_environment:
+        report.make_report(path_to_input_csv, str(tmp_path / "second"), variable_types)
+
+    mocked_environment.assert_not_called()
+    html = (tmp_path / "second" / "descriptives_input.html").read_text()
+    assert html == (tmp_path / "first" / "descriptives_input.html").read_text()
+    assert "<td>count</td>" in html
+
+
+def test_make_report_in_chunks(tmp_path, path_to_input_csv):
+    path = path_to_input_csv
+
+    report.make_report(path, str(tmp_path / "in_memory"), variable_types)
+    report.make_report(path, str(tmp_path / "in_chunks"), variable_types, chunksize=7)
+
+    html_in_memory = (tmp_path / "in_memory" / "descriptives_input.html").read_text()
+    html_in_chunks = (tmp_path / "in_chunks" / "descriptives_input.html").read_text()
+    assert html_in_chunks == html_in_memory
+
+
+@pytest.mark.parametrize("chunksize", [None, 7])
+def test_make_report_with_workers(tmp_path, chunksize):
+    # The date variable comes first, so that other variables' charts are drawn after a
+    # date chart in some processes, but not in others
+    cohort = pd.DataFrame(
+        {
+            "patient_id": range(100),
+            "died_on": pd.date_range("2020-01-01", periods=100, freq="W"),
+            "sex": ["M", "F"] * 50,
+            "age": range(100),
+            "has_copd": [0, 1] * 50,
+        }
+    )
+    path = tmp_path / "input.csv"
+    cohort.to_csv(path, index=False)
+    types = {"died_on": "date", **variable_types}
+
+    report.make_report(path, str(tmp_path / "serial"), types, chunksize)
+    report.make_report(path, str(tmp_path / "parallel"), types, chunksize, workers=2)
+
+    html_serial = (tmp_path / "serial" / "descriptives_input.html").read_text()
+    html_parallel = (tmp_path / "parallel" / "descriptives_input.html").read_text()
+    assert html_parallel == html_serial
+    for name in types:
+        chart_serial = (tmp_path / "serial" / f"{name}.png").read_bytes()
+        chart_parallel = (tmp_path / "parallel" / f"{name}.png").read_bytes()
+        assert chart_parallel == chart_serial, name
+
+
+@pytest.mark.parametrize("chunksize", [None, 7])
+def test_make_report_with_cache(tmp_path, path_to_input_csv, chunksize):
+    path = path_to_input_csv
+    cache_dir = str(tmp_path / "cache")
+    output_dir = tmp_path / "output"
+
+    report.make_report(
+        path, str(output_dir), variable_types, chunksize, cache_dir=cache_dir
+    )
+    html = (output_dir / "descriptives_input.html").read_text()
+    (output_dir / "age.png").unlink()
+
+    with mock.patch("cohortreport.report.ChartRenderer.plot") as mocked_plot:
+        report.make_report(
+            path, str(output_dir), variable_types, chunksize, cache_dir=cache_dir
+        )
+
+    # Every variable was unchanged, so every report was read from the cache
+    mocked_plot.assert_not_called()
+    assert (output_dir / "descriptives_input.html").read_text() == html
+    assert (output_dir / "age.png").exists()
+
+
+def test_make_report_bypassing_cache(tmp_path, path_to_input_csv):
+    path = path_to_input_csv
+    cache_dir = str(tmp_path / "cache")
+    output_dir = str(tmp_path / "output")
+
+    report.make_report(path, output_dir, variable_types, cache_dir=cache_dir)
+    with mock.patch("cohortreport.report.ChartRenderer.plot") as mocked_plot:
+        report.make_report(
+            path, output_dir, variable_types, cache_dir=cache_dir, use_cache=False
+        )
+
+    mocked_plot.assert_called()
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_make_report_with_profile(tmp_path, path_to_input_csv, capsys, workers):
+    output_dir = tmp_path / "output"
+
+    report.make_report(
+        path_to_input_csv,
+        str(output_dir),
+        variable_types,
+        workers=workers,
+        profile=True,
+        profile_to_stderr=True,
+    )
+
+    profile = json.loads((output_dir / "profile_input.json").read_text())
+    assert list(profile["stages"]) == [
+        "load",
+        "coerce",
+        "summarize",
+        "group",
+        "redact",
+        "plot",
+        "encode",
+        "save",
+        "flush",
+        "render",
+        "write",
+    ]
+    assert profile["stages"]["plot"]["count"] == 3
+    assert set(profile["variables"]) == {"sex", "age", "has_copd"}
+    assert set(profile["variables"]["age"]) == {"plot", "encode", "save"}
+    assert "plot" in capsys.readouterr().err
+
+
+def test_make_report_without_profile(tmp_path, path_to_input_csv):
+    output_dir = tmp_path / "output"
+
+    report.make_report(path_to_input_csv, str(output_dir), variable_types)
+
+    assert not (output_dir / "profile_input.json").exists()
+
+
+def test_make_report_out_of_core(tmp_path, path_to_input_csv):
+    path = path_to_input_csv
+
+    report.make_report(path, str(tmp_path / "in_memory"), variable_types)
+    report.make_report(
+        path,
+        str(tmp_path / "out_of_core"),
+        variable_types,
+        chunksize=7,
+        spill_threshold=0,
+        spill_dir=str(tmp_path / "spill"),
+    )
+
+    html_in_memory = (tmp_path / "in_memory" / "descriptives_input.html").read_text()
+    html_out_of_core = (
+        tmp_path / "out_of_core" / "descriptives_input.html"
+    ).read_text()
+    assert html_out_of_core == html_in_memory
+    assert list((tmp_path / "spill").iterdir()) == []
+
+
+@pytest.mark.parametrize("ext", [".csv", ".feather"])
+def test_make_report_in_column_groups(tmp_path, path_to_input_csv, ext):
+    path = tmp_path / f"input{ext}"
+    if ext == ".feather":
+        pd.read_csv(path_to_input_csv).to_feather(path)
+
+    report.make_report(path, str(tmp_path / "at_once"), variable_types)
+    with mock.patch(
+        "cohortreport.report.load_study_cohort", wraps=report.load_study_cohort
+    ) as load_study_cohort:
+        report.make_report(
+            path, str(tmp_path / "in_groups"), variable_types, column_budget=0
+        )
+
+    # Each variable is a group on its own
+    loaded = [call.args[2] for call in load_study_cohort.call_args_list]
+    assert loaded == [["sex"], ["age"], ["has_copd"]]
+    html_at_once = (tmp_path / "at_once" / "descriptives_input.html").read_text()
+    html_in_groups = (tmp_path / "in_groups" / "descriptives_input.html").read_text()
+    assert html_in_groups == html_at_once
+
+
+@pytest.mark.parametrize("ext", [".feather", ".parquet"])
+def test_make_report_with_missing_boolean(tmp_path, ext):
+    path = tmp_path / f"input{ext}"
+    cohort = pd.DataFrame(
+        {
+            "patient_id": range(4),
+            "has_copd": pd.Series([True, None, False, True], dtype="boolean"),
+        }
+    )
+    if ext == ".feather":
+        cohort.to_feather(path)
+    else:
+        cohort.to_parquet(path, index=False)
+
+    report.make_report(path, str(tmp_path / "output"), None)
+
+    assert (tmp_path / "output" / "descriptives_input.html").exists()
+
+
+@pytest.mark.parametrize("chunksize", [None, 7])
+def test_make_report_with_input_cache(tmp_path, path_to_input_csv, chunksize):
+    path = path_to_input_csv
+    input_cache_dir = str(tmp_path / "input_cache")
+
+    report.make_report(path, str(tmp_path / "parsed"), variable_types, chunksize)
+    report.make_report(
+        path,
+        str(tmp_path / "first"),
+        variable_types,
+        chunksize,
+        input_cache_dir=input_cache_dir,
+    )
+    with mock.patch("pandas.read_csv") as read_csv:
+        report.make_report(
+            path,
+            str(tmp_path / "second"),
+            variable_types,
+            chunksize,
+            input_cache_dir=input_cache_dir,
+        )
+
+    read_csv.assert_not_called()
+    html_parsed = (tmp_path / "parsed" / "descriptives_input.html").read_text()
+    for name in ["first", "second"]:
+        html = (tmp_path / name / "descriptives_input.html").read_text()
+        assert html == html_parsed
+
+
+def test_make_report_stratified(tmp_path, path_to_input_csv):
+    cohort = pd.read_csv(path_to_input_csv)
+    thresholds = {"age": {"less_than": 20}}
+
+    report.make_report(
+        path_to_input_csv,
+        str(tmp_path / "stratified"),
+        variable_types,
+        redaction_thresholds=thresholds,
+        stratify_by="sex",
+    )
+
+    redactions = json.loads(
+        (tmp_path / "stratified" / "redactions_input.json").read_text()
+    )
+    assert list(redactions) == [
+        "sex",
+        "age (sex = F)",
+        "age (sex = M)",
+        "has_copd (sex = F)",
+        "has_copd (sex = M)",
+    ]
+    html = (tmp_path / "stratified" / "descriptives_input.html").read_text()
+    assert "<code>age (sex = F)</code>" in html
+    # Each stratum is reported as its own input file would be
+    for i, sex in enumerate(["F", "M"]):
+        path = tmp_path / f"input_{sex}.csv"
+        cohort[cohort["sex"] == sex].to_csv(path, index=False)
+        report.make_report(
+            path, str(tmp_path / sex), variable_types, redaction_thresholds=thresholds
+        )
+        stratum_redactions = json.loads(
+            (tmp_path / sex / f"redactions_input_{sex}.json").read_text()
+        )
+        assert redactions[f"age (sex = {sex})"] == stratum_redactions["age"]
+        chart = (tmp_path / "stratified" / f"age.sex_{i}.png").read_bytes()
+        assert chart == (tmp_path / sex / "age.png").read_bytes()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"chunksize": 7}, {"approximate": True}, {"stratify_by": "bmi"}],
+)
+def test_make_report_stratified_with_invalid_options(
+    tmp_path, path_to_input_csv, kwargs
+):
+    with pytest.raises(ValueError):
+        report.make_report(
+            path_to_input_csv,
+            str(tmp_path),
+            variable_types,
+            **{"stratify_by": "sex", **kwargs},
+        )
+
+
+def test_make_report_approximately(tmp_path, path_to_input_csv, monkeypatch):
+    path = path_to_input_csv
+    monkeypatch.setattr(report, "STREAMING_CHUNKSIZE", 7)
+
+    report.make_report(path, str(tmp_path / "exact"), variable_types)
+    with mock.patch(
+        "cohortreport.report.iter_study_cohort", wraps=report.iter_study_cohort
+    ) as iter_study_cohort:
+        with mock.patch("cohortreport.report.load_study_cohort") as load_study_cohort:
+            report.make_report(
+                path, str(tmp_path / "approx"), variable_types, approximate=True
+            )
+
+    # The cohort is streamed, even though a chunksize wasn't given
+    load_study_cohort.assert_not_called()
+    assert iter_study_cohort.call_args.args[1] == 7
+    # Every variable has few distinct values, so the report is exact
+    html_exact = (tmp_path / "exact" / "descriptives_input.html").read_text()
+    html_approx = (tmp_path / "approx" / "descriptives_input.html").read_text()
+    assert html_approx == html_exact
+
+
+@pytest.mark.parametrize("chunksize", [None, 7])
+def test_make_report_with_number_of_bins(tmp_path, path_to_input_csv, chunksize):
+    path = path_to_input_csv
+
+    report.make_report(path, str(tmp_path / "auto"), variable_types, chunksize)
+    report.make_report(path, str(tmp_path / "fixed"), variable_types, chunksize, bins=3)
+
+    # Only the chart of the continuous variable differs
+    assert (tmp_path / "fixed" / "sex.png").read_bytes() == (
+        tmp_path / "auto" / "sex.png"
+    ).read_bytes()
+    assert (tmp_path / "fixed" / "age.png").read_bytes() != (
+        tmp_path / "auto" / "age.png"
+    ).read_bytes()
+
+
+@pytest.mark.parametrize("chunksize", [None, 7])
+def test_make_report_with_redaction_thresholds(tmp_path, path_to_input_csv, chunksize):
+    output_dir = tmp_path / "output"
+
+    report.make_report(
+        path_to_input_csv,
+        str(output_dir),
+        variable_types,
+        chunksize,
+        redaction_thresholds={"sex": {"less_than": 51}},
+    )
+
+    redactions = json.loads((output_dir / "redactions_input.json").read_text())
+    assert list(redactions) == ["sex", "age", "has_copd"]
+    assert redactions["sex"] == {
+        "less_than": 51,
+        "greater_than_pct": 0.9,
+        "cells": [
+            {"cell": "F", "reasons": ["less_than"]},
+            {"cell": "M", "reasons": ["less_than"]},
+        ],
+    }
+    assert redactions["has_copd"]["cells"] == []
+    html = (output_dir / "descriptives_input.html").read_text()
+    assert "less than 51 units" in html
+    assert "less than 10 units" in html
+    assert "greater than 90% of the total" in html
+
+
+def test_make_report_with_invalid_redaction_thresholds(tmp_path, path_to_input_csv):
+    with pytest.raises(ValueError):
+        report.make_report(
+            path_to_input_csv,
+            str(tmp_path),
+            variable_types,
+            redaction_thresholds={"sex": {"less_then": 5}},
+        )
+
+
+@pytest.mark.parametrize("chart_format", ["png", "svg"])
+def test_make_report_with_chart_format(tmp_path, path_to_input_csv, chart_format):
+    output_dir = tmp_path / "output"
+
+    report.make_report(
+        path_to_input_csv, str(output_dir), variable_types, chart_format=chart_format
+    )
+
+    html = (output_dir / "descriptives_input.html").read_text()
+    assert f'src="age.{chart_format}"' in html
+    assert (output_dir / f"age.{chart_format}").exists()
+
+
+@pytest.mark.parametrize(
+    "chart_format,chart_html", [("png", "data:image/png;base64,"), ("svg", "<svg")]
+)
+@pytest.mark.parametrize("workers", [None, 2])
+def test_make_report_self_contained(
+    tmp_path, path_to_input_csv, chart_format, chart_html, workers
+):
+    output_dir = tmp_path / "output"
+    cache_dir = str(tmp_path / "cache")
+
+    for _ in range(2):  # The second report is read from the cache
+        report.make_report(
+            path_to_input_csv,
+            str(output_dir),
+            variable_types,
+            workers=workers,
+            cache_dir=cache_dir,
+            chart_format=chart_format,
+            self_contained=True,
+        )
+
+        html = (output_dir / "descriptives_input.html").read_text()
+        assert html.count(chart_html) == 3
+        assert "<style>" in html
+        assert "bootstrapcdn" not in html
+        assert not list(output_dir.glob(f"*.{chart_format}"))
+
+
+def test_make_report_with_invalid_chart_format(tmp_path, path_to_input_csv):
+    with pytest.raises(ValueError):
+        report.make_report(
+            path_to_input_csv, str(tmp_path), variable_types, chart_format="gif"
+        )
+
+
+@pytest.mark.parametrize("chunksize", [None, 7])
+def test_make_report_with_max_categories(tmp_path, path_to_input_csv, chunksize):
+    output_dir = tmp_path / "output"
+
+    report.make_report(
+        path_to_input_csv,
+        str(output_dir),
+        {"age": "categorical"},
+        chunksize,
+        max_categories=3,
+    )
+
+    redactions = json.loads((output_dir / "redactions_input.json").read_text())
+    # Each of the three largest groups has one unit, so is redacted, as is the other
+    # group, which has most of the units
+    cells = redactions["age"]["cells"]
+    assert [cell["reasons"] for cell in cells] == [["less_than"]] * 3 + [
+        ["greater_than_pct"]
+    ]
+    assert cells[-1]["cell"] == "Other"
+
+
+def test_make_report_with_invalid_max_categories(tmp_path, path_to_input_csv):
+    with pytest.raises(ValueError):
+        report.make_report(
+            path_to_input_csv, str(tmp_path), variable_types, max_categories="few"
+        )
+
+
+@pytest.mark.parametrize("bins", ["many", 0, -1])
+def test_make_report_with_invalid_bins(tmp_path, path_to_input_csv, bins):
+    output_dir = tmp_path / "output"
+    with pytest.raises(ValueError):
+        report.make_report(
+            path_to_input_csv, str(output_dir), variable_types, bins=bins
+        )
+    # The configuration is checked before anything is written
+    assert not output_dir.exists()
+
+
+@pytest.mark.parametrize(
+    "option",
+    [{"chunksize": 0}, {"chunksize": "many"}, {"workers": 0}, {"workers": 1.5}],
+)
+def test_make_report_with_invalid_chunksize_or_workers(
+    tmp_path, path_to_input_csv, option
+):
+    output_dir = tmp_path / "output"
+    with pytest.raises(ValueError):
+        report.make_report(path_to_input_csv, str(output_dir), variable_types, **option)
+    # The configuration is checked before anything is written
+    assert not output_dir.exists()
+
+
+def append_rows(path, start, n):
+    cohort = pd.DataFrame(
+        {
+            "patient_id": range(start, start + n),
+            "sex": ["M", "F"] * (n // 2),
+            "age": range(start, start + n),
+            "has_copd": [0, 1] * (n // 2),
+        }
+    )
+    cohort.to_csv(path, mode="a", header=False, index=False)
+
+
+def test_make_report_incrementally(tmp_path, path_to_input_csv):
+    path = path_to_input_csv
+    state_dir = str(tmp_path / "state")
+
+    report.make_report(
+        path, str(tmp_path / "first"), variable_types, state_dir=state_dir
+    )
+    size = path.stat().st_size
+    append_rows(path, 100, 50)
+    with mock.patch(
+        "cohortreport.report.iter_study_cohort", wraps=report.iter_study_cohort
+    ) as mocked_iter:
+        report.make_report(
+            path, str(tmp_path / "second"), variable_types, state_dir=state_dir
+        )
+    report.make_report(path, str(tmp_path / "whole"), variable_types)
+
+    # Only the appended rows were read
+    assert mocked_iter.call_args.args[3] == size
+    html_second = (tmp_path / "second" / "descriptives_input.html").read_text()
+    html_whole = (tmp_path / "whole" / "descriptives_input.html").read_text()
+    assert html_second == html_whole
+
+
+def test_make_report_incrementally_with_changed_rows(tmp_path, path_to_input_csv):
+    path = path_to_input_csv
+    state_dir = str(tmp_path / "state")
+
+    report.make_report(
+        path, str(tmp_path / "first"), variable_types, state_dir=state_dir
+    )
+    path.write_text(path.read_text().replace("M,", "F,"))
+    with mock.patch(
+        "cohortreport.report.iter_study_cohort", wraps=report.iter_study_cohort
+    ) as mocked_iter:
+        report.make_report(
+            path, str(tmp_path / "second"), variable_types, state_dir=state_dir
+        )
+    report.make_report(path, str(tmp_path / "whole"), variable_types)
+
+    # Every row was read again
+    assert mocked_iter.call_args.args[3] == 0
+    html_second = (tmp_path / "second" / "descriptives_input.html").read_text()
+    html_whole = (tmp_path / "whole" / "descriptives_input.html").read_text()
+    assert html_second == html_whole
@@ -0,0 +1,91 @@
+import os
+
+import pandas as pd
+import pytest
+
+from cohortreport import runner
+from cohortreport.utils import load_config
+
+
+@pytest.fixture
+def paths_to_input_csvs(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"input_{i}.csv"
+        pd.DataFrame({"patient_id": range(20), "age": range(20)}).to_csv(
+            path, index=False
+        )
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize(
+    "file_workers,memory_budget", [(None, None), (2, None), (2, 0)]
+)
+def test_run_reports(tmp_path, paths_to_input_csvs, file_workers, memory_budget):
+    missing_path = tmp_path / "missing.csv"
+    paths = [paths_to_input_csvs[0], missing_path, *paths_to_input_csvs[1:]]
+    config = load_config(
+        {
+            "output_path": str(tmp_path / "output"),
+            "variable_types": {"age": "int"},
+            "file_workers": file_workers,
+            "memory_budget": memory_budget,
+        }
+    )
+
+    results = runner.run_reports(paths, config)
+
+    # An error in one input file doesn't stop the other input files
+    assert [result.path for result in results] == paths
+    assert [result.succeeded for result in results] == [True, False, True, True]
+    assert "FileNotFoundError" in results[1].error
+    for path in paths_to_input_csvs:
+        assert (tmp_path / "output" / f"descriptives_{path.stem}.html").exists()
+
+
+@pytest.mark.parametrize("file_workers", [0, "two"])
+def test_run_reports_with_invalid_file_workers(
+    tmp_path, paths_to_input_csvs, file_workers
+):
+    output_dir = tmp_path / "output"
+    config = load_config(
+        {
+            "output_path": str(output_dir),
+            "variable_types": {"age": "int"},
+            "file_workers": file_workers,
+        }
+    )
+
+    with pytest.raises(ValueError):
+        runner.run_reports(paths_to_input_csvs, config)
+    assert not output_dir.exists()
+
+
+_run_report = runner._run_report
+
+
+def _run_report_or_die(path, options):
+    if path.name == "input_1.csv":
+        os._exit(137)  # As if the worker process was OOM-killed
+    return _run_report(path, options)
+
+
+def test_run_reports_when_worker_dies(
+    tmp_path, monkeypatch, paths_to_input_csvs, capsys
+):
+    monkeypatch.setattr(runner, "_run_report", _run_report_or_die)
+    config = load_config(
+        {
+            "output_path": str(tmp_path / "output"),
+            "variable_types": {"age": "int"},
+            "file_workers": 2,
+        }
+    )
+
+    results = runner.run_reports(paths_to_input_csvs, config)
+
+    assert [result.path for result in results] == paths_to_input_csvs
+    assert [result.succeeded for result in results] == [True, False, True]
+    assert "BrokenProcessPool" in results[1].error
+    assert (tmp_path / "output" / "descriptives_input_2.html").exists()
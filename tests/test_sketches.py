@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from cohortreport import sketches
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(seed=1)
+    return rng.normal(28, 5, size=200_000)
+
+
+def rank_error(values, quantile, q):
+    return abs(np.searchsorted(np.sort(values), quantile) / len(values) - q)
+
+
+class TestQuantileSketch:
+    def test_quantiles(self, values):
+        sketch = sketches.QuantileSketch()
+        for chunk in np.array_split(values, 10):
+            sketch.update(chunk)
+
+        qs = [0.25, 0.5, 0.75]
+        for q, quantile in zip(qs, sketch.quantiles(qs)):
+            assert rank_error(values, quantile, q) < 0.017
+        assert sketch.n == len(values)
+
+    def test_memory_is_bounded(self, values):
+        sketch = sketches.QuantileSketch()
+        sketch.update(values)
+
+        assert sum(len(level) for level in sketch._levels) < 3 * sketch.k
+
+    def test_merge(self, values):
+        first, second = sketches.QuantileSketch(), sketches.QuantileSketch()
+        first.update(values[:100_000])
+        second.update(values[100_000:])
+
+        first.merge(second)
+
+        assert first.n == len(values)
+        assert rank_error(values, first.quantiles([0.5])[0], 0.5) < 0.017
+
+    def test_update_counts_is_exact(self):
+        sketch = sketches.QuantileSketch()
+        sketch.update_counts(np.array([1.0, 2.0, 3.0]), np.array([5, 1, 2]))
+
+        assert sketch.n == 8
+        assert list(sketch.quantiles([0.25, 0.75, 1.0])) == [1.0, 2.0, 3.0]
+
+    def test_histogram(self, values):
+        sketch = sketches.QuantileSketch()
+        sketch.update(values)
+        bin_edges = np.linspace(values.min(), values.max(), 21)
+
+        hist = sketch.histogram(bin_edges)
+
+        exp_hist, _ = np.histogram(values, bins=bin_edges)
+        assert hist.sum() == len(values)
+        assert np.abs(hist - exp_hist).max() < 0.034 * len(values)
+
+    def test_quantiles_when_empty(self):
+        assert np.isnan(sketches.QuantileSketch().quantiles([0.5])).all()
+
+
+class TestDistinctCountSketch:
+    @pytest.mark.parametrize("n_distinct", [10, 1_000, 100_000])
+    def test_count(self, n_distinct):
+        sketch = sketches.DistinctCountSketch()
+        sketch.update(np.arange(n_distinct, dtype=float))
+        sketch.update(np.arange(n_distinct, dtype=float))  # Duplicates aren't counted
+
+        assert sketch.count() == pytest.approx(n_distinct, rel=0.03)
+
+    def test_merge(self):
+        first, second = sketches.DistinctCountSketch(), sketches.DistinctCountSketch()
+        first.update(np.arange(0, 60_000, dtype=float))
+        second.update(np.arange(40_000, 100_000, dtype=float))
+
+        first.merge(second)
+
+        assert first.count() == pytest.approx(100_000, rel=0.03)
+
+
+class TestContinuousSketch:
+    def test_moments(self, values):
+        sketch = sketches.ContinuousSketch()
+        for chunk in np.array_split(values, 7):
+            sketch.update(chunk)
+
+        assert sketch.n == len(values)
+        assert sketch.mean == pytest.approx(values.mean())
+        assert sketch.std == pytest.approx(values.std(ddof=1))
+        assert sketch.min == values.min()
+        assert sketch.max == values.max()
+
+    def test_merge_and_update_counts(self):
+        first, second = sketches.ContinuousSketch(), sketches.ContinuousSketch()
+        first.update(np.array([1.0, 2.0]))
+        second.update_counts(np.array([3.0, 4.0]), np.array([2, 1]))
+
+        first.merge(second)
+
+        exp = np.array([1.0, 2.0, 3.0, 3.0, 4.0])
+        assert first.n == 5
+        assert first.mean == pytest.approx(exp.mean())
+        assert first.std == pytest.approx(exp.std(ddof=1))
+        assert (first.min, first.max) == (1.0, 4.0)
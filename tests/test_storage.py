@@ -0,0 +1,69 @@
+import os
+import pickle
+
+import pytest
+
+from cohortreport import storage
+
+
+def test_make_key():
+    assert storage.make_key("a", "bc") != storage.make_key("ab", "c")
+
+
+def test_make_path_key(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    key = storage.make_path_key(tmp_path / "a" / "input.csv")
+
+    assert key.startswith("input.csv.")
+    assert key != storage.make_path_key(tmp_path / "b" / "input.csv")
+
+
+def test_replace_atomically(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("old")
+
+    with storage.replace_atomically(path) as tmp_file:
+        tmp_file.write_text("new")
+        assert path.read_text() == "old"
+
+    assert path.read_text() == "new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_replace_atomically_with_error(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("old")
+
+    with pytest.raises(RuntimeError):
+        with storage.replace_atomically(path) as tmp_file:
+            tmp_file.write_text("partial")
+            raise RuntimeError
+
+    # The file is unchanged, and the temporary file is removed
+    assert path.read_text() == "old"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_dump_pickle(tmp_path):
+    path = tmp_path / "value.pickle"
+
+    storage.dump_pickle(path, {"a": 1})
+
+    assert pickle.loads(path.read_bytes()) == {"a": 1}
+
+
+def test_evict_least_recently_used(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"{i}.pickle"
+        path.write_bytes(b"x" * 100)
+        # The least recently used file is the first
+        os.utime(path, (i, i))
+        paths.append(path)
+
+    storage.evict_least_recently_used(
+        [*paths, tmp_path / "removed.pickle"], max_size=200, keep=paths[0]
+    )
+
+    assert [path.exists() for path in paths] == [True, False, False, True]
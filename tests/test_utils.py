@@ -1,4 +1,4 @@
-from cohortreport.utils import load_config
+from cohortreport.utils import estimate_memory, load_config
 
 
 class TestLoadConfig:
@@ -24,3 +24,10 @@ class TestLoadConfig:
 
         assert observed_config["output_path"] == "cohort_reports_outputs/"
         assert observed_config["variable_types"] is None
+
+
+def test_estimate_memory(tmp_path):
+    path = tmp_path / "input.csv.gz"
+    path.write_bytes(b"x" * 10)
+
+    assert estimate_memory(path) == 80
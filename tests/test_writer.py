@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from cohortreport import writer
+
+
+def test_write_and_flush(tmp_path):
+    with writer.BackgroundWriter(threads=2, max_pending=2) as w:
+        for i in range(10):
+            w.write(tmp_path / f"{i}.bin", bytes([i]) * i)
+        w.flush()
+
+    for i in range(10):
+        assert (tmp_path / f"{i}.bin").read_bytes() == bytes([i]) * i
+
+
+def test_write_blocks_when_too_many_are_pending(tmp_path, monkeypatch):
+    release = threading.Event()
+    write_bytes = writer._write_bytes
+
+    def blocked_write_bytes(path, data):
+        release.wait()
+        write_bytes(path, data)
+
+    monkeypatch.setattr(writer, "_write_bytes", blocked_write_bytes)
+    with writer.BackgroundWriter(threads=1, max_pending=2) as w:
+        w.write(tmp_path / "1.bin", b"1")
+        w.write(tmp_path / "2.bin", b"2")
+
+        third = threading.Thread(target=w.write, args=(tmp_path / "3.bin", b"3"))
+        third.start()
+        third.join(timeout=0.2)
+        assert third.is_alive()  # Blocked by back-pressure
+
+        release.set()
+        third.join(timeout=5)
+        assert not third.is_alive()
+        w.flush()
+
+    assert (tmp_path / "3.bin").read_bytes() == b"3"
+
+
+def test_flush_raises_write_errors(tmp_path):
+    with writer.BackgroundWriter() as w:
+        w.write(tmp_path / "missing" / "1.bin", b"1")
+        with pytest.raises(FileNotFoundError):
+            w.flush()
+
+
+def test_flush_checks_sizes(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        writer, "_write_bytes", lambda path, data: path.write_bytes(data[:-1])
+    )
+    with writer.BackgroundWriter() as w:
+        w.write(tmp_path / "1.bin", b"12")
+        with pytest.raises(OSError, match="1 bytes, not 2"):
+            w.flush()